@@ -12,6 +12,9 @@ will print warnings & info to stderr, and the resultig compiled log to
 stdout. The output file can also be specified:
 
 	python -m tlogger.compile /path/to/browsinglog.txt -o log.out
+
+Log files compressed with gzip, bzip2 or xz (ending in .gz, .bz2 or .xz) can
+be read directly, without decompressing them to disk first.
 	
 Try 'python -m tlogger.compile --help' for more info.
 
@@ -35,9 +38,18 @@ Try 'python -m tlogger.compile --help' for more info.
 __author__ = "Patrick Dubroy (http://dubroy.com)"
 __license__ = "GNU GPL v2"
 
-__all__ = ["LogIterator", "compile"]
+__all__ = ["LogIterator", "PipelinedLogIterator", "compile", "merge_events"]
 
+import bz2
+import collections
+import gzip
+import heapq
+import mmap
+import os
+import Queue
 import re
+import subprocess
+import threading
 
 # Get a JSON library. Prefer cjson if it's installed (much faster),
 # but fall back to json (if Python >= 2.6) or simplejson
@@ -49,8 +61,246 @@ except ImportError:
 	except ImportError:
 		import simplejson as json
 
+# Python 2 has no lzma module in the standard library. Use the backport if
+# it's installed; otherwise, .xz files are decompressed by an external 'xz'.
+try:
+	import lzma
+except ImportError:
+	try:
+		from backports import lzma
+	except ImportError:
+		lzma = None
+
+import compact
 import compile
 
+# The size of the chunks read by the decompression thread, and the maximum
+# number of decompressed chunks that will be buffered ahead of the parser
+_DECOMPRESS_CHUNK_SIZE = 256 * 1024
+_DECOMPRESS_QUEUE_SIZE = 16
+
+class _DecompressingReader(object):
+	"""A read-only, line-iterable file object for compressed log files.
+	
+	Decompression happens on a background thread, which splits the data into
+	lines and hands them to the consumer through a bounded queue. This lets
+	decompression overlap with parsing (zlib and bz2 release the GIL, and xz
+	may be running in a separate process).
+	
+	"""
+	def __init__(self, f, proc=None):
+		"""f - the decompressed stream to read from
+		proc - optional subprocess which is producing the stream"""
+		self._f = f
+		self._proc = proc
+		self._queue = Queue.Queue(_DECOMPRESS_QUEUE_SIZE)
+		self._lines = []
+		self._index = 0
+		self._closed = False
+		self._thread = threading.Thread(target=self._run)
+		self._thread.daemon = True
+		self._thread.start()
+
+	def _run(self):
+		partial = ""
+		try:
+			while not self._closed:
+				chunk = self._f.read(_DECOMPRESS_CHUNK_SIZE)
+				if not chunk:
+					break
+				lines = (partial + chunk).split("\n")
+				partial = lines.pop()
+				if len(lines) > 0:
+					self._queue.put([line + "\n" for line in lines])
+			if partial and not self._closed:
+				self._queue.put([partial])
+			# After close(), the process is killed, so its status doesn't matter
+			if self._closed:
+				return
+			if self._proc is not None and self._proc.wait() != 0:
+				raise IOError("xz exited with status %d" % self._proc.returncode)
+		except Exception, e:
+			self._queue.put(e)
+			return
+		self._queue.put(None) # Signals the end of the stream
+
+	def __iter__(self):
+		return self
+
+	def next(self):
+		while self._index >= len(self._lines):
+			item = self._queue.get()
+			if item is None:
+				self._queue.put(None) # Keep returning StopIteration
+				raise StopIteration
+			if isinstance(item, Exception):
+				raise item
+			self._lines = item
+			self._index = 0
+		line = self._lines[self._index]
+		self._index += 1
+		return line
+
+	def readline(self):
+		try:
+			return self.next()
+		except StopIteration:
+			return ""
+
+	def peek(self):
+		"""Return the next line without consuming it, or "" at the end."""
+		line = self.readline()
+		if line:
+			self._index -= 1 # It's still in self._lines
+		return line
+
+	def close(self):
+		if self._closed:
+			return
+		self._closed = True
+		# Kill the process first: it may be blocked writing to a full pipe,
+		# and the thread may be blocked reading from it
+		if self._proc is not None and self._proc.poll() is None:
+			self._proc.kill()
+		# Unblock the thread if it's waiting on a full queue
+		while self._thread.is_alive():
+			try:
+				self._queue.get(True, 0.1)
+			except Queue.Empty:
+				pass
+		self._f.close()
+		if self._proc is not None:
+			self._proc.wait()
+
+def _open_log(filename):
+	"""Open a log file for reading. Files with a .gz, .bz2 or .xz extension are
+	transparently decompressed on a background thread. Files in the compact
+	format (see tlogger.compact), compressed or not, are read with a
+	CompactLogReader."""
+	reader = None
+	if filename.endswith(".gz"):
+		reader = _DecompressingReader(gzip.GzipFile(filename, "rb"))
+	elif filename.endswith(".bz2"):
+		reader = _DecompressingReader(bz2.BZ2File(filename, "rb"))
+	elif filename.endswith(".xz"):
+		if lzma is not None:
+			reader = _DecompressingReader(lzma.LZMAFile(filename, "rb"))
+		else:
+			proc = subprocess.Popen(["xz", "-dc", filename], stdout=subprocess.PIPE)
+			reader = _DecompressingReader(proc.stdout, proc)
+	if reader is not None:
+		try:
+			if reader.peek().startswith(compact.MAGIC):
+				return compact.CompactLogReader(reader)
+		except:
+			reader.close()
+			raise
+		return reader
+	f = open(filename, "r")
+	if f.read(len(compact.MAGIC)) == compact.MAGIC:
+		f.seek(0)
+		return compact.CompactLogReader(f)
+	f.seek(0)
+	return f
+
+def _only_events_filter(only_events):
+	"""Return a (set of event types, line filter) pair for LogIterator's
+	only_events option, or None. The filter is a quick check of whether a
+	line might contain one of the events; it can have false positives, but
+	not false negatives."""
+	if only_events is None:
+		return None
+	names = set(only_events)
+	pattern = re.compile("|".join(['"%s"' % re.escape(name) for name in names]))
+	return (names, pattern.search)
+
+class _ParseError(Exception):
+	"""Raised by _parse_line. The caller is expected to add the line number."""
+	pass
+
+def _parse_line(line):
+	"""Parse a single non-blank line from a log file, and return the event."""
+
+	# Ensure every non-empty lines is of the form: 
+	# "<timestamp> { <json_text> }" or just "{ <json_text> }"
+	match = re.match(r"(\d+[ \t]+)?(\{.*\})", line)
+	if match is None:
+		raise _ParseError("Unexpected format: '%s'" % line[:-1])
+	json_text = match.groups()[-1]
+	try:
+		if json.__name__ == "cjson":
+			event_obj = json.decode(json_text)
+		else:
+			event_obj = json.loads(json_text)
+	except Exception, e:
+		raise _ParseError("Exception parsing JSON: " + str(e))
+	if len(match.groups()) >= 2:
+		event_obj["time"] = int(match.group(1).strip())
+	return event_obj
+
+# Timestamps increase with the position in the log, except for some small
+# jitter. When searching for a time, back off by this much to be safe.
+_TIME_JITTER_MILLIS = 10 * 1000
+
+_TIMESTAMP_RE = re.compile(r"(\d+)[ \t]")
+
+def _line_start(mm, pos):
+	"""Return the offset of the first line that starts at or after pos."""
+	if pos == 0:
+		return 0
+	i = mm.find("\n", pos - 1)
+	return mm.size() if i < 0 else i + 1
+
+def _first_timestamp(mm, pos):
+	"""Return the timestamp of the first line at or after offset pos that
+	has one, or None if there are no more timestamps."""
+	size = mm.size()
+	while pos < size:
+		end = mm.find("\n", pos)
+		if end < 0:
+			end = size
+		match = _TIMESTAMP_RE.match(mm[pos:min(end, pos + 64)])
+		if match:
+			return int(match.group(1))
+		pos = end + 1
+	return None
+
+def _find_time_offset(f, target):
+	"""Return the offset of the first line in the log file f whose timestamp
+	is at least target. Does a binary search over the memory-mapped file,
+	realigning each probe to the start of a line."""
+	size = os.fstat(f.fileno()).st_size
+	if size == 0:
+		return 0
+	mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	try:
+		lo, hi = 0, size
+		while lo < hi:
+			mid = (lo + hi) // 2
+			time = _first_timestamp(mm, _line_start(mm, mid))
+			if time is None or time >= target:
+				hi = mid
+			else:
+				lo = mid + 1
+		return _line_start(mm, lo)
+	finally:
+		mm.close()
+
+def _count_lines(filename, offset):
+	"""Return the number of lines in the first 'offset' bytes of the file."""
+	f = open(filename, "rb")
+	try:
+		count = 0
+		while offset > 0:
+			chunk = f.read(min(offset, 16 * 1024 * 1024))
+			if not chunk:
+				break
+			count += chunk.count("\n")
+			offset -= len(chunk)
+		return count
+	finally:
+		f.close()
+
 class LogIterator(object):
 	"""Iterator for tlogger log files. 
 	
@@ -59,6 +309,20 @@ class LogIterator(object):
 	representation in the log, plus an extra key named "time" which
 	contains the timestamp that appears at the beginning of each log line.
 	
+	Log files compressed with gzip, bzip2 or xz are also supported, based on
+	the file extension (.gz, .bz2 or .xz), as are files in the compact format
+	written by tlogger.compact.
+	
+	If start_time or end_time are given, only the events in that time range
+	are returned. For uncompressed files, the start of the range is found by
+	a binary search, so only the events near the range are actually parsed.
+	
+	If filename is a list of filenames (e.g. the logs from several profiles,
+	or the fragments of a rotated log), the events from all the files are
+	merged by time, reading only one event ahead in each file. In that case,
+	current_line_number is the line number within current_filename. If 
+	tag_source is True, each event has a "source" key giving its filename.
+	
 	NOTE: If you do not finish iterating with this object, it will leave 
 	the file open. In that case, you should call the close() method.
 	
@@ -68,14 +332,49 @@ class LogIterator(object):
 			print "At %s, %s occurred" % (event["time"], event["event"]) 
 	
 	"""
-	def __init__(self, filename, ignored_events=[]):
-		"""ignore_events - optional list of event types that will be ignored"""
+	def __init__(self, filename, ignored_events=[], start_time=None, end_time=None,
+		tag_source=False, only_events=None):
+		"""filename - the log file, or a list of log files to merge
+		ignore_events - optional list of event types that will be ignored
+		start_time - optional time (in millis) of the first event to return
+		end_time - optional time (in millis) of the last event to return
+		tag_source - add a "source" key, with the filename, to each event
+		only_events - optional list of the only event types to return. Lines
+			that don't mention any of them aren't parsed at all, which is
+			much faster when they're a small part of the log."""
 		self._ignored_events = ignored_events
+		self._only_events = _only_events_filter(only_events)
 		self._filename = filename
-		self._f = open(filename, "r")
-		self._f_iter = iter(self._f)
+		self._start_time = start_time
+		self._end_time = end_time
+		self._tag_source = tag_source
+
+		# _line_count is relative to the line we started reading from. If we
+		# seek, the number of lines before that is only counted when needed.
 		self._line_count = 0
-		self._lookahead = []
+		self._start_offset = 0
+		self._lines_before_start = 0
+		self._lookahead = collections.deque()
+		self._known_offset = None # A (line number, byte offset) pair; see line_offset
+
+		if not isinstance(filename, basestring):
+			# Read each file with its own iterator, and merge them with a heap
+			self._sources = [LogIterator(name, ignored_events, start_time, end_time,
+				only_events=only_events) for name in filename]
+			self._heap = None
+			self._current_source = None
+			return
+		self._sources = None
+
+		self._f = _open_log(filename)
+		if start_time is not None and isinstance(self._f, file):
+			offset = _find_time_offset(self._f, start_time - _TIME_JITTER_MILLIS)
+			if offset > 0:
+				self._f.seek(offset)
+				self._start_offset = offset
+				self._lines_before_start = None
+
+		self._f_iter = iter(self._f)
 		
 	def __iter__(self):
 		return self
@@ -83,19 +382,195 @@ class LogIterator(object):
 	def close(self):
 		"""It's only necessary to call this method if you don't finish iterating 
 		with this object."""
+		if self._sources is not None:
+			for source in self._sources:
+				source.close()
+			self._heap = []
+			return
 		self._f.close()
+		self._f_iter = iter(()) # Any further calls to next() will stop
 		
 	@property
 	def current_line_number(self):
 		"""The line number of the last event returned from the next() method."""
-		return self._line_count
+		if self._lines_before_start is None:
+			self._lines_before_start = _count_lines(self._filename, self._start_offset)
+		return self._lines_before_start + self._line_count
+
+	def line_offset(self, line_number):
+		"""Return the byte offset of the start of the given line (counting from
+		1), or None if the log isn't an uncompressed text file. The offset is
+		found by counting newlines from the last offset that was looked up,
+		so it's fastest to look up lines in increasing order."""
+		if self._sources is not None or not isinstance(getattr(self, "_f", None), file):
+			return None
+		if self._known_offset is None or self._known_offset[0] > line_number:
+			self._known_offset = (1, 0)
+		known_line, offset = self._known_offset
+		f = open(self._filename, "rb")
+		try:
+			f.seek(offset)
+			while known_line < line_number:
+				chunk = f.read(1024 * 1024)
+				if not chunk:
+					break
+				pos = 0
+				while known_line < line_number:
+					i = chunk.find("\n", pos)
+					if i < 0:
+						break
+					known_line += 1
+					pos = i + 1
+				offset += pos if known_line == line_number else len(chunk)
+		finally:
+			f.close()
+		self._known_offset = (known_line, offset)
+		return offset
+
+	def skip_to_event(self, name):
+		"""Skip forward to the next event with the given name, so that next()
+		will return it. Return its line number, or None if there isn't one
+		(in which case the iterator is finished). For uncompressed text
+		files, the lines in between are found with a search of the raw bytes,
+		without parsing them."""
+		if (self.line_offset(1) is None
+		or name in [event["event"] for event in self._lookahead]):
+			try:
+				while True:
+					try:
+						if self.peek()["event"] == name:
+							break
+						self.next()
+					except _ParseError:
+						pass # Lines that can't be parsed are skipped too
+			except StopIteration:
+				return None
+			return self.current_line_number
+
+		offset = self.line_offset(self.current_line_number + 1)
+		size = os.fstat(self._f.fileno()).st_size
+		match = None
+		if offset < size:
+			mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+			try:
+				pattern = re.compile(r'"event"\s*:\s*"%s"' % re.escape(name))
+				match = pattern.search(mm, offset)
+				if match is not None:
+					new_offset = mm.rfind("\n", 0, match.start()) + 1
+			finally:
+				mm.close()
+		if match is None:
+			self.close()
+			self._lookahead.clear()
+			return None
+
+		# Count the lines that were skipped, then carry on from the new offset
+		known_line, known_offset = self._known_offset
+		f = open(self._filename, "rb")
+		try:
+			f.seek(known_offset)
+			remaining = new_offset - known_offset
+			while remaining > 0:
+				chunk = f.read(min(remaining, 16 * 1024 * 1024))
+				if not chunk:
+					break
+				known_line += chunk.count("\n")
+				remaining -= len(chunk)
+		finally:
+			f.close()
+		self._known_offset = (known_line, new_offset)
+		self._f.seek(new_offset)
+		self._f_iter = iter(self._f)
+		self._lookahead.clear()
+		self._line_count = known_line - 1 - self._lines_before_start
+		return known_line
+
+	@property
+	def current_filename(self):
+		"""The file that the last event returned from next() came from."""
+		if self._sources is not None:
+			if self._current_source is None:
+				return None
+			return self._sources[self._current_source]._filename
+		return self._filename
 
 	def next(self):
 		if len(self._lookahead) > 0:
-			return self._lookahead.pop(0)
+			return self._lookahead.popleft()
 		return self._next_impl()
+
+	def next_batch(self, n):
+		"""Consume and return a list of up to n events. The list will only be
+		shorter than n at the end of the log, and empty if no events remain.
+		Afterwards, current_line_number refers to the last event in the list."""
+		batch = []
+		lookahead = self._lookahead
+		while len(lookahead) > 0 and len(batch) < n:
+			batch.append(lookahead.popleft())
+		next_impl = self._next_impl
+		try:
+			while len(batch) < n:
+				batch.append(next_impl())
+		except StopIteration:
+			pass
+		return batch
+
+	def batches(self, n):
+		"""Iterate over the remaining events in lists of (at most) n events.
+		
+		Example:
 		
+			for events in LogIterator("/path/to/browsinglog.txt").batches(1000):
+				counts.update(event["event"] for event in events)
+		
+		"""
+		while True:
+			batch = self.next_batch(n)
+			if len(batch) > 0:
+				yield batch
+			if len(batch) < n:
+				return
+		
+	def _next_from_source(self, index):
+		"""Return the heap entry for the next event from the given source, or
+		None if there are no more events in it."""
+		source = self._sources[index]
+		try:
+			event = source.next()
+		except StopIteration:
+			return None
+		except _ParseError, e:
+			# The source is left open, and the heap as it was, so the caller
+			# can carry on with the next line, as for a single file
+			raise _ParseError("%s: %s" % (source._filename, e))
+		except Exception, e:
+			# The other sources can still be read
+			source.close()
+			raise Exception("%s: %s" % (source._filename, e))
+		return (event.get("time"), index, source.current_line_number, event)
+
+	def _next_merged(self):
+		heap = self._heap
+		if heap is None:
+			heap = [self._next_from_source(i) for i in range(len(self._sources))]
+			heap = self._heap = [entry for entry in heap if entry is not None]
+			heapq.heapify(heap)
+		if len(heap) == 0:
+			raise StopIteration
+		time, index, self._line_count, event = heap[0]
+		self._current_source = index
+		entry = self._next_from_source(index)
+		if entry is not None:
+			heapq.heapreplace(heap, entry)
+		elif len(heap) > 0: # Might have been emptied by close()
+			heapq.heappop(heap)
+		if self._tag_source:
+			event["source"] = self._sources[index]._filename
+		return event
+
 	def _next_impl(self):
+		if self._sources is not None:
+			return self._next_merged()
 		while True:
 			next_line = ""
 			try:
@@ -103,30 +578,45 @@ class LogIterator(object):
 				while len(next_line.strip()) == 0:
 					next_line = self._f_iter.next()
 					self._line_count += 1
+
+					# Compact logs return events that have already been parsed
+					if type(next_line) is dict:
+						break
 			except StopIteration:
 				# After last line of the file, close the file, and end the iterator
 				self.close()
 				raise StopIteration
 
-			# Ensure every non-empty lines is of the form: 
-			# "<timestamp> { <json_text> }" or just "{ <json_text> }"
-			match = re.match(r"(\d+[ \t]+)?(\{.*\})", next_line)
-			if match is None:
-				description = ("Line %s - Unexpected format: '%s'" % 
-					(self._line_count, next_line[:-1]))
-				raise Exception(description)
-			json_text = match.groups()[-1]
-			try:
-				if json.__name__ == "cjson":
-					event_obj = json.decode(json_text)
-				else:
-					event_obj = json.loads(json_text)
-			except Exception, e:
-				raise Exception(
-					("Line %s - Exception parsing JSON: " + str(e)) % self._line_count)
-			if len(match.groups()) >= 2:
-				event_obj["time"] = int(match.group(1).strip())
+			only_events = self._only_events
+			if type(next_line) is dict:
+				event_obj = next_line
+			else:
+				if only_events is not None and not only_events[1](next_line):
+					continue
+				try:
+					event_obj = _parse_line(next_line)
+				except _ParseError, e:
+					# The file is left open, so the caller can carry on from the
+					# next line if it wants to
+					raise _ParseError("Line %s - %s" % (self.current_line_number, e))
+
+			if self._tag_source:
+				event_obj["source"] = self._filename
+
+			if self._start_time is not None or self._end_time is not None:
+				time = event_obj.get("time")
+				if time is not None:
+					if self._start_time is not None and time < self._start_time:
+						continue
+					if self._end_time is not None and time > self._end_time:
+						# Allow for jitter before deciding that the range is over
+						if time > self._end_time + _TIME_JITTER_MILLIS:
+							self.close()
+							raise StopIteration
+						continue
 
+			if only_events is not None and event_obj["event"] not in only_events[0]:
+				continue
 			if event_obj["event"] not in self._ignored_events:
 				return event_obj
 
@@ -138,3 +628,177 @@ class LogIterator(object):
 			self._lookahead.append(self._next_impl())
 		return self._lookahead[index]
 
+
+def _read_batches(filename, ignored_events, start_time, end_time, tag_source,
+	only_events, batch_size, queue, stop):
+	"""The producer for PipelinedLogIterator. Reads and decodes the log file,
+	putting lists of (line_number, event) pairs on the queue. A line that
+	can't be parsed is passed on as a (line_number, exception) pair, and the
+	lines after it are still read. The last item is either the total number
+	of lines read, or a (line_number, exception) pair for any other error."""
+
+	def put(item):
+		# Don't block forever if the consumer has gone away
+		while not stop.is_set():
+			try:
+				queue.put(item, True, 0.1)
+				return True
+			except Queue.Full:
+				pass
+		return False
+
+	it = None
+	batch = []
+	try:
+		try:
+			it = LogIterator(filename, ignored_events, start_time, end_time, tag_source,
+				only_events)
+			while True:
+				try:
+					event = it.next()
+				except StopIteration:
+					break
+				except _ParseError, e:
+					if len(batch) > 0 and not put(batch):
+						return
+					batch = []
+					if not put((it.current_line_number, e)):
+						return
+					continue
+				batch.append((it.current_line_number, event))
+				if len(batch) >= batch_size:
+					if not put(batch):
+						return
+					batch = []
+			if len(batch) > 0 and not put(batch):
+				return
+			put(it.current_line_number)
+		except Exception, e:
+			# The events before the error are passed on first, as LogIterator would
+			if len(batch) > 0 and not put(batch):
+				return
+			line_number = it.current_line_number if it is not None else 0
+			put((line_number, Exception(str(e))))
+	finally:
+		if it is not None:
+			it.close()
+
+class PipelinedLogIterator(LogIterator):
+	"""A LogIterator that reads and decodes the log file in a separate thread 
+	(or process), overlapping I/O and JSON decoding with the consumer's work.
+	
+	Events are passed to the consumer in batches through a bounded queue.
+	The next(), peek() and current_line_number behaviour is the same as for
+	LogIterator, so this class can be used anywhere a LogIterator can.
+	
+	"""
+	def __init__(self, filename, ignored_events=[], start_time=None, 
+		end_time=None, tag_source=False, batch_size=1000, use_process=False,
+		max_batches=8, only_events=None):
+		"""ignore_events - optional list of event types that will be ignored
+		start_time, end_time, tag_source, only_events - as for LogIterator
+		batch_size - the number of events passed to the consumer at once
+		use_process - decode in a separate process rather than a thread
+		max_batches - the maximum number of batches buffered in the queue"""
+		self._ignored_events = ignored_events
+		self._filename = filename
+		self._sources = None
+		self._line_count = 0
+		self._lines_before_start = 0
+		self._lookahead = collections.deque()
+		self._batch = []
+		self._batch_index = 0
+		self._done = False
+
+		if use_process:
+			import multiprocessing
+			self._queue = multiprocessing.Queue(max_batches)
+			self._stop = multiprocessing.Event()
+			self._worker = multiprocessing.Process(target=_read_batches,
+				args=(filename, ignored_events, start_time, end_time, tag_source,
+				only_events, batch_size, self._queue, self._stop))
+		else:
+			self._queue = Queue.Queue(max_batches)
+			self._stop = threading.Event()
+			self._worker = threading.Thread(target=_read_batches,
+				args=(filename, ignored_events, start_time, end_time, tag_source,
+				only_events, batch_size, self._queue, self._stop))
+		self._worker.daemon = True
+		self._worker.start()
+
+	def close(self):
+		"""It's only necessary to call this method if you don't finish iterating 
+		with this object (including when you stop after an error)."""
+		self._done = True
+		self._stop.set()
+		# Drain the queue so that a worker process can flush its buffers and exit
+		while self._worker.is_alive():
+			try:
+				self._queue.get(True, 0.1)
+			except Queue.Empty:
+				pass
+		self._worker.join()
+
+	def _next_impl(self):
+		while self._batch_index >= len(self._batch):
+			if self._done:
+				raise StopIteration
+			item = self._queue.get()
+			if isinstance(item, list):
+				self._batch = item
+				self._batch_index = 0
+			elif isinstance(item, tuple):
+				self._line_count, exception = item
+				if not isinstance(exception, _ParseError):
+					self.close()
+				raise exception
+			else:
+				# After the last line of the file, stop the worker and end the iterator
+				self._line_count = item
+				self.close()
+				raise StopIteration
+		self._line_count, event = self._batch[self._batch_index]
+		self._batch_index += 1
+		return event
+
+	def next_batch(self, n):
+		# Slice events straight out of the worker's batches, rather than
+		# taking them one at a time
+		batch = []
+		lookahead = self._lookahead
+		while len(lookahead) > 0 and len(batch) < n:
+			batch.append(lookahead.popleft())
+		try:
+			while len(batch) < n:
+				start = self._batch_index
+				end = min(len(self._batch), start + n - len(batch))
+				if start < end:
+					batch.extend([event for line, event in self._batch[start:end]])
+					self._line_count = self._batch[end - 1][0]
+					self._batch_index = end
+				else:
+					batch.append(self._next_impl())
+		except StopIteration:
+			pass
+		return batch
+
+def merge_events(*streams):
+	"""Merge any number of event streams, each of which is in time order, into
+	a single stream in time order. Only the next event from each stream is
+	held in memory. Events with the same time are returned in the order of
+	the streams they came from."""
+	heap = []
+	for i, stream in enumerate(streams):
+		it = iter(stream)
+		for event in it:
+			heap.append((event["time"], i, event, it))
+			break
+	heapq.heapify(heap)
+	while len(heap) > 0:
+		time, i, event, it = heap[0]
+		yield event
+		for event in it:
+			heapq.heapreplace(heap, (event["time"], i, event, it))
+			break
+		else:
+			heapq.heappop(heap)
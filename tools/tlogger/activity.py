@@ -0,0 +1,182 @@
+#! /user/bin/env python
+
+"""
+Split each session in a log into periods when the user was active, and the
+idle periods in between, using the times of the user's actions.
+
+The activity signals are the user actions in the raw log (clicks, mouse
+downs, tab selects, and so on; see compile.is_user_action), the key down
+times recorded with each load_start, and optionally the window focus events
+from focus.dat. Their times are read into a NumPy array, and the periods are
+found with vectorized operations: an active period ends at a gap longer
+than idle_threshold, and it takes at least min_events actions to start one,
+so a stray click while the user is away doesn't count as activity.
+
+The raw log can be read directly, without compiling it. LogIterator only
+parses the lines with activity events, so this is fast even for big logs:
+
+	times, sessions = read_activity(path)
+	starts, ends, period_sessions = active_periods(times, sessions)
+
+To print the active time in each session of a log:
+
+	python -m tlogger.activity extstore.dat
+	python -m tlogger.activity --periods extstore.dat --focus_filename=focus.dat
+
+This module requires NumPy (http://numpy.scipy.org/).
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import array
+
+# NumPy is only needed by this module, so the rest of the package works
+# without it
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+import tlogger
+import compile
+
+__all__ = ["ACTIVITY_EVENTS", "activity_times", "read_activity", "active_periods",
+	"idle_periods"]
+
+# The events that show that the user was doing something
+ACTIVITY_EVENTS = (compile.USER_NAVIGATION_EVENTS + compile.USER_NON_NAVIGATION_EVENTS
+	+ ["window_focus", "window_active"])
+
+# Events which start a new session, in raw and compiled logs
+_SESSION_EVENTS = ["LOG_OPEN", "browser_start"]
+
+def _require_numpy():
+	if numpy is None:
+		raise Exception("tlogger.activity requires NumPy")
+
+def activity_times(events):
+	"""Return two arrays: the times (in millis) of the user's actions in a
+	stream of events, and the index of the session each one was in."""
+	_require_numpy()
+	activity = set(ACTIVITY_EVENTS)
+	times = array.array("d")
+	sessions = array.array("l")
+	session = 0
+	seen_session_start = False
+	for event in events:
+		name = event["event"]
+		if name in _SESSION_EVENTS:
+			if seen_session_start:
+				session += 1
+			seen_session_start = True
+		elif name in activity:
+			times.append(event["time"])
+			sessions.append(session)
+		elif name == "load_start":
+			# The last key down time is 0 if there hasn't been one
+			key_down_time = event.get("lastKeyDownTime")
+			if key_down_time:
+				times.append(key_down_time)
+				sessions.append(session)
+	return (numpy.array(times, dtype=numpy.int64), numpy.array(sessions, dtype=numpy.int32))
+
+def read_activity(filename, focus_filename=None):
+	"""Read the activity times from a log file (and focus.dat, if given),
+	parsing only the lines that might have activity events. Returns the same
+	arrays as activity_times."""
+	events = tlogger.LogIterator(filename,
+		only_events=ACTIVITY_EVENTS + _SESSION_EVENTS + ["load_start"])
+	if focus_filename:
+		import focus
+		events = tlogger.merge_events(events, focus.FocusLogIterator(focus_filename))
+	return activity_times(events)
+
+def active_periods(times, sessions=None, idle_threshold=300, min_events=2):
+	"""Find the periods when the user was active. Returns three arrays: the
+	start and end times of the periods, and the session each was in.
+
+	times - the times of the user's actions, in millis, in any order
+	sessions - optional session index of each action; periods never span
+		two sessions
+	idle_threshold - a gap of more than this many seconds ends a period
+	min_events - the number of actions needed to count as a period
+
+	"""
+	_require_numpy()
+	times = numpy.asarray(times, dtype=numpy.int64)
+	if sessions is None:
+		sessions = numpy.zeros(len(times), dtype=numpy.int32)
+	else:
+		sessions = numpy.asarray(sessions)
+	if len(times) == 0:
+		return (times, times.copy(), sessions[:0])
+
+	order = numpy.lexsort((times, sessions))
+	times = times[order]
+	sessions = sessions[order]
+
+	breaks = (numpy.diff(times) > idle_threshold * 1000) | (numpy.diff(sessions) != 0)
+	first = numpy.concatenate(([0], numpy.flatnonzero(breaks) + 1))
+	last = numpy.concatenate((first[1:] - 1, [len(times) - 1]))
+	keep = (last - first + 1) >= min_events
+	return (times[first[keep]], times[last[keep]], sessions[first[keep]])
+
+def idle_periods(starts, ends, sessions):
+	"""Return the idle periods between the active periods from active_periods,
+	as three arrays like its result. The time before the first active period
+	and after the last one in each session isn't included."""
+	_require_numpy()
+	same_session = sessions[1:] == sessions[:-1]
+	return (ends[:-1][same_session], starts[1:][same_session], sessions[1:][same_session])
+
+def main(input_filename, focus_filename=None, idle_threshold=300, min_events=2,
+	periods=False):
+	"""
+	Print the number of active periods and the total active and idle time in
+	each session of a log file.
+
+	focus_filename -- The user's focus.dat, to include the focus events
+	idle_threshold -- The number of seconds of inactivity that ends an active period
+	min_events -- The number of actions needed to start an active period
+	periods -- Print each active period, rather than the totals for each session
+	"""
+	_require_numpy()
+	times, sessions = read_activity(input_filename, focus_filename)
+	starts, ends, period_sessions = active_periods(times, sessions, idle_threshold,
+		min_events)
+	if periods:
+		for start, end, session in zip(starts, ends, period_sessions):
+			print "%d %d %d %.1f" % (session, start, end, (end - start) / 1000.0)
+		return
+
+	idle_starts, idle_ends, idle_sessions = idle_periods(starts, ends, period_sessions)
+	session_count = (sessions.max() + 1) if len(sessions) > 0 else 0
+	counts = numpy.bincount(period_sessions, minlength=session_count)
+	active = numpy.bincount(period_sessions, (ends - starts) / 1000.0, minlength=session_count)
+	idle = numpy.bincount(idle_sessions, (idle_ends - idle_starts) / 1000.0,
+		minlength=session_count)
+	print "session periods active_secs idle_secs"
+	for session in xrange(session_count):
+		print "%7d %7d %11.1f %9.1f" % (session, counts[session], active[session],
+			idle[session])
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
@@ -0,0 +1,374 @@
+#! /user/bin/env python
+
+"""
+A compact binary format for compiled tlogger logs.
+
+The text format written by compile.write_to_file has to be completely
+re-parsed every time it's loaded. The binary format stores each event as a
+fixed-width record, with the commonly used string fields (event names,
+causes, window and tab ids, URLs) replaced by ids into a string table, and
+timestamps stored relative to the start of the session. Any fields that
+don't fit in a record are stored as JSON in a separate area of the file.
+
+BinaryLog memory-maps the file and only decodes records as they're accessed:
+
+	log = BinaryLog("/path/to/compiled.bin")
+	for i in range(log.session_count):
+		for event in log.session(i):
+			...
+
+Files can be converted from and to the text format from the command line:
+
+	python -m tlogger.binlog compiled.txt compiled.bin
+	python -m tlogger.binlog --to_text compiled.bin compiled.txt
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import bisect
+import mmap
+import struct
+
+# Get a JSON library. Prefer cjson if it's installed (it's about 10x faster),
+# but fall back to json (if Python >= 2.6) or simplejson
+try:
+	import cjson as json
+except ImportError:
+	try:
+		import json
+	except ImportError:
+		import simplejson as json
+
+import tlogger
+
+__all__ = ["BinaryLog", "write_binary", "is_binary_log"]
+
+#-----------------------------------------------------------------------------
+# File layout
+#-----------------------------------------------------------------------------
+
+MAGIC = "TLCB"
+VERSION = 1
+
+# magic, version, string count, session count, record count, and the offsets
+# of the string index, string data, session table, records, and extras
+_HEADER = struct.Struct("<4sIIII5Q")
+
+# The string index has one entry per string (plus one), giving the offset of
+# the UTF-8 data for that string within the string data area
+_STRING_INDEX_ENTRY = struct.Struct("<I")
+
+# Index of the first record in the session, and the session's base time
+_SESSION = struct.Struct("<Iq")
+
+# Fields that are stored as string ids in each record
+_STRING_FIELDS = ("event", "win", "tabId", "cause", "url", "from_url", "original_url")
+
+# Fields that are stored as 32-bit ints in each record
+_INT_FIELDS = ("tabIndex", "tab_count", "back_distance", "forward_distance", "match_index")
+
+# The time (relative to the session base time), the string and int fields,
+# secs_since_cause, a flags byte, and the offset of the extra fields
+_RECORD = struct.Struct("<i7I5idB3xI")
+
+_NO_STRING = 0xFFFFFFFF # A string field that's not present
+_NO_INT = -0x80000000 # An int field that's not present, or time is in extras
+_NO_EXTRAS = 0xFFFFFFFF
+
+_INT_MIN, _INT_MAX = -0x7FFFFFFF, 0x7FFFFFFF
+
+# Boolean fields, which are stored in the flags byte. Bit 0 of the flags
+# indicates whether secs_since_cause is present; after that, there are two
+# bits for each boolean field (whether it's present, and its value).
+_BOOL_FIELDS = ("location_changed", "isTopLevel")
+_HAS_SECS_SINCE_CAUSE = 1
+
+def _json_encode(obj):
+	if json.__name__ == "cjson":
+		return json.encode(obj)
+	return json.dumps(obj)
+
+def _json_decode(text):
+	if json.__name__ == "cjson":
+		return json.decode(text)
+	return json.loads(text)
+
+def _is_integer(value):
+	# bool is a subclass of int, but must be preserved as a bool
+	return type(value) in (int, long)
+
+def _is_int32(value):
+	return _is_integer(value) and _INT_MIN <= value <= _INT_MAX
+
+#-----------------------------------------------------------------------------
+# Writing
+#-----------------------------------------------------------------------------
+
+def write_binary(events, f):
+	"""Write a sequence of compiled events (as returned by compile.compile)
+	to the file f, which must be opened in binary mode."""
+
+	strings = []
+	string_ids = {}
+	def string_id(s):
+		try:
+			return string_ids[s]
+		except KeyError:
+			string_ids[s] = len(strings)
+			strings.append(s)
+			return string_ids[s]
+
+	records = []
+	sessions = [] # (first record index, base time)
+	extras = []
+	extras_size = 0
+
+	for i, event in enumerate(events):
+		# Every browser_start event begins a new session
+		time = event.get("time")
+		if len(sessions) == 0 or event.get("event") == "browser_start":
+			sessions.append((i, time if _is_integer(time) else 0))
+		base_time = sessions[-1][1]
+
+		extra = {}
+		for key, value in event.iteritems():
+			if (key not in _STRING_FIELDS and key not in _INT_FIELDS 
+			and key not in _BOOL_FIELDS):
+				extra[key] = value
+
+		if _is_integer(time) and _is_int32(time - base_time):
+			time_delta = time - base_time
+		else:
+			time_delta = _NO_INT
+
+		fields = [time_delta]
+		for key in _STRING_FIELDS:
+			value = event.get(key)
+			if isinstance(value, basestring):
+				fields.append(string_id(value))
+			else:
+				fields.append(_NO_STRING)
+				if key in event:
+					extra[key] = value
+		for key in _INT_FIELDS:
+			value = event.get(key)
+			if _is_int32(value):
+				fields.append(value)
+			else:
+				fields.append(_NO_INT)
+				if key in event:
+					extra[key] = value
+
+		# These are handled by the fixed part of the record, if possible
+		flags = 0
+		extra.pop("time", None)
+		if time_delta == _NO_INT and "time" in event:
+			extra["time"] = time
+		secs = extra.pop("secs_since_cause", None)
+		if type(secs) is float:
+			flags |= _HAS_SECS_SINCE_CAUSE
+		elif "secs_since_cause" in event:
+			extra["secs_since_cause"] = secs
+		for bit, key in enumerate(_BOOL_FIELDS):
+			value = event.get(key)
+			if type(value) is bool:
+				flags |= (2 | value) << (2 * bit + 1)
+			elif key in event:
+				extra[key] = value
+		fields.append(secs if flags & _HAS_SECS_SINCE_CAUSE else 0.0)
+		fields.append(flags)
+
+		if len(extra) > 0:
+			data = _json_encode(extra)
+			fields.append(extras_size)
+			extras.append(_STRING_INDEX_ENTRY.pack(len(data)) + data)
+			extras_size += len(extras[-1])
+		else:
+			fields.append(_NO_EXTRAS)
+
+		records.append(_RECORD.pack(*fields))
+
+	encoded_strings = [s.encode("utf-8") for s in strings]
+	string_index = []
+	pos = 0
+	for s in encoded_strings + [""]:
+		string_index.append(_STRING_INDEX_ENTRY.pack(pos))
+		pos += len(s)
+
+	# Lay out the sections one after another
+	string_index_offset = _HEADER.size
+	string_data_offset = string_index_offset + len(string_index) * _STRING_INDEX_ENTRY.size
+	sessions_offset = string_data_offset + pos
+	records_offset = sessions_offset + len(sessions) * _SESSION.size
+	extras_offset = records_offset + len(records) * _RECORD.size
+
+	f.write(_HEADER.pack(MAGIC, VERSION, len(strings), len(sessions), len(records),
+		string_index_offset, string_data_offset, sessions_offset, records_offset,
+		extras_offset))
+	f.write("".join(string_index))
+	f.write("".join(encoded_strings))
+	f.write("".join([_SESSION.pack(*session) for session in sessions]))
+	f.write("".join(records))
+	f.write("".join(extras))
+
+def is_binary_log(filename):
+	"""Return True if the given file is in the binary compiled format."""
+	f = open(filename, "rb")
+	try:
+		return f.read(len(MAGIC)) == MAGIC
+	finally:
+		f.close()
+
+#-----------------------------------------------------------------------------
+# Reading
+#-----------------------------------------------------------------------------
+
+class BinaryLog(object):
+	"""Read-only, random-access view of a compiled log in the binary format.
+
+	The file is memory-mapped, and each event is only decoded when it's
+	accessed. Events are returned as dicts equal to the ones that were
+	written, so a BinaryLog can be used anywhere a list of compiled events
+	can (e.g. compile.write_to_file).
+
+	"""
+	def __init__(self, filename):
+		self._f = open(filename, "rb")
+		self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+		(magic, version, self._string_count, session_count, self._record_count,
+			self._string_index_offset, self._string_data_offset, sessions_offset,
+			self._records_offset, self._extras_offset) = _HEADER.unpack_from(self._mm)
+		if magic != MAGIC:
+			raise Exception("%s is not a binary compiled log" % filename)
+		if version != VERSION:
+			raise Exception("Unsupported binary log version %d" % version)
+
+		self._strings = [None] * self._string_count
+
+		# The session table is tiny, so just load it
+		self._session_starts = []
+		self._session_times = []
+		for i in range(session_count):
+			start, base_time = _SESSION.unpack_from(self._mm, sessions_offset + i * _SESSION.size)
+			self._session_starts.append(start)
+			self._session_times.append(base_time)
+
+	def close(self):
+		self._mm.close()
+		self._f.close()
+
+	def __len__(self):
+		return self._record_count
+
+	def __getitem__(self, index):
+		if index < 0:
+			index += self._record_count
+		if not 0 <= index < self._record_count:
+			raise IndexError("event index out of range")
+		session = bisect.bisect_right(self._session_starts, index) - 1
+		return self._decode(index, self._session_times[session])
+
+	def __iter__(self):
+		for session in range(self.session_count):
+			for event in self.session(session):
+				yield event
+
+	@property
+	def session_count(self):
+		return len(self._session_starts)
+
+	def session_bounds(self, session):
+		"""Return the (start, end) indices of the events in the given session."""
+		start = self._session_starts[session]
+		if session + 1 < len(self._session_starts):
+			return (start, self._session_starts[session + 1])
+		return (start, self._record_count)
+
+	def session(self, session):
+		"""Iterate over the events in the given session."""
+		start, end = self.session_bounds(session)
+		base_time = self._session_times[session]
+		for i in xrange(start, end):
+			yield self._decode(i, base_time)
+
+	def _string(self, string_id):
+		s = self._strings[string_id]
+		if s is None:
+			start, end = struct.unpack_from("<II", self._mm,
+				self._string_index_offset + string_id * _STRING_INDEX_ENTRY.size)
+			s = self._mm[self._string_data_offset + start:self._string_data_offset + end]
+			s = self._strings[string_id] = s.decode("utf-8")
+		return s
+
+	def _decode(self, index, base_time):
+		fields = _RECORD.unpack_from(self._mm, self._records_offset + index * _RECORD.size)
+		event = {}
+		if fields[0] != _NO_INT:
+			event["time"] = base_time + fields[0]
+		i = 1
+		for key in _STRING_FIELDS:
+			if fields[i] != _NO_STRING:
+				event[key] = self._string(fields[i])
+			i += 1
+		for key in _INT_FIELDS:
+			if fields[i] != _NO_INT:
+				event[key] = fields[i]
+			i += 1
+		secs, flags, extras = fields[i:]
+		if flags & _HAS_SECS_SINCE_CAUSE:
+			event["secs_since_cause"] = secs
+		flags >>= 1
+		for key in _BOOL_FIELDS:
+			if flags & 2:
+				event[key] = bool(flags & 1)
+			flags >>= 2
+		if extras != _NO_EXTRAS:
+			offset = self._extras_offset + extras
+			length, = _STRING_INDEX_ENTRY.unpack_from(self._mm, offset)
+			offset += _STRING_INDEX_ENTRY.size
+			event.update(_json_decode(self._mm[offset:offset + length]))
+		return event
+
+def main(input_filename, output_filename, to_text=False):
+	"""
+	Convert a compiled log file between the text and binary formats.
+
+	to_text -- Convert from the binary format to text (default is the reverse)
+	"""
+	import compile
+
+	if to_text:
+		log = BinaryLog(input_filename)
+		output_file = open(output_filename, "w")
+		try:
+			compile.write_to_file(log, output_file)
+		finally:
+			output_file.close()
+			log.close()
+	else:
+		output_file = open(output_filename, "wb")
+		try:
+			write_binary(tlogger.LogIterator(input_filename), output_file)
+		finally:
+			output_file.close()
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
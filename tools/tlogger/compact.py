@@ -0,0 +1,277 @@
+#! /user/bin/env python
+
+"""
+A lossless, compact format for raw tlogger log files (extstore.dat).
+
+Every line in a raw log repeats the same keys ("event", "win", "tabId", ...)
+and many of the same values, along with a full 13-digit timestamp. In the
+compact format, each distinct key and value is written out once, in a
+definition line, and each log line becomes a timestamp delta followed by
+pairs of key and value ids. The conversion is exactly reversible: expanding
+a compacted file gives back the original file, byte for byte.
+
+LogIterator detects compacted files automatically, and returns the same
+events (with the same line numbers) as it would for the original file.
+Since each distinct value is only decoded once, they're also faster to read.
+
+	python -m tlogger.compact extstore.dat extstore.tlc
+	python -m tlogger.compact --expand extstore.tlc extstore.dat
+
+The format is line-oriented, and has one line for each line of the
+original log, plus the definition lines:
+
+	#tlogger-compact 1           The header
+	=k"event"                    Define the next key id (raw JSON text)
+	=v"load_start"               Define the next value id (raw JSON text)
+	1226282384020 0:0,1:2        Timestamp delta, and key:value ids (base 36)
+	|some other text             Any other line, stored verbatim
+	$                            The original did not end with a newline
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import re
+
+# Get a JSON library. Prefer cjson if it's installed (it's about 10x faster),
+# but fall back to json (if Python >= 2.6) or simplejson
+try:
+	import cjson as json
+except ImportError:
+	try:
+		import json
+	except ImportError:
+		import simplejson as json
+
+__all__ = ["CompactLogReader", "compact_log", "expand_log", "MAGIC"]
+
+MAGIC = "#tlogger-compact"
+VERSION = 1
+
+# A single member of a JSON object, as written by the extension: no
+# whitespace, and only scalar values. Anything else is stored verbatim.
+_MEMBER_RE = re.compile(r'("(?:[^"\\\n]|\\.)*"):'
+	r'("(?:[^"\\\n]|\\.)*"|-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null)'
+	r'([,}])')
+_TIMESTAMP_RE = re.compile(r"(0|[1-9]\d*) \{")
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+def _base36(n):
+	if n == 0:
+		return "0"
+	digits = []
+	while n > 0:
+		n, d = divmod(n, 36)
+		digits.append(_DIGITS[d])
+	return "".join(reversed(digits))
+
+def _json_decode(text):
+	if json.__name__ == "cjson":
+		return json.decode(text)
+	return json.loads(text)
+
+def _split_line(line):
+	"""If the line (without the newline) is in the canonical form written by
+	the extension, return the timestamp and the list of raw (key, value)
+	pairs. Otherwise, return None."""
+	match = _TIMESTAMP_RE.match(line)
+	if match is None:
+		return None
+	time = int(match.group(1))
+	pos = match.end()
+	members = []
+	if line[pos:] == "}":
+		return (time, members)
+	while True:
+		match = _MEMBER_RE.match(line, pos)
+		if match is None:
+			return None
+		members.append((match.group(1), match.group(2)))
+		pos = match.end()
+		if match.group(3) == "}":
+			break
+	if pos != len(line):
+		return None
+	return (time, members)
+
+def compact_log(lines, f):
+	"""Write the lines of a raw log file in the compact format to f."""
+
+	key_ids = {}
+	value_ids = {}
+	write = f.write
+	write("%s %d\n" % (MAGIC, VERSION))
+
+	prev_time = 0
+	line = "\n"
+	for line in lines:
+		text = line[:-1] if line.endswith("\n") else line
+		parts = _split_line(text)
+		if parts is None:
+			write("|" + text + "\n")
+			continue
+		time, members = parts
+
+		# Make sure any new keys and values can be decoded, so that errors are
+		# reported on the right line. If not, store the line verbatim.
+		try:
+			for key, value in members:
+				if key not in key_ids:
+					_json_decode(key)
+				if value not in value_ids:
+					_json_decode(value)
+		except Exception:
+			write("|" + text + "\n")
+			continue
+
+		pairs = []
+		for key, value in members:
+			key_id = key_ids.get(key)
+			if key_id is None:
+				key_id = key_ids[key] = _base36(len(key_ids))
+				write("=k" + key + "\n")
+			value_id = value_ids.get(value)
+			if value_id is None:
+				value_id = value_ids[value] = _base36(len(value_ids))
+				write("=v" + value + "\n")
+			pairs.append(key_id + ":" + value_id)
+		write("%d %s\n" % (time - prev_time, ",".join(pairs)))
+		prev_time = time
+	if not line.endswith("\n"):
+		write("$\n")
+
+class CompactLogReader(object):
+	"""Iterates over a file in the compact format.
+
+	By default, each event line is returned as a dict (including "time"),
+	and any other line is returned as the original text. If raw is True,
+	every line is returned as the original text.
+
+	"""
+	def __init__(self, f, raw=False):
+		self._f = f
+		self._raw = raw
+		header = f.readline()
+		if not header.startswith(MAGIC):
+			raise Exception("Not a compact tlogger log")
+		version = int(header[len(MAGIC):])
+		if version != VERSION:
+			raise Exception("Unsupported compact log version %d" % version)
+		self._keys = [] # Raw JSON text of each key
+		self._values = []
+		self._decoded_keys = []
+		self._decoded_values = []
+		self._pairs = {} # Cache of decoded (key, value) pairs, by "k:v" text
+		self._time = 0
+		self._pending = None # The next line, if we've already read it
+
+	def __iter__(self):
+		return self
+
+	def close(self):
+		self._f.close()
+
+	def _next_line(self):
+		if self._pending is not None:
+			line, self._pending = self._pending, None
+			return line
+		return self._f.next()
+
+	def next(self):
+		while True:
+			line = self._next_line()
+			tag = line[0]
+			if tag == "=":
+				if line[1] == "k":
+					self._keys.append(line[2:-1])
+					self._decoded_keys.append(_json_decode(line[2:-1]))
+				else:
+					self._values.append(line[2:-1])
+					self._decoded_values.append(_json_decode(line[2:-1]))
+				continue
+			if tag == "$":
+				continue
+			if tag == "|":
+				result = line[1:]
+			else:
+				delta, members = line[:-1].split(" ", 1)
+				self._time += int(delta)
+				if self._raw:
+					result = self._expand(members)
+				else:
+					result = self._decode(members)
+					result["time"] = self._time
+			if self._raw:
+				# Check if the original ended without a newline
+				try:
+					self._pending = self._next_line()
+				except StopIteration:
+					pass
+				if self._pending == "$\n":
+					result = result[:-1]
+			return result
+
+	def _decode(self, members):
+		event = {}
+		if len(members) == 0:
+			return event
+		pairs = self._pairs
+		for member in members.split(","):
+			pair = pairs.get(member)
+			if pair is None:
+				key_id, value_id = member.split(":")
+				pair = pairs[member] = (self._decoded_keys[int(key_id, 36)],
+					self._decoded_values[int(value_id, 36)])
+			event[pair[0]] = pair[1]
+		return event
+
+	def _expand(self, members):
+		text = []
+		if len(members) > 0:
+			for member in members.split(","):
+				key_id, value_id = member.split(":")
+				text.append(self._keys[int(key_id, 36)] + ":" + self._values[int(value_id, 36)])
+		return "%d {%s}\n" % (self._time, ",".join(text))
+
+def expand_log(f_in, f_out):
+	"""Write the original text of the compact log file f_in to f_out."""
+	for line in CompactLogReader(f_in, raw=True):
+		f_out.write(line)
+
+def main(input_filename, output_filename, expand=False):
+	"""
+	Convert a raw tlogger log file to the compact format, or back again.
+
+	expand -- Convert from the compact format back to the original text
+	"""
+	input_file = open(input_filename, "rb")
+	output_file = open(output_filename, "wb")
+	try:
+		if expand:
+			expand_log(input_file, output_file)
+		else:
+			compact_log(input_file, output_file)
+	finally:
+		input_file.close()
+		output_file.close()
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
@@ -23,7 +23,9 @@ __license__ = "GNU GPL v2"
 
 import collections
 import logging as _logging
+import os
 import pdb
+import re
 
 # Get a JSON library. Prefer cjson if it's installed (it's about 10x faster),
 # but fall back to json (if Python >= 2.6) or simplejson
@@ -40,8 +42,9 @@ import traceback
 
 import simpleopt
 import tlogger
+import binlog
 
-__all__ = ["compile", "write_to_file"]
+__all__ = ["Compiler", "compile", "check", "write_to_file"]
 
 #-----------------------------------------------------------------------------
 # Constants
@@ -92,13 +95,15 @@ USER_NON_NAVIGATION_EVENTS = [
 # Various helpers
 #-----------------------------------------------------------------------------
 
+# Sets of the event names above, since these are checked for every event
+_USER_ACTIONS = frozenset(USER_NAVIGATION_EVENTS + USER_NON_NAVIGATION_EVENTS)
+_NAVIGATION_CAUSES = frozenset(USER_NAVIGATION_EVENTS + OTHER_NAVIGATION_EVENTS)
+
 def is_user_action(event):
-	name = event["event"]
-	return (name in USER_NAVIGATION_EVENTS or name in USER_NON_NAVIGATION_EVENTS)
+	return event["event"] in _USER_ACTIONS
 
 def is_navigation_cause(event):
-	name = event["event"]
-	return (name in USER_NAVIGATION_EVENTS or name in OTHER_NAVIGATION_EVENTS)
+	return event["event"] in _NAVIGATION_CAUSES
 
 def get_url(event, default=None):
 	"""Get the URL from the event without having to remember what it's called."""
@@ -124,55 +129,91 @@ def seconds_between(time_or_evt1, time_or_evt2):
 # Debug helpers -- some simple code for debugging problems with log files.
 #-----------------------------------------------------------------------------
 
+class _StderrHandler(_logging.StreamHandler):
+	"""A StreamHandler that always writes to the current sys.stderr. This
+	allows callers to redirect sys.stderr after this module is imported."""
+
+	stream = property(lambda self: sys.stderr, lambda self, value: None)
+
+# The handler is only set up once, and shared by every compile. The logging
+# module takes care of serializing output from concurrent compiles. (When run
+# with "python -m", this module is loaded twice; don't add a second handler.)
+_logger = _logging.getLogger("tlogger.compile")
+_logger.setLevel(_logging.INFO)
+if len(_logger.handlers) == 0:
+	_handler = _StderrHandler()
+	_handler.setFormatter(_logging.Formatter("%(levelname)s: %(message)s"))
+	_logger.addHandler(_handler)
+
 class MyLogger(object):
 	"""A custom Logger-like class whose sole purpose is to allow us to
 	include the line number from the data file in the messages. There are 
 	other ways to do this, but they're all more complicated than this."""
 
 	def __init__(self, iterator):
-		# By creating everything we need for logging at this point,
-		# it allows the caller to redirect sys.stderr
-		self._logger = _logging.getLogger("tlogger.compile")
-		self._logger.setLevel(_logging.INFO)
-		self._handler = _logging.StreamHandler(sys.stderr)
-		self._handler.setFormatter(_logging.Formatter("%(levelname)s: %(message)s"))
-		self._logger.addHandler(self._handler)
+		self._logger = _logger
 		self._it = iterator
 
-	def cleanup(self):
-		self._handler.close()
-		self._logger.removeHandler(self._handler)
-
 	def debug(self, msg, *args, **kwargs):
-		self._logger.debug(("  (%5s) " % self._it._line_count) + msg, *args, **kwargs)
+		if not self._logger.isEnabledFor(_logging.DEBUG):
+			return # Avoid computing the line number
+		self._logger.debug(("  (%5s) " % self._it.current_line_number) + msg, *args, **kwargs)
 
 	def info(self, msg, *args, **kwargs):
-		self._logger.info(("   (%5s) " % self._it._line_count) + msg, *args, **kwargs)
+		self._logger.info(("   (%5s) " % self._it.current_line_number) + msg, *args, **kwargs)
 
 	def warning(self, msg, *args, **kwargs):
-		self._logger.warning(("(%5s) " % self._it._line_count) + msg, *args, **kwargs)
+		self._logger.warning(("(%5s) " % self._it.current_line_number) + msg, *args, **kwargs)
 
 	def error(self, msg, *args, **kwargs):
 		self._print_error(msg, *args, **kwargs)
 		raise Exception, msg
 
 	def _print_error(self, msg, *args, **kwargs):
-		self._logger.error((" (%5s) " % self._it._line_count) + msg, *args, **kwargs)
+		self._logger.error((" (%5s) " % self._it.current_line_number) + msg, *args, **kwargs)
+
+def message_category(msg):
+	"""Return the kind of a log message, by replacing the URLs, tab and window
+	ids, and numbers in it (e.g. "No TabRestore for <id>")."""
+	msg = re.sub(r"\S+://\S*|about:\S+", "<url>", msg)
+	msg = re.sub(r"\b[TW][0-9a-z]*[0-9][0-9a-z]*\b", "<id>", msg)
+	return re.sub(r"\d+(\.\d+)?", "<n>", msg)
+
+class CountingLogger(MyLogger):
+	"""A MyLogger that counts the info and warning messages of each kind (see
+	message_category) rather than printing them. Errors are still printed."""
+
+	def __init__(self, iterator):
+		MyLogger.__init__(self, iterator)
+		self.counts = {} # (level, category) -> count
+
+	def _count(self, level, msg):
+		key = (level, message_category(msg))
+		self.counts[key] = self.counts.get(key, 0) + 1
+
+	def info(self, msg, *args, **kwargs):
+		self._count("INFO", msg)
 
-def _assert(condition, msg=""):
-	if not condition:
-		logger.error(msg)
+	def warning(self, msg, *args, **kwargs):
+		self._count("WARNING", msg)
+
+def _error_message(ex):
+	"""Return the message for an error that stopped a compile. The compiler's
+	own errors are plain Exceptions; for others, include the type."""
+	if type(ex) in (Exception, tlogger._ParseError):
+		return str(ex)
+	return "%s: %s" % (ex.__class__.__name__, ex)
 
 #-----------------------------------------------------------------------------
 # Functions for emitting the high-level events
 #-----------------------------------------------------------------------------
 		
-def Event(orig_event, name=None, keys=None, **kwargs): 
+def _event_data(orig_event, name=None, keys=None, **kwargs): 
 		"""Create a new event with the given name, copying the attributes 
 		specified by 'keys' from the original event. If 'name' is none, it will 
 		be taken from the original event. If 'keys' is None, all keys will be 
 		copied from the original event. Any kwargs specified will also be added 
-		to the event data."""
+		to the event data. See Compiler.Event()."""
 
 		data = {}
 
@@ -192,9 +233,6 @@ def Event(orig_event, name=None, keys=None, **kwargs):
 
 		# If the name is not specified, use the name of the original event
 		data["event"] = name or orig_event["event"]
-
-		_assert("time" in data, "Event must have a time")
-
 		return data
 	
 #-----------------------------------------------------------------------------
@@ -202,7 +240,8 @@ def Event(orig_event, name=None, keys=None, **kwargs):
 #-----------------------------------------------------------------------------
 
 class Window(object):
-	def __init__(self, win_id):
+	def __init__(self, compiler, win_id):
+		self.compiler = compiler
 		self.winId = win_id
 		self.tabs = []
 		self.gotohistoryindex_event = None
@@ -260,14 +299,16 @@ class Window(object):
 		if 0 <= self.pending_tab_close_index < index:
 			index -= 1
 
-		_assert(tab.get_index() == index, "%s has inconsistent tabIndex" % tab.tabId)
+		self.compiler._assert(tab.get_index() == index, "%s has inconsistent tabIndex" % tab.tabId)
 
 class BackStack(object):
-	def __init__(self):
+	def __init__(self, compiler):
+		self.compiler = compiler
 		self._stack = []
 		self._current_index = -1
 
 	def process(self, nav_action):
+		logger = self.compiler.logger
 		cause_descr = nav_action.get_cause_descr()
 		url = nav_action.url
 		distance = 0
@@ -345,6 +386,7 @@ class Tab(object):
 		# These attributes always exist
 		self.tabId = tab_reg_event["tabId"]
 		self.win = win
+		self.compiler = win.compiler
 		self.tab_open_cause = cause_event
 		self.opened_new_tab_with = opened_new_tab_with
 
@@ -357,7 +399,7 @@ class Tab(object):
 		# Ensure that a nav cause can never occur before the cause of a previous nav action
 		self.last_navigation_time = 0
 
-		self.back_stack = BackStack()
+		self.back_stack = BackStack(self.compiler)
 
 	def __str__(self):
 		return self.tabId
@@ -376,9 +418,9 @@ class Tab(object):
 			if self.opened_new_tab_with:
 				cause_descr += "+openNewTabWith"
 		
-		self.tab_open_event = Event(
+		self.tab_open_event = self.compiler.Event(
 			event, "tab_open", cause=cause_descr, tab_count=len(self.win.tabs))
-		event_stream.append(self.tab_open_event)
+		self.compiler.event_stream.append(self.tab_open_event)
 
 	def has_navigated(self):
 		"""Return True if this tab has ever had a navigation action."""
@@ -398,7 +440,7 @@ class Tab(object):
 			javascript_used = cause_attr.startswith(("javascript:", "http"))
 		
 		# In Fx2, js-caused events are preceded by a js_location_change event	
-		if browser_state.event_history[-1]["event"] == "js_location_change":
+		if self.compiler.browser_state.event_history[-1]["event"] == "js_location_change":
 			javascript_used = True
 
 		for tab, evt in reversed(self.win.navigation_causes):
@@ -426,7 +468,7 @@ class Tab(object):
 				
 				# If the URL is there, make sure they match. Too many false negatives with js though
 				if not javascript_used and cause_url != url:
-					logger.warning("Nav action %s for %s URL %s" % (cause_url, cause["event"], url))
+					self.compiler.logger.warning("Nav action %s for %s URL %s" % (cause_url, cause["event"], url))
 		return (cause, javascript_used)
 
 	def _new_navigation_action(self, nav_event, from_url):
@@ -434,7 +476,7 @@ class Tab(object):
 
 		# We don't have real key down events; insert a fake ones as appropriate
 		keyDownTime = nav_event["lastKeyDownTime"]
-		if browser_state.event_history[-1]["time"] < keyDownTime:
+		if self.compiler.browser_state.event_history[-1]["time"] < keyDownTime:
 			tab = self.win.get_selected_tab(keyDownTime)
 			self.win.navigation_causes.append(
 				(tab, { "event":"keyDown", "time":keyDownTime, "win":nav_event["win"] }))
@@ -448,7 +490,7 @@ class Tab(object):
 
 		if self.nav_action:
 			# See if we have consecutive load_start events on the same tab
-			prev_event = browser_state.event_history[-1]
+			prev_event = self.compiler.browser_state.event_history[-1]
 			if prev_event["event"] == "load_start" and prev_event["tabId"] == event["tabId"]:
 				if url == self.nav_action.url:
 					pass # Duplicate event, just ignore it
@@ -468,9 +510,9 @@ class Tab(object):
 			cause_descr = new_nav_action.get_cause_descr()
 			if self.nav_action.cause == new_nav_action.cause:
 				if self.nav_action.url == url:
-					logger.warning("Ignoring duplicate load_start (same URL and cause)")
+					self.compiler.logger.warning("Ignoring duplicate load_start (same URL and cause)")
 				else:
-					logger.error("Different load_starts (%s vs. %s) share cause %s" %
+					self.compiler.logger.error("Different load_starts (%s vs. %s) share cause %s" %
 						(self.nav_action.url, url, cause_descr))
 				return
 
@@ -479,13 +521,13 @@ class Tab(object):
 			old_cause_descr = self.nav_action.get_cause_descr()
 			if self.nav_action.url == url:
 				if old_cause_descr == cause_descr:
-					logger.info("Duplicate load_starts caused by %s %ss apart" % 
+					self.compiler.logger.info("Duplicate load_starts caused by %s %ss apart" % 
 						(cause_descr, seconds_between(self.nav_action.cause, new_nav_action.cause)))
 				else:
-					logger.info("Duplicate load_start events, but different causes")
+					self.compiler.logger.info("Duplicate load_start events, but different causes")
 			else:
 				time_diff = (event["time"] - self.nav_action.start_time)/1000.
-				logger.warning("load_start[%s] %.2fs after load_start[%s]" %
+				self.compiler.logger.warning("load_start[%s] %.2fs after load_start[%s]" %
 					(cause_descr, time_diff, old_cause_descr))
 			self.last_nav_action = self.nav_action
 			self.last_nav_action.emit_event()
@@ -504,7 +546,7 @@ class Tab(object):
 		
 	def redirect(self, event):
 		if self.nav_action is None or self.nav_action.url is None:
-			logger.error("redirect without load_start")
+			self.compiler.logger.error("redirect without load_start")
 		self.nav_action.redirect(event["from_url"], event["to_url"])
 		
 	def location_change(self, event):
@@ -521,7 +563,7 @@ class Tab(object):
 					nav_action.cause = self.tab_open_cause
 			elif nav_action.shares_cause(self.last_nav_action):
 				if nav_action.url == self.last_nav_action.url:
-					logger.warning("Ignoring LocationChange (has duplicate url and cause)")
+					self.compiler.logger.warning("Ignoring LocationChange (has duplicate url and cause)")
 					return
 				# They're different nav actions, so they can't share a cause
 				nav_action.cause = None			
@@ -543,12 +585,13 @@ class Tab(object):
 	def set_restored(self):
 		"""This tab is being restored. There's no reason to ever do the opposite."""
 		if self.nav_action or self.last_nav_action:
-			logger.warning("TabRestore on non-fresh tab")
+			self.compiler.logger.warning("TabRestore on non-fresh tab")
 		self.restored = True
 
 class NavigationAction(object):
 	def __init__(self, tab, url, from_url, cause_evt, javascript_used):
 		self.tab = tab
+		self.compiler = tab.compiler
 		self.url = url
 		self.original_url = None # If the request was redirected
 		self.from_url = from_url or ""
@@ -582,12 +625,12 @@ class NavigationAction(object):
 	def check_url(self, url, event_name):
 		if self.url != url:
 			if not (event_name == "load" and self._is_hash_change_only(self.url, url)):
-				logger.warning("%s (%s) doesn't match nav action (%s)" % 
+				self.compiler.logger.warning("%s (%s) doesn't match nav action (%s)" % 
 					(event_name, url, self.url))
 				
 	def load_start(self, url, start_time):
 		if self.load_started:
-			logger.error("Multiple load_start events")
+			self.compiler.logger.error("Multiple load_start events")
 		self.load_started = True
 	
 		# Only some causes (LINK_CLICK, form_submit, etc.) will set the URL
@@ -606,7 +649,7 @@ class NavigationAction(object):
 		"""Return True if the caller should continue processing this event."""
 
 		if self.url and not self._is_hash_change_only(self.url, event["href"]):
-			logger.warning("Ignoring LocChange to %s, expected %s" % (event["href"], self.url))
+			self.compiler.logger.warning("Ignoring LocChange to %s, expected %s" % (event["href"], self.url))
 			# The LocationChange doesn't match the load_start, so ignore it. This seems 
 			# to only happen when the matching LocationChange is coming up next
 			return False
@@ -619,7 +662,7 @@ class NavigationAction(object):
 			# When the tab was opened from another tab, we'll be missing
 			# the load_start and redirect events
 			if self.tab.last_nav_action is not None:
-				logger.warning("LocationChange without load_start")
+				self.compiler.logger.warning("LocationChange without load_start")
 
 		self.location_change_time = event["time"]
 		if self.start_time is None:
@@ -641,7 +684,7 @@ class NavigationAction(object):
 		return self.cause["event"]
 
 	def emit_event(self):
-		nav_event = Event(None, "navigation",
+		nav_event = self.compiler.Event(None, "navigation",
 			time=self.start_time,
 			win=str(self.tab.win),
 			tabId=str(self.tab),
@@ -667,10 +710,11 @@ class NavigationAction(object):
 		if hasattr(self, "match_index"):
 			nav_event["match_index"] = self.match_index
 		
-		event_stream.append(nav_event)
+		self.compiler.event_stream.append(nav_event)
 			
 class BrowserState(object):
-	def __init__(self):
+	def __init__(self, compiler):
+		self.compiler = compiler
 		self.windows = {}
 		self._all_tabs = {}
 		self.nav_action = None
@@ -691,7 +735,7 @@ class BrowserState(object):
 
 	def new_window(self, event):
 		win_id = event["win"]
-		_assert(win_id not in self.windows, "Duplicate win id")
+		self.compiler._assert(win_id not in self.windows, "Duplicate win id")
 
 		# Determine what caused the tab to be opened
 		if len(self.event_history) == 0:
@@ -703,9 +747,9 @@ class BrowserState(object):
 				cause_descr = "%s/%s" % (root_cause["event"], cause["event"])
 			else:
 				cause_descr = cause["event"]
-		event_stream.append(Event(event, "window_open", cause=cause_descr))
+		self.compiler.event_stream.append(self.compiler.Event(event, "window_open", cause=cause_descr))
 
-		self.windows[win_id] = Window(win_id)
+		self.windows[win_id] = Window(self.compiler, win_id)
 		return self.windows[win_id]
 		
 	def close_window(self, win, time):
@@ -724,7 +768,7 @@ class BrowserState(object):
 
 	def new_tab(self, tab_reg_event):
 		tabId = tab_reg_event["tabId"]
-		_assert(tabId not in self._all_tabs, "Duplicate tabId")
+		self.compiler._assert(tabId not in self._all_tabs, "Duplicate tabId")
 
 		win = self.get_window(tab_reg_event)
 
@@ -733,7 +777,7 @@ class BrowserState(object):
 		openNewTabWith = False
 		if cause_event["event"] == "window_onload":
 			if len(win.tabs) != 0:
-				logger.error("Expected to be first tab on window")
+				self.compiler.logger.error("Expected to be first tab on window")
 		elif cause_event["event"] == "openNewTabWith":
 			# The user chose to open a link in a new tab. Find the root cause
 			openNewTabWith = True
@@ -750,7 +794,7 @@ class BrowserState(object):
 		win = self.windows[event["win"]]
 		self.active_window = win
 		if "tabId" in event and win.get_selected_tab().tabId != event["tabId"]:
-			logger.error("%s has inconsistent tabIndex" % event["name"])
+			self.compiler.logger.error("%s has inconsistent tabIndex" % event["name"])
 
 	def process_event(self, event):
 		"""A simple wrapper for the real event handling method, that ensures that
@@ -763,26 +807,26 @@ class BrowserState(object):
 		if there's no more processing to be done."""
 
 		if name == "ERROR":
-			logger.warning(event["message"])
+			self.compiler.logger.warning(event["message"])
 			return
 		if name == "WARNING":
-			logger.warning(event["msg"])
+			self.compiler.logger.warning(event["msg"])
 			return
 			
 		if name == "window_onload":
 			self.new_window(event)
 			return
 
-		win = browser_state.get_window(event)
+		win = self.get_window(event)
 
 		if win is None and self.window_recently_closed(event):
 			name, id = event["event"], event["win"]
-			logger.warning("Ignoring %s on recently-closed window %s" % (name, id))
+			self.compiler.logger.warning("Ignoring %s on recently-closed window %s" % (name, id))
 			return
 
 		if name == "window_unload":
 			self.close_window(win, event["time"])
-			event_stream.append(Event(event, "window_close"))
+			self.compiler.event_stream.append(self.compiler.Event(event, "window_close"))
 			return
 
 		if name == "tab_registered":
@@ -807,9 +851,9 @@ class BrowserState(object):
 		if not win.tlogger_init:
 			if name == "TabOpen" and event["cause"] == "default":
 				if event["tabIndex"] != 0:
-					logger.warning("Default tab has tabIndex %d" % event["tabIndex"])
+					self.compiler.logger.warning("Default tab has tabIndex %d" % event["tabIndex"])
 			else:
-				logger.error("No tlogger_init yet for new window")
+				self.compiler.logger.error("No tlogger_init yet for new window")
 
 		# After a tab_registered event, the next event will contain the tabIndex.
 		# It's usually TabOpen, but TabRestore can sometimes appear instead.
@@ -817,7 +861,7 @@ class BrowserState(object):
 		if tab.tab_open_event is None:
 			tab.complete_tab_open(event)
 			if name not in ["TabOpen", "TabRestore", "TabMove", "TabSelect"]:
-				logger.warning(name + " immediately after tab_registered")
+				self.compiler.logger.warning(name + " immediately after tab_registered")
 
 		# Check that the tabIndex looks consistent. Ignore for TabMove,
 		# because the tabIndex attr refers to the new position, not current
@@ -831,10 +875,10 @@ class BrowserState(object):
 		elif name == "TabMove":
 			win.tabs.remove(tab)
 			win.tabs.insert(event["tabIndex"], tab)
-			event_stream.append(Event(event, "tab_move"))
+			self.compiler.event_stream.append(self.compiler.Event(event, "tab_move"))
 		elif name == "TabSelect":
 			win.select_tab(event["time"], tab)
-			event_stream.append(Event(event, "tab_select"))
+			self.compiler.event_stream.append(self.compiler.Event(event, "tab_select"))
 			# tabIndex attributes should be consistent again; reset this value
 			win.pending_tab_close_index = -1
 		elif name == "TabClose":
@@ -845,7 +889,7 @@ class BrowserState(object):
 				# adjusted yet. Remember the index to recover from this.
 				win.pending_tab_close_index = tab.get_index()
 			win.tabs.remove(tab)
-			event_stream.append(Event(event, "tab_close", tab_count=len(win.tabs)))
+			self.compiler.event_stream.append(self.compiler.Event(event, "tab_close", tab_count=len(win.tabs)))
 		elif name in ["openNewTabWith", "openNewWindowWith"]:
 			# These events will be used once the window/tab is opened
 			pass
@@ -878,12 +922,12 @@ class BrowserState(object):
 					return
 
 				if tab.last_nav_action is None:
-					logger.warning("Ignoring load of %s without a navigation action" % event["url"])
+					self.compiler.logger.warning("Ignoring load of %s without a navigation action" % event["url"])
 				else:
 					tab.last_nav_action.load(event["url"], event["time"])
-					event_stream.append(Event(event))
+					self.compiler.event_stream.append(self.compiler.Event(event))
 		elif name == "question":
-			event_stream.append(Event(event))
+			self.compiler.event_stream.append(self.compiler.Event(event))
 		elif name == "bookmark_visit":
 			# This particular event only occurs in Fx3. In Fx2, it's openOneBookmark and openGroupBookmark.
 			# It's complicated to deal with -- it doesn't appear until *after* the navigation has occurred. 
@@ -897,7 +941,7 @@ class BrowserState(object):
 				# be set correctly. Just look for a recent nav event that matches, and change its cause.
 
 				matching_event = None
-				for evt in reversed(event_stream):
+				for evt in reversed(self.compiler.event_stream):
 					if seconds_between(evt, event) > 10:
 						break
 					if evt["event"] == "navigation" and evt["url"] == event["url"]:
@@ -908,176 +952,340 @@ class BrowserState(object):
 					matching_event["cause"] = "bookmark_visit"
 					# TODO: Check that it was the last nav event that occurred on the tab
 				else:
-					logger.warning("No matching nav event for bookmark_visit to " + event["url"])
+					self.compiler.logger.warning("No matching nav event for bookmark_visit to " + event["url"])
 		elif is_navigation_cause(event):
 			pass # It's been remembered as a possible navigation cause; nothing further needed
 		elif is_user_action(event):
 			self.update_active_window(event)
 		else:
-			logger.error("Unexpected event on tab %s: %s" % (tab.tabId, name))
+			self.compiler.logger.error("Unexpected event on tab %s: %s" % (tab.tabId, name))
 
-# Global variable that maintains the current known state of the browser
-browser_state = None
-log_version = None
+#-----------------------------------------------------------------------------
+# The compiler -- a state machine that consumes the low-level events
+#-----------------------------------------------------------------------------
 
-def AppClosed(events):
-	logger.debug("Entering state 'AppClosed'")
+class Compiler(object):
+	"""Compiles low-level tlogger log files to a higher-level representation.
+	
+	All of the state for a compile is kept in the Compiler instance, so 
+	separate instances can be used concurrently (e.g. from a thread pool).
+	An instance can be reused for any number of compiles, one at a time.
 	
-	global browser_state
-	browser_state = None
-
-	while True:
-		event = events.next()
-		name = event["event"]
-
-		if name == "LOG_OPEN":
-			event_stream.append(Event(event, "browser_start", {}))
-			global log_version
-			log_version = int(event["version"])
-			return AppStartup
+	"""
+	def __init__(self):
+		self.browser_state = None # The current known state of the browser
+		self.event_stream = None
+		self.logger = None
+		self.log_version = None
+		self.skipped = [] # The parts of the log skipped by a recovering compile
+		self._session_start_line = None
+		self._skipping_to_session = False
+		self.line_count = 0 # The number of lines read by the last compile
+
+	def _assert(self, condition, msg=""):
+		if not condition:
+			self.logger.error(msg)
+
+	def Event(self, orig_event, name=None, keys=None, **kwargs):
+		"""Create a new event; see _event_data()."""
+		data = _event_data(orig_event, name, keys, **kwargs)
+		self._assert("time" in data, "Event must have a time")
+		return data
+
+	def AppClosed(self, events):
+		self.logger.debug("Entering state 'AppClosed'")
+
+		self.browser_state = None
+		self._session_start_line = None # Not in a session until the next LOG_OPEN
+
+		while True:
+			if self._skipping_to_session:
+				# A compile with a start time can begin partway through a
+				# session; skip quietly to the start of the next one
+				events.skip_to_event("LOG_OPEN")
+			event = events.next()
+			name = event["event"]
+
+			if name == "LOG_OPEN":
+				self._skipping_to_session = False
+				self._session_start_line = events.current_line_number
+				self.event_stream.append(self.Event(event, "browser_start", {}))
+				self.log_version = int(event["version"])
+				return self.AppStartup
+			elif not self._skipping_to_session:
+				self.logger.warning("Unexpected event: " + name)
+
+	def AppStartup(self, events):
+		# TODO: Watch for other hints that the startup is complete (e.g. time)
+
+		self.logger.debug("Entering state 'AppStartup'")
+
+		browser_state = self.browser_state = BrowserState(self)
+		event_stream = self.event_stream
+		logger = self.logger
+
+		is_session_restore = False
+
+		# window_onload should always be the first event we see in this state
+		name = events.peek()["event"]
+		if name != "window_onload":
+			logger.warning("Expected window_onload as first event, got '%s'" % name)
+
+		next_state = None
+		while next_state is None:
+			# Peek at the events without consuming them.
+			# The event will be consumed at the end of the loop. To avoid this,
+			# use 'continue' rather than falling out of the 'if' statement.
+			event = events.peek()
+			name = event["event"]
+
+			if name == "TabRestore":
+				is_session_restore = True
+		
+			if name == "gotoHistoryIndex":
+				win = browser_state.get_window(event)
+				if win.gotohistoryindex_event is None:
+					win.gotohistoryindex_event = event
+				else:
+					logger.warning(
+						"Found >1 goToHistoryIndex on %s during startup" % win.winId)
+					browser_state.process_event(event)
+			elif name == "quit-application":
+				next_state = self.AppClosed
+				event_stream.append(self.Event(event, "browser_quit", {}))
+			elif (is_user_action(event) 
+			and name not in ["TabMove", "TabSelect", "gotoHistoryIndex"]):
+				# Those three events are excluded because they can occur during
+				# startup without being caused by the user
+				next_state = self.AppOpen
+				continue # Don't consume the event
+			elif name == "LOG_OPEN":
+				logger.info("LOG_OPEN during AppStartup: possible crash")
+				next_state = self.AppClosed
+				continue # This event will be consumed by AppClosed
+			else:
+				browser_state.process_event(event)
+
+			events.next() # Consume the event from the stream
+
+		# Ensure the events we've seen are consistent with currently open tabs
+		all_registered_tabs = browser_state.get_all_registered_tabs()
+		for tab in all_registered_tabs:
+			self._assert(tab.tab_open_event is not None, "Tab registered but no tab_open")
+			if is_session_restore and not tab.restored:
+				logger.warning("No TabRestore for " + tab.tabId)
+
+		# Find all the events emitted during this startup
+		startup_events = None
+		for i, event in enumerate(reversed(event_stream)):
+			if event["event"] == "browser_start":
+				startup_events = event_stream[-i:]
+				break
+		self._assert(startup_events is not None, "browser_start event not found")
+		
+		# The first window never has any particular cause
+		if startup_events[0]["event"] == "window_open":
+			startup_events[0]["cause"] = "default"
 		else:
-			logger.warning("Unexpected event: " + name)
+			logger.error("found %s instead of window_open event" % startup_events[0]["event"])
 
-def AppStartup(events):
-	# TODO: Watch for other hints that the startup is complete (e.g. time)
+		if is_session_restore:	
+			# All other events were caused by the session restore
+			for event in startup_events[2:]:
+				event["cause"] = "restore"
 
-	logger.debug("Entering state 'AppStartup'")
+		if len(all_registered_tabs) > 1 and not is_session_restore:
+			logger.warning("> 1 tab opened during AppStartup, but not restoring")
 
-	global browser_state
-	browser_state = BrowserState()
+		return next_state
 
-	is_session_restore = False
+	def AppOpen(self, events):
+		self.logger.debug("Entering state 'AppOpen'")
 
-	# window_onload should always be the first event we see in this state
-	name = events.peek()["event"]
-	if name != "window_onload":
-		logger.warning("Expected window_onload as first event, got '%s'" % name)
+		browser_state = self.browser_state
 
-	next_state = None
-	while next_state is None:
-		# Peek at the events without consuming them.
-		# The event will be consumed at the end of the loop. To avoid this,
-		# use 'continue' rather than falling out of the 'if' statement.
-		event = events.peek()
-		name = event["event"]
+		next_state = None
+		while next_state is None:
+			event = events.peek()
+			name = event["event"]
 
-		if name == "TabRestore":
-			is_session_restore = True
-	
-		if name == "gotoHistoryIndex":
-			win = browser_state.get_window(event)
-			if win.gotohistoryindex_event is None:
-				win.gotohistoryindex_event = event
+			if name == "LOG_OPEN":
+				self.logger.info("LOG_OPEN during AppOpen: possible crash")
+				next_state = self.AppClosed
+				continue # Don't consume the event
+			elif name == "quit-application":
+				self.event_stream.append(self.Event(event, "browser_quit", {}))
+				next_state = self.AppClosed
 			else:
-				logger.warning(
-					"Found >1 goToHistoryIndex on %s during startup" % win.winId)
 				browser_state.process_event(event)
-		elif name == "quit-application":
-			next_state = AppClosed
-			event_stream.append(Event(event, "browser_quit", {}))
-		elif (is_user_action(event) 
-		and name not in ["TabMove", "TabSelect", "gotoHistoryIndex"]):
-			# Those three events are excluded because they can occur during
-			# startup without being caused by the user
-			next_state = AppOpen
-			continue # Don't consume the event
-		elif name == "LOG_OPEN":
-			logger.info("LOG_OPEN during AppStartup: possible crash")
-			next_state = AppClosed
-			continue # This event will be consumed by AppClosed
+			
+			events.next()
+		return next_state
+
+	def progress(self):
+		"""Return (lines read, events compiled) for the compile that's running,
+		or (0, 0) if there isn't one. This can be called from another thread,
+		e.g. to report on a long compile."""
+		logger, event_stream = self.logger, self.event_stream
+		if logger is None or event_stream is None:
+			return 0, 0
+		return logger._it.current_line_number, len(event_stream)
+
+	def _run(self, path, event_stream, logger_class, pipelined=False, start_time=None,
+		end_time=None, recover=False):
+		"""Run the log file at 'path' through the state machine, appending the
+		compiled events to event_stream. Errors are raised, unless recover is
+		true (see _recover). Afterwards, line_count is the number of lines read."""
+
+		self.line_count = 0
+		if pipelined:
+			iterator_class = tlogger.PipelinedLogIterator
+		else:
+			iterator_class = tlogger.LogIterator
+		event_iterator = iterator_class(path, 
+			start_time=start_time, end_time=end_time)
+
+		self.event_stream = event_stream
+		self.logger = logger_class(event_iterator)
+		self.log_version = None
+		self.skipped = []
+		self._session_start_line = None
+		self._skipping_to_session = start_time is not None
+
+		next_state = self.AppClosed # Initial state
+		try:
+			while True:
+				try:
+					while True:
+						next_state = next_state(event_iterator)
+				except StopIteration:
+					break
+				except Exception, ex:
+					if not recover:
+						raise
+					self._recover(event_iterator, ex)
+					next_state = self.AppClosed
+		finally:
+			self.line_count = event_iterator.current_line_number
+			event_iterator.close()
+
+	def check(self, path, pipelined=False, start_time=None, end_time=None):
+		"""Run the log file at 'path' through the compiler, with all of its
+		checks, but without keeping the output. See the module-level check()."""
+
+		result = CheckResult()
+		try:
+			self._run(path, _SessionEventStream(), CountingLogger, pipelined, start_time,
+				end_time)
+		except Exception, ex:
+			result.error = _error_message(ex)
+		if self.logger is not None: # None if the log couldn't be opened
+			result.counts = self.logger.counts
+		result.line_count = self.line_count
+		self.event_stream = None
+		self.browser_state = None
+		self.logger = None
+		return result
+
+	def _recover(self, events, ex):
+		"""Discard the events from the session where an error occurred (if it
+		was in a session), skip to the start of the next session, and record
+		what was skipped."""
+		error_line = events.current_line_number
+		if self._session_start_line is not None:
+			for i in xrange(len(self.event_stream) - 1, -1, -1):
+				if self.event_stream[i]["event"] == "browser_start":
+					del self.event_stream[i:]
+					break
+			start_line = self._session_start_line
 		else:
-			browser_state.process_event(event)
+			start_line = error_line
+		start_offset = events.line_offset(start_line)
+		resume_line = events.skip_to_event("LOG_OPEN")
+		if resume_line is None:
+			end_offset = None if start_offset is None else os.path.getsize(events.current_filename)
+		else:
+			end_offset = events.line_offset(resume_line)
+		error = _error_message(ex)
 
-		events.next() # Consume the event from the stream
+		skip = {"error": error, "error_line": error_line, "start_line": start_line,
+			"end_line": resume_line, "start_offset": start_offset, "end_offset": end_offset}
+		self.skipped.append(skip)
+		self.logger.warning("Skipped lines %s-%s (bytes %s-%s) after error on line %d: %s" % (
+			start_line, resume_line or "end", start_offset, end_offset, error_line, error))
+		self._session_start_line = None
 
-	# Ensure the events we've seen are consistent with currently open tabs
-	all_registered_tabs = browser_state.get_all_registered_tabs()
-	for tab in all_registered_tabs:
-		_assert(tab.tab_open_event is not None, "Tab registered but no tab_open")
-		if is_session_restore and not tab.restored:
-			logger.warning("No TabRestore for " + tab.tabId)
+	def compile(self, path, debug, pipelined=False, start_time=None, end_time=None,
+		recover=False):
+		"""Compile the log file at 'path'. See the module-level compile()."""
 
-	# Find all the events emitted during this startup
-	startup_events = None
-	for i, event in enumerate(reversed(event_stream)):
+		try:
+			self._run(path, [], MyLogger, pipelined, start_time, end_time, recover)
+		except Exception, ex:
+			if self.logger is not None: # None if the log couldn't be opened
+				self.logger._print_error(ex.message)
+			if debug:
+				traceback.print_exc()
+				exc_class, exc, tb = sys.exc_info()
+				pdb.post_mortem(tb)
+			else:
+				raise
+			# Signal the error by returning None
+			return None
+		finally:
+			result = self.event_stream
+			self.event_stream = None
+			self.browser_state = None
+			self.logger = None
+		return result
+
+class _SessionEventStream(list):
+	"""The event stream for Compiler.check(). The compiler looks back at the
+	events of the current session, so those are kept, but the events of
+	earlier sessions are dropped."""
+
+	def append(self, event):
 		if event["event"] == "browser_start":
-			startup_events = event_stream[-i:]
-			break
-	_assert(startup_events is not None, "browser_start event not found")
-	
-	# The first window never has any particular cause
-	if startup_events[0]["event"] == "window_open":
-		startup_events[0]["cause"] = "default"
-	else:
-		logger.error("found %s instead of window_open event" % startup_events[0]["event"])
+			del self[:]
+		list.append(self, event)
 
-	if is_session_restore:	
-		# All other events were caused by the session restore
-		for event in startup_events[2:]:
-			event["cause"] = "restore"
+class CheckResult(object):
+	"""The result of check(). error is the error that stopped the compile (or
+	None if it passed); counts maps (level, message category) pairs to the
+	number of messages of that kind."""
 
-	if len(all_registered_tabs) > 1 and not is_session_restore:
-		logger.warning("> 1 tab opened during AppStartup, but not restoring")
-
-	return next_state
+	def __init__(self):
+		self.error = None
+		self.counts = {}
+		self.line_count = 0
 
-def AppOpen(events):
-	logger.debug("Entering state 'AppOpen'")
+	@property
+	def passed(self):
+		return self.error is None
 
-	next_state = None
-	while next_state is None:
-		event = events.peek()
-		name = event["event"]
+def check(path, pipelined=False, start_time=None, end_time=None):
+	"""
+	Check that a low-level tlogger log file compiles, without keeping the
+	compiled events or writing them out. This is faster than compile(), and
+	only uses as much memory as the longest session. Returns a CheckResult.
 
-		if name == "LOG_OPEN":
-			logger.info("LOG_OPEN during AppOpen: possible crash")
-			next_state = AppClosed
-			continue # Don't consume the event
-		elif name == "quit-application":
-			event_stream.append(Event(event, "browser_quit", {}))
-			next_state = AppClosed
-		else:
-			browser_state.process_event(event)
-		
-		events.next()
-	return next_state
+	"""
+	return Compiler().check(path, pipelined, start_time, end_time)
 
-def compile(path, debug):
+def compile(path, debug, pipelined=False, start_time=None, end_time=None,
+	recover=False):
 	"""
 	Compile a low-level tlogger log file to a higher-level representation.
 	
 	debug -- Drop to the Python debugger (pdb) on an unhandled exception
+	pipelined -- Read and decode the log file on a separate thread
+	start_time -- Only compile the events at or after this time (in millis)
+	end_time -- Only compile the events at or before this time (in millis)
+	recover -- After an error, drop the events from that session and carry on
+		from the next one (see Compiler.skipped for what was skipped)
 
 	"""
-
-	event_iterator = tlogger.LogIterator(path)
-
-	global event_stream, logger
-	event_stream = []
-	logger = MyLogger(event_iterator)
-
-	next_state = AppClosed # Initial state
-	try:
-		while True: 
-			next_state = next_state(event_iterator)
-	except StopIteration:
-		pass
-	except Exception, ex:
-		logger._print_error(ex.message)
-		if debug:
-			traceback.print_exc()
-			exc_class, exc, tb = sys.exc_info()
-			pdb.post_mortem(tb)
-		else:
-			raise
-		# Signal the error by returning None
-		return None
-	finally:
-		result = event_stream
-		event_stream = None
-		if logger:
-			logger.cleanup()
-	return result
+	return Compiler().compile(path, debug, pipelined, start_time, end_time, recover)
 	
 def write_to_file(events, f):
 	for event in events:
@@ -1090,20 +1298,65 @@ def write_to_file(events, f):
 			json_output = json.dumps(event)
 		f.write("%s %s\n" % (timestamp, json_output))
 
-def main(input_filename, output_filename=None, debug=False):
+def _print_check(filename, result):
+	if result.passed:
+		print "PASS %s (%d lines)" % (filename, result.line_count)
+	else:
+		print "FAIL %s (line %d): %s" % (filename, result.line_count, result.error)
+	items = sorted(result.counts.items(), key=lambda item: (-item[1], item[0]))
+	for (level, category), count in items:
+		print "%8d %-7s %s" % (count, level, category)
+	if not result.passed:
+		sys.exit(1)
+
+def main(input_filename, output_filename=None, debug=False, pipelined=False,
+	start_time=None, end_time=None, binary=False, follow=False, check=False,
+	recover=False):
 	"""
 	Compile a low-level tlogger log file to a higher-level representation.
 	
 	debug -- Drop to the Python debugger (pdb) on an unhandled exception
+	pipelined -- Read and decode the log file on a separate thread
+	start_time -- Only compile the events at or after this time (in millis)
+	end_time -- Only compile the events at or before this time (in millis)
+	binary -- Write the output in the binary format (see tlogger.binlog)
+	follow -- Keep compiling new events as they're written to the log, until interrupted
+	check -- Only check that the log compiles, and print the number of warnings of each kind
+	recover -- After an error, skip to the next session rather than stopping
 	"""
+	if start_time is not None:
+		start_time = int(start_time)
+	if end_time is not None:
+		end_time = int(end_time)
+	if binary and not output_filename:
+		raise simpleopt.ArgumentError("--binary requires an output file")
+	if follow and (binary or pipelined or start_time is not None or end_time is not None):
+		raise simpleopt.ArgumentError("--follow can't be used with --binary, --pipelined, or a time range")
+	if check:
+		if output_filename or binary or follow:
+			raise simpleopt.ArgumentError("--check doesn't write any output")
+		result = Compiler().check(input_filename, pipelined, start_time, end_time)
+		_print_check(input_filename, result)
+		return
+
 	if output_filename:
-		output_file = open(output_filename, "w")
+		output_file = open(output_filename, "wb" if binary else "w")
 	else:
 		output_file = sys.stdout
 
 	try:
-		events = compile(input_filename, debug)
-		write_to_file(events, output_file)
+		if follow:
+			import follow as follow_module
+			try:
+				follow_module.follow(input_filename, output_file, debug)
+			except KeyboardInterrupt:
+				pass
+			return
+		events = compile(input_filename, debug, pipelined, start_time, end_time, recover)
+		if binary:
+			binlog.write_binary(events, output_file)
+		else:
+			write_to_file(events, output_file)
 	finally:
 		if output_file is not sys.stdout:
 			output_file.close()
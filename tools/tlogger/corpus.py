@@ -0,0 +1,394 @@
+#! /user/bin/env python
+
+"""
+Compile all the logs in a directory tree, in a way that can be stopped and
+started again.
+
+Every log found under the input directory is compiled (with
+compile.compile()) to the same relative path under the output directory,
+with ".txt" appended. A manifest (manifest.json in the output directory,
+by default) records what happened to each input: its size, MD5 hash,
+status, the wall time and peak memory of the compile, the number of
+events, and the output path. With --recover, a log that lost some
+sessions has the status "recovered", and its record lists the parts that
+were skipped (see compile.Compiler.skipped). The manifest is rewritten
+after each log, so if the run dies partway through, running it again
+picks up where it left off: inputs that compiled (or were recovered) and
+haven't changed since (same size, and same mtime or the same hash) are
+skipped.
+
+Each log is compiled in a fresh worker process, so that the peak memory
+recorded for it is its own. The largest logs are started first, which
+keeps a few huge logs from holding up the end of the run when there are
+several workers. The progress (bytes/sec, events/sec and the estimated
+time remaining) is printed to stderr as each log finishes, and every ten
+seconds while logs are running, along with how far each of them has got.
+
+By default, the logs are the files named extstore.dat (or a compressed
+extstore.dat.gz etc.); the other files in the same directories, such as
+focus.dat, aren't browsing logs.
+
+To compile a corpus with four workers:
+
+	python -m tlogger.corpus logs/ compiled/ --workers=4
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import fnmatch
+import hashlib
+import multiprocessing
+import os
+import Queue
+import resource
+import signal
+import sys
+import threading
+import time
+
+# Get a JSON library. Prefer cjson if it's installed (much faster),
+# but fall back to json (if Python >= 2.6) or simplejson
+try:
+	import cjson as json
+except ImportError:
+	try:
+		import json
+	except ImportError:
+		import simplejson as json
+
+import compile
+
+__all__ = ["Manifest", "find_logs", "file_hash", "compile_corpus"]
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+_DEFAULT_PATTERN = "extstore.dat*"
+_REPORT_SECS = 1 # How often each worker sends the progress of its log
+_PROGRESS_SECS = 10 # How often the progress of the running logs is printed
+
+def file_hash(path):
+	"""Return the MD5 hash (in hex) of a file's contents."""
+	md5 = hashlib.md5()
+	f = open(path, "rb")
+	try:
+		while True:
+			data = f.read(_HASH_BLOCK_SIZE)
+			if not data:
+				break
+			md5.update(data)
+	finally:
+		f.close()
+	return md5.hexdigest()
+
+def find_logs(input_dir, pattern=_DEFAULT_PATTERN, exclude=None):
+	"""Return the paths (relative to input_dir) of the files under it whose
+	names match pattern. The directory exclude (if any) isn't searched."""
+	if exclude is not None:
+		exclude = os.path.realpath(exclude)
+	result = []
+	for dirpath, dirnames, filenames in os.walk(input_dir):
+		dirnames[:] = [d for d in dirnames
+			if os.path.realpath(os.path.join(dirpath, d)) != exclude]
+		for name in fnmatch.filter(filenames, pattern):
+			result.append(os.path.relpath(os.path.join(dirpath, name), input_dir))
+	return sorted(result)
+
+class Manifest(object):
+	"""The record of each input in a corpus run, kept in a JSON file. Each
+	record is a dict with the keys size, mtime, hash, status ("ok",
+	"recovered" or "failed"), error, skipped (the parts of the log that
+	were skipped, for a recovered log), wall_time (seconds), peak_memory
+	(KB), events and output."""
+
+	def __init__(self, path):
+		self.path = path
+		self.records = {}
+		if os.path.exists(path):
+			f = open(path)
+			try:
+				data = f.read()
+			finally:
+				f.close()
+			if json.__name__ == "cjson":
+				self.records = json.decode(data)
+			else:
+				self.records = json.loads(data)
+
+	def save(self):
+		"""Write the manifest out. The old one is only replaced once the new
+		one has been completely written."""
+		if json.__name__ == "cjson":
+			data = json.encode(self.records)
+		else:
+			data = json.dumps(self.records, indent=1, sort_keys=True)
+		temp_path = self.path + ".tmp"
+		f = open(temp_path, "w")
+		try:
+			f.write(data)
+		finally:
+			f.close()
+		os.rename(temp_path, self.path)
+
+	def is_current(self, name, path):
+		"""Return True if the input called name (at path) compiled (or was
+		recovered) last time, and hasn't changed since. The file is only
+		hashed if its mtime has changed."""
+		record = self.records.get(name)
+		if (record is None or record["status"] not in ("ok", "recovered")
+		or not os.path.exists(record["output"])):
+			return False
+		st = os.stat(path)
+		if st.st_size != record["size"]:
+			return False
+		if st.st_mtime != record["mtime"]:
+			if file_hash(path) != record["hash"]:
+				return False
+			record["mtime"] = st.st_mtime
+		return True
+
+_progress_queue = None # In a worker, where to send the progress of its log
+
+def _init_worker(progress_queue):
+	global _progress_queue
+	_progress_queue = progress_queue
+	# Let the main process handle Ctrl-C, and terminate the workers
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _report_progress(name, compiler, done):
+	"""Send (name, lines read, events compiled) to the main process every
+	_REPORT_SECS, until done is set."""
+	while not done.wait(_REPORT_SECS):
+		lines, events = compiler.progress()
+		_progress_queue.put((name, lines, events))
+
+def _compile_one(args):
+	"""Compile one log in a worker process, and return its manifest record."""
+	name, input_path, output_path, recover = args
+	st = os.stat(input_path)
+	record = {"size": st.st_size, "mtime": st.st_mtime, "hash": file_hash(input_path),
+		"output": output_path, "status": "ok", "error": None, "skipped": [], "events": 0}
+	start = time.time()
+	compiler = compile.Compiler()
+	done = threading.Event()
+	reporter = threading.Thread(target=_report_progress, args=(name, compiler, done))
+	reporter.daemon = True
+	reporter.start()
+	try:
+		try:
+			events = compiler.compile(input_path, False, recover=recover)
+		finally:
+			done.set()
+			reporter.join()
+		output_dir = os.path.dirname(output_path)
+		if output_dir and not os.path.isdir(output_dir):
+			try:
+				os.makedirs(output_dir)
+			except OSError:
+				if not os.path.isdir(output_dir): # Another worker may have made it
+					raise
+		temp_path = output_path + ".tmp"
+		f = open(temp_path, "w")
+		try:
+			compile.write_to_file(events, f)
+		finally:
+			f.close()
+		os.rename(temp_path, output_path)
+		record["events"] = len(events)
+		if len(compiler.skipped) > 0:
+			record["status"] = "recovered"
+			record["skipped"] = compiler.skipped
+	except Exception, ex:
+		record["status"] = "failed"
+		record["error"] = "%s: %s" % (ex.__class__.__name__, ex)
+	record["wall_time"] = time.time() - start
+	record["peak_memory"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return name, record
+
+def _format_bytes(count):
+	for unit in ["B", "KB", "MB", "GB"]:
+		if count < 1024:
+			break
+		count /= 1024.0
+	return "%.1f %s" % (count, unit)
+
+def _format_secs(secs):
+	secs = int(secs)
+	return "%d:%02d:%02d" % (secs / 3600, secs / 60 % 60, secs % 60)
+
+class _Progress(object):
+	"""Prints a line of progress to a file as each log finishes, and every
+	_PROGRESS_SECS while logs are running."""
+
+	def __init__(self, total_count, total_bytes, out):
+		self.total_count = total_count
+		self.total_bytes = total_bytes
+		self.out = out
+		self.start = time.time()
+		self.last_print = self.start
+		self.count = 0
+		self.bytes = 0
+		self.events = 0
+		self.running = {} # name -> (lines read, events compiled) so far
+		self.finished = set()
+
+	def _summary(self):
+		elapsed = max(time.time() - self.start, 0.001)
+		byte_rate = self.bytes / elapsed
+		events = self.events + sum([events for lines, events in self.running.values()])
+		eta = "?"
+		if byte_rate > 0:
+			eta = _format_secs((self.total_bytes - self.bytes) / byte_rate)
+		return "[%d/%d] %s of %s, %s/s, %d events/s, ETA %s" % (
+			self.count, self.total_count, _format_bytes(self.bytes),
+			_format_bytes(self.total_bytes), _format_bytes(byte_rate), events / elapsed, eta)
+
+	def poll(self, queue):
+		"""Read the progress sent by the workers (see _report_progress), and
+		print it if it's time to."""
+		while True:
+			try:
+				name, lines, events = queue.get_nowait()
+			except Queue.Empty:
+				break
+			if name not in self.finished: # It may arrive after the result
+				self.running[name] = (lines, events)
+		if not self.running or time.time() - self.last_print < _PROGRESS_SECS:
+			return
+		running = ["%s at line %d (%d events)" % (name, lines, events)
+			for name, (lines, events) in sorted(self.running.items())]
+		self.out.write("%s - running %s\n" % (self._summary(), ", ".join(running)))
+		self.out.flush()
+		self.last_print = time.time()
+
+	def update(self, name, record):
+		self.count += 1
+		self.running.pop(name, None)
+		self.finished.add(name)
+		if record["status"] != "failed":
+			self.bytes += record["size"]
+			self.events += record["events"]
+		else:
+			# A failed log usually stops early, so it would skew the rates
+			self.total_bytes -= record["size"]
+		if record["status"] == "ok":
+			status = "ok"
+		elif record["status"] == "recovered":
+			status = "recovered (%d skipped)" % len(record["skipped"])
+		else:
+			status = "FAILED (%s)" % record["error"]
+		self.out.write("%s - %s %s (%.1fs, %s)\n" % (self._summary(), name, status,
+			record["wall_time"], _format_bytes(record["peak_memory"] * 1024)))
+		self.out.flush()
+		self.last_print = time.time()
+
+def compile_corpus(input_dir, output_dir, manifest_path=None, pattern=_DEFAULT_PATTERN,
+	workers=1, recover=False, force=False, progress_file=sys.stderr):
+	"""
+	Compile the logs under input_dir to output_dir, skipping the ones that
+	the manifest says are already done (unless force is true). Returns the
+	Manifest.
+
+	pattern - the logs are the files whose names match this (by default,
+		extstore.dat, compressed or not)
+	workers - the number of logs to compile at once
+	recover - skip the sessions with errors, rather than failing the whole log
+		(see compile.compile())
+
+	"""
+	if manifest_path is None:
+		manifest_path = os.path.join(output_dir, "manifest.json")
+	if not os.path.isdir(output_dir):
+		os.makedirs(output_dir)
+	manifest = Manifest(manifest_path)
+
+	tasks = []
+	skipped = 0
+	for name in find_logs(input_dir, pattern, exclude=output_dir):
+		input_path = os.path.join(input_dir, name)
+		if not force and manifest.is_current(name, input_path):
+			skipped += 1
+			continue
+		output_path = os.path.join(output_dir, name + ".txt")
+		tasks.append((os.path.getsize(input_path), (name, input_path, output_path, recover)))
+	# Largest first, so the long compiles aren't left until the end
+	tasks.sort(key=lambda task: task[0], reverse=True)
+
+	if skipped:
+		manifest.save() # is_current() may have updated some mtimes
+		progress_file.write("Skipping %d logs that are already compiled\n" % skipped)
+	progress = _Progress(len(tasks), sum([size for size, args in tasks]), progress_file)
+
+	# A new process for each log, so its peak memory can be measured
+	progress_queue = multiprocessing.Queue()
+	pool = multiprocessing.Pool(workers, _init_worker, (progress_queue,), maxtasksperchild=1)
+	try:
+		results = pool.imap_unordered(_compile_one, [args for size, args in tasks])
+		while True:
+			try:
+				# With a timeout, so that Ctrl-C isn't blocked while waiting
+				name, record = results.next(1.0)
+			except multiprocessing.TimeoutError:
+				progress.poll(progress_queue)
+				continue
+			except StopIteration:
+				break
+			manifest.records[name] = record
+			manifest.save()
+			progress.update(name, record)
+		pool.close()
+	except KeyboardInterrupt:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+	return manifest
+
+def main(input_dir, output_dir, manifest_filename=None, pattern=_DEFAULT_PATTERN, workers=1,
+	recover=False, force=False):
+	"""
+	Compile all the low-level tlogger log files under a directory, skipping
+	the ones that were already compiled by an earlier run.
+
+	manifest_filename -- Where to keep the record of each log (default: manifest.json in output_dir)
+	pattern -- The file names of the logs to compile
+	workers -- The number of logs to compile at once
+	recover -- After an error, skip to the next session rather than failing the log
+	force -- Compile every log, even the ones that are already done
+	"""
+	try:
+		manifest = compile_corpus(input_dir, output_dir, manifest_filename, pattern, workers,
+			recover, force)
+	except KeyboardInterrupt:
+		sys.stderr.write("Interrupted; run again to carry on from here\n")
+		sys.exit(1)
+	for name, record in sorted(manifest.records.iteritems()):
+		for skip in record.get("skipped") or []:
+			print "RECOVERED %s: skipped lines %s-%s (bytes %s-%s): %s" % (name,
+				skip["start_line"], skip["end_line"] or "end", skip["start_offset"],
+				skip["end_offset"], skip["error"])
+	failed = [name for name, record in manifest.records.iteritems()
+		if record["status"] == "failed"]
+	for name in sorted(failed):
+		print "FAILED %s: %s" % (name, manifest.records[name]["error"])
+	if failed:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
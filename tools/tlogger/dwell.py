@@ -0,0 +1,268 @@
+#! /user/bin/env python
+
+"""
+Work out how long the user actually spent looking at each page.
+
+A page is only counted as visible while its tab is the selected tab in its
+window, and (with use_focus) while the window has the focus, according to
+focus.dat (see focus.py). The time while the user is inactive can also be
+excluded.
+page_views() goes through a stream of compiled events (merged with the
+focus events) once, in time order, and returns a record for each page view
+(i.e. each navigation in a tab) when it ends:
+
+	events = focus.merge_focus(compile.compile(path, False), focus_path)
+	for view in page_views(events, use_focus=True):
+		print view["url"], view["dwell_secs"]
+
+Since the events are in time order, the visible intervals of each tab are
+intersected with the focus intervals of its window as they go by, and only
+the state of the open windows and tabs is kept in memory.
+
+To print the total time spent on each URL, or each host:
+
+	python -m tlogger.dwell compiled.txt --focus_filename=focus.dat
+	python -m tlogger.dwell --by_host compiled.txt --focus_filename=focus.dat
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import tlogger
+import urls
+
+__all__ = ["page_views", "dwell_totals"]
+
+class _Window(object):
+	def __init__(self):
+		self.selected = None
+		self.visible = None # The tab that's currently counted as visible
+		self.tabs = set()
+
+class _Tab(object):
+	def __init__(self, win):
+		self.win = win
+		self.url = None
+		self.view_start = None
+		self.visible_since = None
+		self.dwell = 0
+
+class _DwellState(object):
+	"""The state of the open windows and tabs, for page_views()."""
+
+	def __init__(self, use_focus, count_idle):
+		self.use_focus = use_focus
+		self.count_idle = count_idle
+		self.windows = {}
+		self.tabs = {}
+		self.finished = [] # Page views that have ended
+
+		# The focus events can come before a window is opened, or after it's
+		# closed, so they're kept separately from the windows
+		self.focused = set()
+		self.idle = set()
+
+	def get_window(self, win_id):
+		win = self.windows.get(win_id)
+		if win is None:
+			win = self.windows[win_id] = _Window()
+		return win
+
+	def get_tab(self, tab_id, win_id):
+		tab = self.tabs.get(tab_id)
+		if tab is None:
+			tab = self.tabs[tab_id] = _Tab(win_id)
+			self.get_window(win_id).tabs.add(tab_id)
+		return tab
+
+	def update(self, win_id, time):
+		"""Update which tab in the window is visible."""
+		win = self.windows[win_id]
+		visible = None
+		if ((win_id in self.focused or not self.use_focus)
+		and (self.count_idle or win_id not in self.idle)):
+			visible = win.selected
+		if visible == win.visible:
+			return
+		tab = self.tabs.get(win.visible)
+		if tab is not None and tab.visible_since is not None:
+			tab.dwell += max(0, time - tab.visible_since)
+			tab.visible_since = None
+		tab = self.tabs.get(visible)
+		if tab is not None:
+			tab.visible_since = time
+		win.visible = visible
+
+	def end_view(self, tab_id, time):
+		tab = self.tabs[tab_id]
+		if tab.visible_since is not None:
+			tab.dwell += max(0, time - tab.visible_since)
+			tab.visible_since = time
+		if tab.url is not None:
+			self.finished.append({"time": tab.view_start, "end": time, "url": tab.url,
+				"win": tab.win, "tabId": tab_id, "dwell_secs": tab.dwell / 1000.0})
+		tab.url = None
+		tab.dwell = 0
+
+	def close_tab(self, tab_id, time):
+		self.end_view(tab_id, time)
+		tab = self.tabs.pop(tab_id)
+		win = self.windows[tab.win]
+		win.tabs.discard(tab_id)
+		if win.selected == tab_id:
+			win.selected = None
+		if win.visible == tab_id:
+			win.visible = None
+
+	def close_window(self, win_id, time):
+		for tab_id in list(self.windows[win_id].tabs):
+			self.close_tab(tab_id, time)
+		del self.windows[win_id]
+
+	def close_all(self, time):
+		for win_id in sorted(self.windows.keys()):
+			self.close_window(win_id, time)
+
+def page_views(events, use_focus=False, count_idle=False):
+	"""Iterate over the page views in a stream of compiled events, as dicts
+	with "time" and "end" (the start and end of the view), "url", "win",
+	"tabId", and "dwell_secs" (the number of seconds it was visible).
+
+	use_focus - only count the time when the window had the focus. The
+		events must include the focus events (see focus.merge_focus), or
+		no page is ever visible. Otherwise, the selected tab in every
+		window counts as visible.
+	count_idle - also count the time when the user was inactive
+
+	"""
+	state = _DwellState(use_focus, count_idle)
+	last_time = None
+	for event in events:
+		name = event["event"]
+		event_time = event["time"]
+
+		# The events aren't always in strict time order (e.g. navigations have
+		# the time the page started loading), so changes in visibility are
+		# applied at the latest time seen so far
+		if last_time is None or event_time > last_time:
+			time = event_time
+		else:
+			time = last_time
+		win_id = event.get("win")
+		tab_id = event.get("tabId")
+
+		if name == "browser_start":
+			# If the browser wasn't quit cleanly, the pages were last seen
+			# at the time of the previous event
+			if last_time is not None:
+				state.close_all(last_time)
+		elif name == "browser_quit":
+			state.close_all(time)
+		elif name == "window_close":
+			if win_id in state.windows:
+				state.close_window(win_id, time)
+		elif name == "tab_close":
+			if tab_id in state.tabs:
+				state.close_tab(tab_id, time)
+				state.update(win_id, time)
+		elif win_id is not None:
+			win = state.get_window(win_id)
+			if name == "tab_open":
+				state.get_tab(tab_id, win_id)
+				# The first tab in a window is selected without a tab_select
+				if win.selected is None:
+					win.selected = tab_id
+			elif name == "tab_select":
+				state.get_tab(tab_id, win_id)
+				win.selected = tab_id
+			elif name == "navigation":
+				tab = state.get_tab(tab_id, win_id)
+				state.end_view(tab_id, time)
+				tab.url = event.get("url")
+				tab.view_start = event_time
+			elif name == "window_focus":
+				state.focused.add(win_id)
+			elif name == "window_blur":
+				state.focused.discard(win_id)
+			elif name == "window_inactive":
+				state.idle.add(win_id)
+			elif name == "window_active":
+				state.idle.discard(win_id)
+			state.update(win_id, time)
+
+		last_time = time
+		if len(state.finished) > 0:
+			for view in state.finished:
+				yield view
+			del state.finished[:]
+
+	if last_time is not None:
+		state.close_all(last_time)
+		for view in state.finished:
+			yield view
+
+def dwell_totals(views, decomposer=None):
+	"""Return two dicts, with the total number of seconds spent on each URL
+	and on each host, for a sequence of page views."""
+	if decomposer is None:
+		decomposer = urls.URLDecomposer()
+	url_totals = {}
+	for view in views:
+		url = view["url"]
+		url_totals[url] = url_totals.get(url, 0) + view["dwell_secs"]
+	host_totals = {}
+	for url, secs in url_totals.iteritems():
+		host = decomposer.host(url)
+		if host is not None:
+			host_totals[host] = host_totals.get(host, 0) + secs
+	return (url_totals, host_totals)
+
+def main(input_filename, focus_filename=None, by_host=False, count=20,
+	count_idle=False, raw=False):
+	"""
+	Print the URLs (or hosts) that the user spent the most time on.
+
+	focus_filename -- The user's focus.dat; otherwise, the selected tab in every window counts as visible
+	by_host -- Print the time spent on each host, rather than each URL
+	count -- The number of URLs or hosts to print (0 for all of them)
+	count_idle -- Also count the time when the user was inactive
+	raw -- The input is a raw log file, which is compiled first
+	"""
+	import compile
+	import focus
+
+	if raw:
+		events = compile.compile(input_filename, False)
+	else:
+		events = tlogger.LogIterator(input_filename)
+	if focus_filename:
+		events = focus.merge_focus(events, focus_filename)
+	views = page_views(events, use_focus=bool(focus_filename), count_idle=count_idle)
+	url_totals, host_totals = dwell_totals(views)
+
+	totals = host_totals if by_host else url_totals
+	items = sorted(totals.iteritems(), key=lambda item: (-item[1], item[0]))
+	if count > 0:
+		items = items[:count]
+	for key, secs in items:
+		print "%10.1f %s" % (secs, key.encode("utf-8"))
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
@@ -0,0 +1,185 @@
+#! /user/bin/env python
+
+"""
+Read the window focus log (focus.dat) written by the tlogger extension, and
+merge it into a compiled event stream.
+
+Each line of focus.dat is written by one browser window, and looks like:
+
+	1226282384020 W0 focus 505 560 488
+
+i.e. a timestamp, the window id, and the kind of line (focus, blur, active
+or inactive), followed by the number of millis between each tick of a timer
+that runs while the window has the focus. A blur line has the time of the
+last tick. Active and inactive lines mark when the user stopped and started
+using the window again; the ticks after them carry on from the previous tick.
+
+FocusLogIterator turns these into events like those in a compiled log:
+window_focus, window_blur, window_inactive and window_active. If a window
+never got a blur (e.g. the browser crashed), a window_blur is inferred at
+the time of its last tick, and has "inferred": true.
+
+To merge the focus events into a compiled log:
+
+	python -m tlogger.focus compiled.txt focus.dat -o merged.txt
+
+or into the output of the compiler, without writing it out first:
+
+	python -m tlogger.focus --raw extstore.dat focus.dat -o merged.txt
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import collections
+import sys
+
+import tlogger
+
+__all__ = ["FocusLogIterator", "merge_focus"]
+
+_EVENT_NAMES = {
+	"focus": "window_focus",
+	"blur": "window_blur",
+	"active": "window_active",
+	"inactive": "window_inactive"
+}
+
+class FocusLogIterator(object):
+	"""Iterates over the events in a focus.dat file, in time order. Lines
+	that can't be parsed (e.g. ones that were only partly written) are
+	skipped."""
+
+	def __init__(self, filename):
+		self._f = tlogger._open_log(filename)
+		self._f_iter = iter(self._f)
+		self._line_count = 0
+		self._skipped_lines = 0
+		self._pending = collections.deque()
+		self._focused = {} # The focus time and last tick time of focused windows
+		self._done = False
+
+	def __iter__(self):
+		return self
+
+	@property
+	def current_line_number(self):
+		return self._line_count
+
+	@property
+	def skipped_lines(self):
+		"""The number of lines so far that couldn't be parsed."""
+		return self._skipped_lines
+
+	def close(self):
+		"""It's only necessary to call this method if you don't finish iterating
+		with this object."""
+		self._f.close()
+		self._f_iter = iter(())
+
+	def next(self):
+		while len(self._pending) == 0:
+			if self._done:
+				raise StopIteration
+			try:
+				line = self._f_iter.next()
+			except StopIteration:
+				# Any windows that still have the focus lost it at their last tick
+				self._done = True
+				for win in sorted(self._focused.keys()):
+					self._blur(win, None)
+				self.close()
+				continue
+			self._line_count += 1
+			self._parse(line)
+		return self._pending.popleft()
+
+	def _blur(self, win, time):
+		# If time is None, the blur is inferred from the last tick
+		focus_time, last_tick = self._focused.pop(win)
+		event = {"time": max(focus_time, last_tick if time is None else time),
+			"event": "window_blur", "win": win}
+		if time is None:
+			event["inferred"] = True
+		self._pending.append(event)
+
+	def _parse(self, line):
+		parts = line.split()
+		if len(parts) == 0:
+			return # The file starts with a newline
+		try:
+			time = int(parts[0])
+			win = parts[1]
+			name = _EVENT_NAMES[parts[2]]
+			ticks = sum([int(tick) for tick in parts[3:]])
+		except (IndexError, KeyError, ValueError):
+			self._skipped_lines += 1
+			return
+
+		if name == "window_focus":
+			# Only one window has the focus at a time. If another one (or a
+			# window with the same id from an earlier session) still has it,
+			# the blur was lost.
+			for other in sorted(self._focused.keys()):
+				state = self._focused[other]
+				state[1] = min(state[1], time)
+				self._blur(other, None)
+			self._focused[win] = [time, time + ticks]
+		elif name == "window_blur":
+			if win not in self._focused:
+				return # Already inferred
+			self._blur(win, time)
+			return
+		elif win in self._focused:
+			if name == "window_inactive":
+				self._focused[win][1] = time + ticks
+			else:
+				self._focused[win][1] += ticks
+		self._pending.append({"time": time, "event": name, "win": win})
+
+def merge_focus(events, focus_filename):
+	"""Merge the events from the focus log into the given stream of compiled
+	events, in time order."""
+	return tlogger.merge_events(events, FocusLogIterator(focus_filename))
+
+def main(input_filename, focus_filename, output_filename=None, raw=False):
+	"""
+	Merge the window focus events from focus.dat into a compiled log.
+
+	raw -- The input is a raw log file, which is compiled first
+	"""
+	import compile
+
+	if raw:
+		events = compile.compile(input_filename, False)
+	else:
+		events = tlogger.LogIterator(input_filename)
+	if output_filename:
+		output_file = open(output_filename, "w")
+	else:
+		output_file = sys.stdout
+	try:
+		compile.write_to_file(merge_focus(events, focus_filename), output_file)
+	finally:
+		if output_file is not sys.stdout:
+			output_file.close()
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
@@ -0,0 +1,298 @@
+#! /user/bin/env python
+
+"""
+Compile a log file while it's being written, like "tail -f".
+
+FollowCompiler runs the same state machine as compile.Compiler, but it
+reads the log with a FollowingLogIterator, which waits for more lines to be
+appended when it gets to the end of the file, rather than stopping. Only
+complete lines are parsed; a partly written line is kept until the rest of
+it arrives. The file is polled (with os.fstat) a few times a second, which
+uses hardly any CPU while nothing is happening.
+
+The compiled events are written out once they're final. A few events are
+changed after they're emitted by the compiler: the causes of the events in
+a startup are only known once the startup is over, and a bookmark_visit
+can change the cause of a navigation up to 10 seconds before it. So the
+events from a startup are held until it's over, and other events are
+written once the log is more than 10 seconds past them. When the file
+hasn't grown for a second, everything else is written, except for the
+navigations in the last 10 seconds of the log (and the events after them,
+to keep the order).
+
+To follow a log:
+
+	python -m tlogger.follow extstore.dat -o compiled.txt
+	python -m tlogger.compile --follow extstore.dat
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import collections
+import os
+import pdb
+import sys
+import time
+import traceback
+
+import tlogger
+import compile
+
+__all__ = ["FollowingLogIterator", "FollowCompiler", "follow"]
+
+# How far (in millis) the log has to be past an event before it's final
+SETTLE_MILLIS = 10 * 1000
+
+_READ_SIZE = 64 * 1024
+
+class FollowingLogIterator(object):
+	"""Iterates over the events in a log file that's still being written.
+	When there are no more complete lines, it polls the file every
+	poll_interval seconds until there are.
+
+	on_idle - optional function called (once) when the file hasn't grown for
+		idle_delay seconds
+	on_event - optional function called with the time of each event, as
+		it's returned by next()
+	idle_exit - stop iterating when the file hasn't grown for this many
+		seconds (by default, never stop)
+
+	"""
+	def __init__(self, filename, poll_interval=0.25, idle_delay=1.0, idle_exit=None,
+		on_idle=None, on_event=None):
+		self._filename = filename
+		self._fd = os.open(filename, os.O_RDONLY)
+		self._position = 0
+		self._partial = ""
+		self._lines = collections.deque()
+		self._lookahead = collections.deque()
+		self._line_count = 0
+
+		self.poll_interval = poll_interval
+		self.idle_delay = idle_delay
+		self.idle_exit = idle_exit
+		self._on_idle = on_idle
+		self._on_event = on_event
+
+	def __iter__(self):
+		return self
+
+	@property
+	def current_line_number(self):
+		return self._line_count
+
+	def close(self):
+		if self._fd is not None:
+			os.close(self._fd)
+			self._fd = None
+
+	def next(self):
+		if len(self._lookahead) > 0:
+			event = self._lookahead.popleft()
+		else:
+			event = self._next_impl()
+		if self._on_event is not None and "time" in event:
+			self._on_event(event["time"])
+		return event
+
+	def peek(self, index=0):
+		"""As for LogIterator.peek(), but waits for more events if necessary."""
+		while len(self._lookahead) <= index:
+			self._lookahead.append(self._next_impl())
+		return self._lookahead[index]
+
+	def _next_impl(self):
+		while True:
+			while len(self._lines) == 0:
+				self._wait_for_lines()
+			line = self._lines.popleft()
+			self._line_count += 1
+			if len(line.strip()) == 0:
+				continue
+			try:
+				event = tlogger._parse_line(line)
+			except tlogger._ParseError, e:
+				self.close()
+				raise Exception("Line %s - %s" % (self._line_count, e))
+			return event
+
+	def _read_lines(self):
+		"""Read whatever has been appended to the file, and return True if
+		there were any new complete lines."""
+		if self._fd is None:
+			raise StopIteration
+		if os.fstat(self._fd).st_size < self._position:
+			raise Exception("%s was truncated while it was being followed" % self._filename)
+		data = os.read(self._fd, _READ_SIZE)
+		if len(data) == 0:
+			return False
+		self._position += len(data)
+		lines = (self._partial + data).split("\n")
+		self._partial = lines.pop() # Not a complete line (yet), or empty
+		self._lines.extend(lines)
+		return len(lines) > 0
+
+	def _wait_for_lines(self):
+		idle_since = None
+		idle_called = False
+		while not self._read_lines():
+			now = time.time()
+			if idle_since is None:
+				idle_since = now
+			elif (not idle_called and self._on_idle is not None
+			and now - idle_since >= self.idle_delay):
+				self._on_idle()
+				idle_called = True
+			if self.idle_exit is not None and now - idle_since >= self.idle_exit:
+				self.close()
+				raise StopIteration
+			time.sleep(self.poll_interval)
+
+class FollowCompiler(compile.Compiler):
+	"""A Compiler that writes the compiled events to a file as soon as they
+	are final, rather than returning them all at the end."""
+
+	def __init__(self, output_file):
+		compile.Compiler.__init__(self)
+		self.output_file = output_file
+		self._in_startup = False
+		self._last_flush_time = None
+		self._last_event_time = None
+
+	def AppStartup(self, events):
+		self._in_startup = True
+		try:
+			return compile.Compiler.AppStartup(self, events)
+		finally:
+			self._in_startup = False
+
+	def flush(self, before=None, final=False, hold_navigations=None):
+		"""Write out the events that are final: all of them, or only the ones
+		before the given time. The events of a startup that isn't over yet
+		aren't written unless final is true. If hold_navigations is given,
+		the first navigation at or after that time, and the events after it,
+		aren't written."""
+		stream = self.event_stream
+		if stream is None:
+			return
+		count = len(stream)
+		if self._in_startup and not final:
+			for i in xrange(len(stream) - 1, -1, -1):
+				if stream[i]["event"] == "browser_start":
+					count = i
+					break
+		if before is not None:
+			i = 0
+			while i < count and stream[i]["time"] < before:
+				i += 1
+			count = i
+		if hold_navigations is not None:
+			for i in xrange(count):
+				if stream[i]["event"] == "navigation" and stream[i]["time"] >= hold_navigations:
+					count = i
+					break
+		if count > 0:
+			compile.write_to_file(stream[:count], self.output_file)
+			self.output_file.flush()
+			del stream[:count]
+
+	def _on_idle(self):
+		# A bookmark_visit can still change the cause of a navigation that's
+		# within SETTLE_MILLIS of the end of the log, so hold those back
+		if self._last_event_time is not None:
+			self.flush(hold_navigations=self._last_event_time - SETTLE_MILLIS)
+
+	def _on_event(self, time):
+		self._last_event_time = max(time, self._last_event_time)
+		# The events after this one in the log are later, so they can't change
+		# the events that are more than SETTLE_MILLIS earlier. Check about once
+		# a second (of log time).
+		if self._last_flush_time is None or time - self._last_flush_time >= 1000:
+			self._last_flush_time = time
+			self.flush(before=time - SETTLE_MILLIS)
+
+	def follow(self, path, debug=False, poll_interval=0.25, idle_delay=1.0,
+		idle_exit=None):
+		"""Compile the log file at path, and keep compiling the events that are
+		added to it until idle_exit seconds go by without any (or forever)."""
+		event_iterator = FollowingLogIterator(path, poll_interval, idle_delay, idle_exit,
+			on_idle=self._on_idle, on_event=self._on_event)
+
+		self.event_stream = []
+		self.logger = compile.MyLogger(event_iterator)
+		self.log_version = None
+		self._last_flush_time = None
+		self._last_event_time = None
+
+		next_state = self.AppClosed # Initial state
+		try:
+			try:
+				while True:
+					next_state = next_state(event_iterator)
+			except StopIteration:
+				pass
+			except Exception, ex:
+				self.logger._print_error(str(ex))
+				if debug:
+					traceback.print_exc()
+					exc_class, exc, tb = sys.exc_info()
+					pdb.post_mortem(tb)
+				else:
+					raise
+		finally:
+			self.flush(final=True)
+			event_iterator.close()
+			self.event_stream = None
+			self.browser_state = None
+			self.logger = None
+
+def follow(path, output_file, debug=False, poll_interval=0.25, idle_delay=1.0,
+	idle_exit=None):
+	"""Compile the log file at path as it's written, writing the compiled
+	events to output_file. See FollowCompiler.follow()."""
+	FollowCompiler(output_file).follow(path, debug, poll_interval, idle_delay, idle_exit)
+
+def main(input_filename, output_filename=None, debug=False, poll_interval=0.25,
+	idle_delay=1.0, idle_exit=0.0):
+	"""
+	Compile a low-level tlogger log file as it's written (until interrupted).
+
+	debug -- Drop to the Python debugger (pdb) on an unhandled exception
+	poll_interval -- The number of seconds between checks for new lines
+	idle_delay -- Write out all the events once there are no new lines for this many seconds
+	idle_exit -- Stop once there are no new lines for this many seconds (0 means never)
+	"""
+	if output_filename:
+		output_file = open(output_filename, "w")
+	else:
+		output_file = sys.stdout
+	try:
+		try:
+			follow(input_filename, output_file, debug, poll_interval, idle_delay,
+				idle_exit or None)
+		except KeyboardInterrupt:
+			pass
+	finally:
+		if output_file is not sys.stdout:
+			output_file.close()
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
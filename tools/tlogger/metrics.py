@@ -0,0 +1,425 @@
+#! /user/bin/env python
+
+"""
+Standard per-session metrics for compiled tlogger logs, computed with NumPy.
+
+The compiled events are converted once into an EventTable: a few columnar
+arrays, holding only what the metrics need (one row per session, per
+navigation, and per change in the number of tabs). The metrics are then
+computed with vectorized operations over the whole table, rather than a
+Python loop over every event:
+
+	table = EventTable.from_events(compile.compile(path, False))
+	print session_table(table)
+	counts, cause_names = causes_by_session(table)
+
+An EventTable can be saved (with NumPy's .npz format) and loaded again, so a
+large corpus only needs to be converted once:
+
+	python -m tlogger.metrics compiled.txt --save=compiled.npz
+	python -m tlogger.metrics compiled.npz
+
+This module requires NumPy (http://numpy.scipy.org/).
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import sys
+
+# NumPy is only needed by this module, so the rest of the package works
+# without it
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+import tlogger
+
+__all__ = ["EventTable", "session_table", "tab_count_series", "causes_by_session",
+	"navigation_intervals", "secs_since_cause_histogram", "history_distance_counts"]
+
+# The kinds of rows in the tab table
+TAB_OPEN, TAB_CLOSE, WINDOW_CLOSE = 0, 1, 2
+
+# Causes of navigations that use the back/forward history
+_HISTORY_CAUSES = ("OnHistoryGoBack", "BrowserForward", "gotoHistoryIndex")
+
+_MISSING = -1 # For integer columns where the value is not present
+
+def _require_numpy():
+	if numpy is None:
+		raise Exception("tlogger.metrics requires NumPy")
+
+def _flush(lists, chunks, dtypes):
+	"""Convert the lists of column values to arrays, append them to the lists
+	of chunks, and clear them."""
+	for name, values in lists.iteritems():
+		chunks[name].append(numpy.array(values, dtype=dtypes[name]))
+		del values[:]
+
+def _concatenate(chunks, dtypes):
+	result = {}
+	for name, arrays in chunks.iteritems():
+		if len(arrays) > 0:
+			result[name] = numpy.concatenate(arrays)
+		else:
+			result[name] = numpy.zeros(0, dtype=dtypes[name])
+	return result
+
+_SESSION_DTYPES = {"start": "i8", "end": "i8", "clean_quit": "?", "events": "i8"}
+_NAV_DTYPES = {"time": "i8", "session": "i4", "cause": "i2",
+	"secs_since_cause": "f8", "back_distance": "i4", "forward_distance": "i4"}
+_TAB_DTYPES = {"time": "i8", "session": "i4", "win": "i4", "kind": "i1",
+	"tab_count": "i4"}
+
+class EventTable(object):
+	"""Columnar arrays built from a stream of compiled events.
+
+	sessions - dict of arrays with one entry per session (browser_start to
+		browser_quit): "start", "end", "clean_quit", and "events"
+	navigations - dict of arrays with one entry per navigation: "time",
+		"session", "cause" (an index into cause_names), "secs_since_cause"
+		(NaN if not present), "back_distance" and "forward_distance" (-1 if
+		not present)
+	tabs - dict of arrays with one entry per tab_open, tab_close and
+		window_close: "time", "session", "win" (an id for the window), "kind"
+		(TAB_OPEN, TAB_CLOSE or WINDOW_CLOSE), and "tab_count" (the number of
+		tabs in the window afterwards)
+	cause_names - list of the distinct navigation causes
+
+	"""
+	def __init__(self, sessions, navigations, tabs, cause_names):
+		self.sessions = sessions
+		self.navigations = navigations
+		self.tabs = tabs
+		self.cause_names = cause_names
+
+	@property
+	def session_count(self):
+		return len(self.sessions["start"])
+
+	@classmethod
+	def from_events(cls, events, chunk_size=1000000):
+		"""Build a table from a stream of compiled events. The columns are
+		accumulated in lists of up to chunk_size values, so that memory use
+		stays close to the size of the final arrays."""
+		_require_numpy()
+
+		session_lists = dict([(name, []) for name in _SESSION_DTYPES])
+		nav_lists = dict([(name, []) for name in _NAV_DTYPES])
+		tab_lists = dict([(name, []) for name in _TAB_DTYPES])
+		session_chunks = dict([(name, []) for name in _SESSION_DTYPES])
+		nav_chunks = dict([(name, []) for name in _NAV_DTYPES])
+		tab_chunks = dict([(name, []) for name in _TAB_DTYPES])
+
+		cause_ids = {}
+		cause_names = []
+		win_ids = {}
+		nan = float("nan")
+
+		# Local names for the lists, since this loop runs once per event
+		nav_time, nav_session, nav_cause = (nav_lists["time"],
+			nav_lists["session"], nav_lists["cause"])
+		nav_secs, nav_back, nav_fwd = (nav_lists["secs_since_cause"],
+			nav_lists["back_distance"], nav_lists["forward_distance"])
+		tab_time, tab_session, tab_win, tab_kind, tab_count = (tab_lists["time"],
+			tab_lists["session"], tab_lists["win"], tab_lists["kind"],
+			tab_lists["tab_count"])
+
+		session = -1
+		session_start = session_end = None # session_start is None between sessions
+		session_events = 0
+
+		def end_session(clean_quit):
+			session_lists["start"].append(session_start)
+			session_lists["end"].append(session_end)
+			session_lists["clean_quit"].append(clean_quit)
+			session_lists["events"].append(session_events)
+
+		for event in events:
+			name = event["event"]
+			time = event["time"]
+			if name == "browser_start" or session_start is None:
+				if session_start is not None:
+					end_session(False)
+				session += 1
+				session_start = time
+				session_events = 0
+			session_end = time
+			session_events += 1
+
+			if name == "navigation":
+				cause = event.get("cause")
+				cause_id = cause_ids.get(cause)
+				if cause_id is None:
+					cause_id = cause_ids[cause] = len(cause_names)
+					cause_names.append(cause)
+				nav_time.append(time)
+				nav_session.append(session)
+				nav_cause.append(cause_id)
+				nav_secs.append(event.get("secs_since_cause", nan))
+				nav_back.append(event.get("back_distance", _MISSING))
+				nav_fwd.append(event.get("forward_distance", _MISSING))
+				if len(nav_time) >= chunk_size:
+					_flush(nav_lists, nav_chunks, _NAV_DTYPES)
+			elif name in ("tab_open", "tab_close", "window_close"):
+				win = event.get("win")
+				win_id = win_ids.get(win)
+				if win_id is None:
+					win_id = win_ids[win] = len(win_ids)
+				tab_time.append(time)
+				tab_session.append(session)
+				tab_win.append(win_id)
+				if name == "window_close":
+					tab_kind.append(WINDOW_CLOSE)
+					tab_count.append(0)
+				else:
+					tab_kind.append(TAB_OPEN if name == "tab_open" else TAB_CLOSE)
+					tab_count.append(event.get("tab_count", _MISSING))
+				if len(tab_time) >= chunk_size:
+					_flush(tab_lists, tab_chunks, _TAB_DTYPES)
+			elif name == "browser_quit":
+				end_session(True)
+				session_start = None
+
+			if len(session_lists["start"]) >= chunk_size:
+				_flush(session_lists, session_chunks, _SESSION_DTYPES)
+
+		if session_start is not None:
+			end_session(False)
+		_flush(session_lists, session_chunks, _SESSION_DTYPES)
+		_flush(nav_lists, nav_chunks, _NAV_DTYPES)
+		_flush(tab_lists, tab_chunks, _TAB_DTYPES)
+
+		return cls(_concatenate(session_chunks, _SESSION_DTYPES),
+			_concatenate(nav_chunks, _NAV_DTYPES),
+			_concatenate(tab_chunks, _TAB_DTYPES), cause_names)
+
+	def save(self, filename):
+		"""Save the table in NumPy's .npz format."""
+		arrays = {"cause_names": numpy.array([(name or "").encode("utf-8")
+			for name in self.cause_names], dtype="S")}
+		for prefix, columns in (("session_", self.sessions),
+		("nav_", self.navigations), ("tab_", self.tabs)):
+			for name, array in columns.iteritems():
+				arrays[prefix + name] = array
+		numpy.savez(filename, **arrays)
+
+	@classmethod
+	def load(cls, filename):
+		"""Load a table that was written by save()."""
+		_require_numpy()
+		data = numpy.load(filename)
+		try:
+			columns = ({}, {}, {})
+			for key in data.files:
+				for prefix, table in zip(("session_", "nav_", "tab_"), columns):
+					if key.startswith(prefix):
+						table[key[len(prefix):]] = data[key]
+			cause_names = [name.decode("utf-8") for name in data["cause_names"]]
+		finally:
+			data.close()
+		return cls(columns[0], columns[1], columns[2], cause_names)
+
+#-----------------------------------------------------------------------------
+# Metrics
+#-----------------------------------------------------------------------------
+
+def _group_median(values, groups, group_count):
+	"""Return the median of the values in each group (NaN for empty groups)."""
+	order = numpy.lexsort((values, groups))
+	values = values[order]
+	counts = numpy.bincount(groups, minlength=group_count)
+	starts = numpy.cumsum(counts) - counts
+	result = numpy.empty(group_count)
+	result.fill(numpy.nan)
+	has_values = counts > 0
+	lower = starts + (counts - 1) // 2
+	upper = starts + counts // 2
+	result[has_values] = (values[lower[has_values]] + values[upper[has_values]]) / 2.0
+	return result
+
+def tab_count_series(table):
+	"""Return the total number of open tabs (in all windows) over time, as
+	arrays (session, time, tab_count), with an entry for each time the number
+	changed. The compiled events only give the number of tabs in one window,
+	so the total is the sum of the changes in each window."""
+	tabs = table.tabs
+	session, win, count = tabs["session"], tabs["win"], tabs["tab_count"]
+	if len(count) == 0:
+		return (session, tabs["time"], count)
+	count = numpy.where(count < 0, 0, count)
+
+	# Find the previous count in the same window (windows ids can be reused
+	# by later sessions, so group by session too)
+	order = numpy.lexsort((numpy.arange(len(win)), win, session))
+	sorted_count = count[order]
+	previous = numpy.zeros(len(order), dtype=count.dtype)
+	same_group = ((session[order][1:] == session[order][:-1])
+		& (win[order][1:] == win[order][:-1]))
+	previous[1:][same_group] = sorted_count[:-1][same_group]
+	delta = numpy.empty(len(order), dtype=numpy.int64)
+	delta[order] = sorted_count - previous
+
+	# The running total, starting again at zero for each session
+	total = numpy.cumsum(delta)
+	first = numpy.ones(len(session), dtype=bool)
+	first[1:] = session[1:] != session[:-1]
+	before_session = (total - delta)[first]
+	total -= numpy.repeat(before_session, numpy.diff(numpy.append(
+		numpy.flatnonzero(first), len(session))))
+	return (session, tabs["time"], total)
+
+def causes_by_session(table):
+	"""Return a (session_count x cause_count) array of the number of
+	navigations with each cause, and the list of cause names."""
+	navs = table.navigations
+	causes = len(table.cause_names)
+	counts = numpy.bincount(navs["session"].astype(numpy.int64) * causes + navs["cause"],
+		minlength=table.session_count * causes)
+	return (counts.reshape((table.session_count, causes)), table.cause_names)
+
+def navigation_intervals(table):
+	"""Return the number of seconds between consecutive navigations in the
+	same session, as arrays (session, seconds)."""
+	navs = table.navigations
+	order = numpy.lexsort((navs["time"], navs["session"]))
+	session = navs["session"][order]
+	time = navs["time"][order]
+	same_session = session[1:] == session[:-1]
+	return (session[1:][same_session], (time[1:] - time[:-1])[same_session] / 1000.0)
+
+def secs_since_cause_histogram(table, bins=None):
+	"""Return a (cause_count x bin_count) array counting the navigations of
+	each cause by their secs_since_cause, and the bin edges. By default, the
+	bins are spaced logarithmically from 1ms to 10000s; values outside the
+	bins are counted in the first or last bin."""
+	if bins is None:
+		bins = numpy.logspace(-3, 4, 29)
+	bins = numpy.asarray(bins, dtype=float)
+	navs = table.navigations
+	secs = navs["secs_since_cause"]
+	has_secs = ~numpy.isnan(secs)
+	bin_count = len(bins) - 1
+	index = numpy.searchsorted(bins, secs[has_secs], side="right") - 1
+	index = numpy.clip(index, 0, bin_count - 1)
+	causes = len(table.cause_names)
+	counts = numpy.bincount(navs["cause"][has_secs].astype(numpy.int64) * bin_count + index,
+		minlength=causes * bin_count)
+	return (counts.reshape((causes, bin_count)), bins)
+
+def history_distance_counts(table, max_distance=20):
+	"""Return arrays counting the navigations by their back_distance and
+	forward_distance (how far back or forward in the tab's history the URL
+	was found). Distances over max_distance are counted in the last entry."""
+	result = []
+	for key in ("back_distance", "forward_distance"):
+		distance = table.navigations[key]
+		distance = numpy.minimum(distance[distance >= 0], max_distance)
+		result.append(numpy.bincount(distance, minlength=max_distance + 1))
+	return tuple(result)
+
+SESSION_TABLE_DTYPE = [("session", "i4"), ("start_time", "i8"),
+	("duration_secs", "f8"), ("clean_quit", "?"), ("events", "i8"),
+	("navigations", "i8"), ("tabs_opened", "i8"), ("max_tabs", "i4"),
+	("mean_tabs", "f8"), ("median_nav_interval_secs", "f8"), ("back", "i8"),
+	("forward", "i8"), ("history_index", "i8")]
+
+def session_table(table):
+	"""Return a NumPy record array with one row of summary metrics for each
+	session. mean_tabs is the mean number of open tabs, weighted by time."""
+	_require_numpy()
+	n = table.session_count
+	sessions, navs, tabs = table.sessions, table.navigations, table.tabs
+	result = numpy.zeros(n, dtype=SESSION_TABLE_DTYPE).view(numpy.recarray)
+	result.session = numpy.arange(n)
+	result.start_time = sessions["start"]
+	result.duration_secs = (sessions["end"] - sessions["start"]) / 1000.0
+	result.clean_quit = sessions["clean_quit"]
+	result.events = sessions["events"]
+	result.navigations = numpy.bincount(navs["session"], minlength=n)
+	result.tabs_opened = numpy.bincount(tabs["session"][tabs["kind"] == TAB_OPEN],
+		minlength=n)
+
+	tab_session, tab_time, total = tab_count_series(table)
+	if len(total) > 0:
+		max_tabs = numpy.zeros(n, dtype=total.dtype)
+		numpy.maximum.at(max_tabs, tab_session, total)
+		result.max_tabs = max_tabs
+
+		# Each count lasts until the next change, or the end of the session
+		end = numpy.empty(len(tab_time), dtype=numpy.int64)
+		end[:-1] = tab_time[1:]
+		last = numpy.ones(len(tab_time), dtype=bool)
+		last[:-1] = tab_session[1:] != tab_session[:-1]
+		end[last] = sessions["end"][tab_session[last]]
+		weight = numpy.maximum(end - tab_time, 0).astype(float)
+		total_weight = numpy.bincount(tab_session, weights=weight, minlength=n)
+		weighted = numpy.bincount(tab_session, weights=weight * total, minlength=n)
+		with numpy.errstate(invalid="ignore", divide="ignore"):
+			result.mean_tabs = numpy.where(total_weight > 0,
+				weighted / total_weight, numpy.nan)
+	else:
+		result.mean_tabs = numpy.nan
+
+	interval_session, seconds = navigation_intervals(table)
+	result.median_nav_interval_secs = _group_median(seconds, interval_session, n)
+
+	# Causes may have "+js" appended
+	cause_base = numpy.array([(name or "").split("+")[0] for name in table.cause_names],
+		dtype=object)
+	nav_cause = cause_base[navs["cause"]]
+	for field, cause in zip(("back", "forward", "history_index"), _HISTORY_CAUSES):
+		result[field] = numpy.bincount(navs["session"][nav_cause == cause], minlength=n)
+	return result
+
+def write_table(records, f):
+	"""Write a record array to f as tab-separated text, with a header."""
+	names = records.dtype.names
+	f.write("\t".join(names) + "\n")
+	for row in records.tolist():
+		f.write("\t".join([str(value) for value in row]) + "\n")
+
+def main(input_filename, save=None, raw=False):
+	"""
+	Print a table of metrics for each session in a compiled log file (or a
+	table saved with --save).
+
+	save -- Also save the event table to this file, in NumPy's .npz format
+	raw -- The input is a raw log file, which is compiled first
+	"""
+	import compile
+
+	_require_numpy()
+	if input_filename.endswith(".npz"):
+		table = EventTable.load(input_filename)
+	else:
+		if raw:
+			events = compile.compile(input_filename, False)
+		else:
+			events = tlogger.LogIterator(input_filename)
+		table = EventTable.from_events(events)
+	if save:
+		table.save(save)
+	write_table(session_table(table), sys.stdout)
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
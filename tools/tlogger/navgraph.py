@@ -0,0 +1,235 @@
+#! /user/bin/env python
+
+"""
+Build a navigation graph (from_url -> url) from compiled logs.
+
+NavigationGraph interns each URL to an integer id, and keeps the edges in
+compact arrays: one entry for each (from_url, url, cause) triple, with the
+number of times it occurred. The entries are sorted by from_url, so the
+out-edges of each URL are stored together (i.e. in CSR form), and finding
+them is a single lookup:
+
+	graph = NavigationGraph()
+	graph.add_events(compile.compile(path, False))
+	print graph.out_degree(url), graph.top_k(url, 10)
+
+Graphs (e.g. for each session, or each user) can be merged into a bigger
+one with merge(). To print the URLs with the most distinct destinations:
+
+	python -m tlogger.navgraph compiled.txt
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import array
+import heapq
+
+import tlogger
+
+__all__ = ["NavigationGraph"]
+
+class NavigationGraph(object):
+	"""A weighted, directed graph of the navigations between URLs.
+
+	New edges are counted in a dict until there are max_pending distinct
+	ones, and are then merged into the sorted arrays. Navigations without a
+	from_url (e.g. in a new tab) are not included.
+
+	"""
+	def __init__(self, max_pending=1000000):
+		self._url_ids = {}
+		self._urls = []
+		self._cause_ids = {}
+		self._causes = []
+
+		# The edges, sorted by (source, destination, cause)
+		self._sources = array.array("i")
+		self._dests = array.array("i")
+		self._edge_causes = array.array("H")
+		self._counts = array.array("i")
+		self._offsets = None # Index of the first edge from each URL
+
+		self._pending = {} # (source, destination, cause) -> count
+		self._max_pending = max_pending
+
+	def _intern(self, url):
+		url_id = self._url_ids.get(url)
+		if url_id is None:
+			url_id = self._url_ids[url] = len(self._urls)
+			self._urls.append(url)
+		return url_id
+
+	def _intern_cause(self, cause):
+		cause_id = self._cause_ids.get(cause)
+		if cause_id is None:
+			cause_id = self._cause_ids[cause] = len(self._causes)
+			self._causes.append(cause)
+		return cause_id
+
+	def __len__(self):
+		"""The number of URLs in the graph."""
+		return len(self._urls)
+
+	@property
+	def urls(self):
+		return self._urls
+
+	def _add(self, key, count):
+		pending = self._pending
+		pending[key] = pending.get(key, 0) + count
+		if len(pending) >= self._max_pending:
+			self._compact()
+
+	def add(self, from_url, url, cause=None, count=1):
+		"""Add a navigation from from_url to url."""
+		self._add((self._intern(from_url), self._intern(url),
+			self._intern_cause(cause)), count)
+
+	def add_events(self, events):
+		"""Add all the navigation events from a stream of compiled events."""
+		for event in events:
+			if event["event"] == "navigation" and event.get("from_url"):
+				self.add(event["from_url"], event.get("url"), event.get("cause"))
+
+	def merge(self, other):
+		"""Add all the edges of another NavigationGraph to this one."""
+		url_map = [self._intern(url) for url in other._urls]
+		cause_map = [self._intern_cause(cause) for cause in other._causes]
+		for key, count in other._pending.iteritems():
+			self._add((url_map[key[0]], url_map[key[1]], cause_map[key[2]]), count)
+		for i in xrange(len(other._counts)):
+			self._add((url_map[other._sources[i]], url_map[other._dests[i]],
+				cause_map[other._edge_causes[i]]), other._counts[i])
+
+	def _compact(self):
+		"""Merge the pending edges into the sorted arrays."""
+		if len(self._pending) == 0:
+			if self._offsets is None:
+				self._build_offsets()
+			return
+		pending = sorted(self._pending.iteritems())
+		self._pending = {}
+
+		sources, dests, causes, counts = (self._sources, self._dests,
+			self._edge_causes, self._counts)
+		new_sources, new_dests = array.array("i"), array.array("i")
+		new_causes, new_counts = array.array("H"), array.array("i")
+		i, j = 0, 0
+		while i < len(counts) or j < len(pending):
+			existing = None
+			if i < len(counts):
+				existing = (sources[i], dests[i], causes[i])
+			if existing is not None and (j == len(pending) or existing < pending[j][0]):
+				key, count = existing, counts[i]
+				i += 1
+			else:
+				key, count = pending[j]
+				j += 1
+				if existing == key:
+					count += counts[i]
+					i += 1
+			new_sources.append(key[0])
+			new_dests.append(key[1])
+			new_causes.append(key[2])
+			new_counts.append(count)
+		self._sources, self._dests = new_sources, new_dests
+		self._edge_causes, self._counts = new_causes, new_counts
+		self._build_offsets()
+
+	def _build_offsets(self):
+		offsets = array.array("i", [0]) * (len(self._urls) + 1)
+		for source in self._sources:
+			offsets[source + 1] += 1
+		for i in xrange(len(self._urls)):
+			offsets[i + 1] += offsets[i]
+		self._offsets = offsets
+
+	def _edge_range(self, url):
+		"""Return the range of indices of the edges from the given URL."""
+		self._compact()
+		url_id = self._url_ids.get(url)
+		if url_id is None or url_id + 1 >= len(self._offsets):
+			return (0, 0)
+		return (self._offsets[url_id], self._offsets[url_id + 1])
+
+	def out_edges(self, url):
+		"""Return a list of (destination url, count, {cause: count}) for each
+		URL that was navigated to from the given one."""
+		start, end = self._edge_range(url)
+		edges = []
+		for i in xrange(start, end):
+			dest = self._urls[self._dests[i]]
+			cause = self._causes[self._edge_causes[i]]
+			if len(edges) > 0 and edges[-1][0] == dest:
+				edges[-1][1] += self._counts[i]
+				edges[-1][2][cause] = self._counts[i]
+			else:
+				edges.append([dest, self._counts[i], {cause: self._counts[i]}])
+		return [tuple(edge) for edge in edges]
+
+	def out_degree(self, url):
+		"""Return the number of distinct URLs navigated to from the given one."""
+		start, end = self._edge_range(url)
+		degree = 0
+		for i in xrange(start, end):
+			if i == start or self._dests[i] != self._dests[i - 1]:
+				degree += 1
+		return degree
+
+	def top_k(self, url, k):
+		"""Return the k URLs most often navigated to from the given one, as a
+		list of (url, count)."""
+		top = heapq.nlargest(k, self.out_edges(url), key=lambda edge: edge[1])
+		return [(dest, count) for dest, count, causes in top]
+
+	def hubs(self, k):
+		"""Return the k URLs with the highest out-degree, as a list of
+		(url, out-degree)."""
+		self._compact()
+		degrees = array.array("i", [0]) * len(self._urls)
+		dests, sources = self._dests, self._sources
+		for i in xrange(len(sources)):
+			if i == 0 or sources[i] != sources[i - 1] or dests[i] != dests[i - 1]:
+				degrees[sources[i]] += 1
+		top = heapq.nlargest(k, xrange(len(degrees)), key=degrees.__getitem__)
+		return [(self._urls[url_id], degrees[url_id]) for url_id in top]
+
+	def edges(self):
+		"""Iterate over all the edges, as (from_url, url, cause, count)."""
+		self._compact()
+		for i in xrange(len(self._counts)):
+			yield (self._urls[self._sources[i]], self._urls[self._dests[i]],
+				self._causes[self._edge_causes[i]], self._counts[i])
+
+def main(input_filename, count=20):
+	"""
+	Print the URLs with the most distinct destinations in a compiled log file.
+
+	count -- The number of URLs to print
+	"""
+	graph = NavigationGraph()
+	graph.add_events(tlogger.LogIterator(input_filename))
+	for url, degree in graph.hubs(count):
+		top = ", ".join(["%s (%d)" % (dest, n) for dest, n in graph.top_k(url, 3)])
+		print ("%6d %s -> %s" % (degree, url, top)).encode("utf-8")
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
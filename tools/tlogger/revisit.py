@@ -0,0 +1,251 @@
+#! /user/bin/env python
+
+"""
+Measure how often the user goes back to pages they've already visited, and
+how long it is between the visits.
+
+RevisitationStats goes through the navigation events in a compiled log once,
+keeping the time that each URL was last seen. Each navigation is either a
+first visit or a revisit; for revisits, the time since the last visit (the
+recurrence interval) is counted in a histogram with log-spaced bins. The
+counts are split by the cause of the navigation (link, back, typed,
+bookmark, reload or other):
+
+	stats = RevisitationStats()
+	stats.add_events(compile.compile(path, False))
+	print stats.revisitation_rate(), stats.histogram("back")
+
+Revisits to a URL that was still in the tab's back/forward list (i.e. the
+navigation has a back_distance or forward_distance) are also counted.
+
+To print the revisitation statistics for a compiled log:
+
+	python -m tlogger.revisit compiled.txt
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import array
+import math
+
+import tlogger
+
+__all__ = ["RevisitationStats", "cause_category", "interval_bin", "CATEGORIES"]
+
+CATEGORIES = ["link", "back", "typed", "bookmark", "reload", "other"]
+
+_CAUSE_CATEGORIES = {
+	"LINK_CLICK": "link",
+	"RIGHT_CLICK": "link",
+	"DOCUMENT_CLICK": "link",
+	"window_mousedown": "link",
+	"document_mousedown": "link",
+	"OnHistoryGoBack": "back",
+	"BrowserForward": "back",
+	"gotoHistoryIndex": "back",
+	"URLBarCommand": "typed",
+	"SearchBarSearch": "typed",
+	"RightClickSearch": "typed",
+	"openOneBookmark": "bookmark",
+	"history openURLIn": "bookmark",
+	"GoHome": "bookmark",
+	"BrowserHomeClick": "bookmark",
+	"OnHistoryReload": "reload",
+	"bookmark_visit": "bookmark"
+}
+
+# The recurrence intervals are counted in log2 bins of seconds: bin 0 is
+# less than a second, bin 1 is 1-2 seconds, bin 2 is 2-4, and so on. The
+# last bin is everything from about a year on.
+INTERVAL_BINS = 26
+
+def cause_category(cause):
+	"""Return the category (one of CATEGORIES) of a navigation cause."""
+	if cause is not None:
+		# The compiler adds "+js" to the causes of js-initiated navigations
+		cause = cause.split("+", 1)[0]
+	return _CAUSE_CATEGORIES.get(cause, "other")
+
+def interval_bin(millis):
+	"""Return the histogram bin for a recurrence interval (in millis)."""
+	secs = millis / 1000.0
+	if secs < 1:
+		return 0
+	return min(int(math.log(secs, 2)) + 1, INTERVAL_BINS - 1)
+
+def bin_start(i):
+	"""Return the shortest interval (in seconds) in the given bin."""
+	return 0 if i == 0 else 2 ** (i - 1)
+
+def _zeros(size):
+	return array.array("l", [0]) * size
+
+class RevisitationStats(object):
+	"""Revisitation counts and recurrence interval histograms for a stream of
+	navigation events, which must be in time order. Only the last visit time,
+	the number of visits and the total recurrence interval are kept for each
+	URL, so the memory used depends only on the number of distinct URLs."""
+
+	def __init__(self):
+		self._url_ids = {}
+		self._urls = []
+		self._last_seen = array.array("d")
+		self._visits = array.array("l")
+		self._interval_totals = array.array("d") # In seconds
+
+		self._histograms = dict([(category, _zeros(INTERVAL_BINS)) for category in CATEGORIES])
+		self._nav_counts = dict([(category, 0) for category in CATEGORIES])
+		self._revisit_counts = dict([(category, 0) for category in CATEGORIES])
+		self._stack_revisit_counts = dict([(category, 0) for category in CATEGORIES])
+
+	def add(self, url, time, cause=None, in_stack=False):
+		"""Count a navigation to url at the given time. in_stack means that
+		the URL was in the tab's back/forward list."""
+		category = cause_category(cause)
+		self._nav_counts[category] += 1
+		url_id = self._url_ids.get(url)
+		if url_id is None:
+			self._url_ids[url] = len(self._urls)
+			self._urls.append(url)
+			self._last_seen.append(time)
+			self._visits.append(1)
+			self._interval_totals.append(0)
+			return
+
+		interval = max(0, time - self._last_seen[url_id])
+		self._last_seen[url_id] = max(time, self._last_seen[url_id])
+		self._visits[url_id] += 1
+		self._interval_totals[url_id] += interval / 1000.0
+		self._histograms[category][interval_bin(interval)] += 1
+		self._revisit_counts[category] += 1
+		if in_stack:
+			self._stack_revisit_counts[category] += 1
+
+	def add_events(self, events):
+		"""Count all the navigation events in a stream of compiled events."""
+		for event in events:
+			if event["event"] != "navigation":
+				continue
+			url = event.get("url")
+			if not url:
+				continue
+			in_stack = ("back_distance" in event or "forward_distance" in event)
+			self.add(url, event["time"], event.get("cause"), in_stack)
+
+	def merge(self, other):
+		"""Add the counts and histograms from another RevisitationStats (e.g.
+		for another user) to this one. The per-URL counts aren't merged, since
+		the same URL in another log isn't a revisit."""
+		for category in CATEGORIES:
+			histogram = self._histograms[category]
+			other_histogram = other._histograms[category]
+			for i in xrange(INTERVAL_BINS):
+				histogram[i] += other_histogram[i]
+			self._nav_counts[category] += other._nav_counts[category]
+			self._revisit_counts[category] += other._revisit_counts[category]
+			self._stack_revisit_counts[category] += other._stack_revisit_counts[category]
+
+	def _total(self, counts, category):
+		if category is None:
+			return sum(counts.values())
+		return counts[category]
+
+	def navigations(self, category=None):
+		"""The number of navigations (with the given cause category)."""
+		return self._total(self._nav_counts, category)
+
+	def revisits(self, category=None):
+		"""The number of navigations to URLs that were visited before."""
+		return self._total(self._revisit_counts, category)
+
+	def stack_revisits(self, category=None):
+		"""The number of revisits to URLs in the tab's back/forward list."""
+		return self._total(self._stack_revisit_counts, category)
+
+	def revisitation_rate(self, category=None):
+		"""The fraction of navigations that were revisits."""
+		navigations = self.navigations(category)
+		if navigations == 0:
+			return 0.0
+		return float(self.revisits(category)) / navigations
+
+	def histogram(self, category=None):
+		"""Return the recurrence interval histogram, as a list of counts (see
+		interval_bin)."""
+		if category is not None:
+			return self._histograms[category].tolist()
+		return [sum([self._histograms[c][i] for c in CATEGORIES]) for i in xrange(INTERVAL_BINS)]
+
+	def url_stats(self):
+		"""Iterate over (url, visits, mean recurrence interval in seconds) for
+		each URL. The interval is None for URLs that were only visited once."""
+		for url_id, url in enumerate(self._urls):
+			visits = self._visits[url_id]
+			mean = None
+			if visits > 1:
+				mean = self._interval_totals[url_id] / (visits - 1)
+			yield (url, visits, mean)
+
+	def __len__(self):
+		"""The number of distinct URLs."""
+		return len(self._urls)
+
+def main(input_filename, count=10, raw=False):
+	"""
+	Print the revisitation rate and recurrence interval histogram for each
+	navigation cause in a log file, and the most revisited URLs.
+
+	count -- The number of URLs to print
+	raw -- The input is a raw log file, which is compiled first
+	"""
+	import compile
+	import heapq
+
+	if raw:
+		events = compile.compile(input_filename, False)
+	else:
+		events = tlogger.LogIterator(input_filename)
+	stats = RevisitationStats()
+	stats.add_events(events)
+
+	print "%d navigations to %d URLs, revisitation rate %.3f" % (
+		stats.navigations(), len(stats), stats.revisitation_rate())
+	print "%-10s %8s %8s %8s %6s" % ("cause", "navs", "revisits", "in_stack", "rate")
+	for category in CATEGORIES:
+		print "%-10s %8d %8d %8d %6.3f" % (category, stats.navigations(category),
+			stats.revisits(category), stats.stack_revisits(category),
+			stats.revisitation_rate(category))
+
+	print
+	print "%-10s %s" % ("interval", " ".join(["%8s" % category for category in CATEGORIES]))
+	histograms = [stats.histogram(category) for category in CATEGORIES]
+	for i in xrange(INTERVAL_BINS):
+		if sum([h[i] for h in histograms]) > 0:
+			print "%-10s %s" % (">=%ds" % bin_start(i), " ".join(["%8d" % h[i] for h in histograms]))
+
+	if count > 0:
+		print
+		top = heapq.nlargest(count, stats.url_stats(), key=lambda item: item[1])
+		for url, visits, mean in top:
+			print ("%6d %10.1f %s" % (visits, mean or 0, url)).encode("utf-8")
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
@@ -0,0 +1,406 @@
+#! /user/bin/env python
+
+"""
+A local HTTP server that answers queries about compiled logs, keeping the
+logs it has loaded in memory so that each query doesn't have to compile or
+parse a log again.
+
+Each log is loaded once (raw logs are compiled with compile.compile()) into
+a LogIndex: the JSON text of each event, plus compact arrays of the time,
+event type, session and tab of each event, and indexes by each of them.
+The indexes are kept in an LRU cache with a memory budget, and a log is
+loaded again if its file changes. The server only listens on localhost,
+and only serves the logs under its root directory.
+
+To run the server:
+
+	python -m tlogger.server --root=/path/to/logs --port=8642
+
+The queries are GET requests, and the results are JSON:
+
+	/events?log=user1/extstore.dat&start=1226282400000&end=1226286000000
+	/events?log=user1/extstore.dat&tab=T4&event=navigation&limit=100
+	/events?log=user1/extstore.dat&session=3
+	/sessions?log=user1/extstore.dat
+	/stats
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import array
+import BaseHTTPServer
+import bisect
+import collections
+import os
+import SocketServer
+import sys
+import threading
+import urlparse
+
+# Get a JSON library. Prefer cjson if it's installed (much faster),
+# but fall back to json (if Python >= 2.6) or simplejson
+try:
+	import cjson as json
+except ImportError:
+	try:
+		import json
+	except ImportError:
+		import simplejson as json
+
+import tlogger
+import compile
+
+__all__ = ["LogIndex", "LogCache", "QueryServer", "make_server"]
+
+def _encode(obj):
+	if json.__name__ == "cjson":
+		return json.encode(obj)
+	return json.dumps(obj)
+
+# The approximate overhead (in bytes) of each str in a list, for estimating
+# the size of a LogIndex
+_STRING_OVERHEAD = 48
+
+class LogIndex(object):
+	"""The events of a compiled log, indexed by time, session, tab and event
+	type. The events are kept as JSON text; the only other thing kept for
+	each event is a few numbers in arrays."""
+
+	def __init__(self, events):
+		self._json = []
+		self._times = array.array("d")
+		self._types = array.array("H")
+		self._sessions = array.array("i")
+		self._tabs = array.array("i")
+
+		self._type_names = []
+		self._type_ids = {}
+		self._tab_ids = {}
+		self._by_type = []
+		self._by_tab = []
+		self._session_starts = array.array("i") # Position of each browser_start
+		self._summaries = []
+
+		session = -1
+		summary = None
+		for position, event in enumerate(events):
+			name = event["event"]
+			if name == "browser_start" or session < 0:
+				session += 1
+				self._session_starts.append(position)
+				summary = {"session": session, "start": event["time"], "end": event["time"],
+					"events": 0, "counts": {}, "tabs": set()}
+				self._summaries.append(summary)
+
+			type_id = self._type_ids.get(name)
+			if type_id is None:
+				type_id = self._type_ids[name] = len(self._type_names)
+				self._type_names.append(name)
+				self._by_type.append(array.array("i"))
+			self._by_type[type_id].append(position)
+
+			tab_id = -1
+			if "tabId" in event:
+				tab_id = self._tab_ids.get(event["tabId"])
+				if tab_id is None:
+					tab_id = self._tab_ids[event["tabId"]] = len(self._by_tab)
+					self._by_tab.append(array.array("i"))
+				self._by_tab[tab_id].append(position)
+				summary["tabs"].add(tab_id)
+
+			self._json.append(_encode(event))
+			self._times.append(event["time"])
+			self._types.append(type_id)
+			self._sessions.append(session)
+			self._tabs.append(tab_id)
+
+			summary["end"] = max(summary["end"], event["time"])
+			summary["events"] += 1
+			summary["counts"][name] = summary["counts"].get(name, 0) + 1
+
+		for summary in self._summaries:
+			summary["tabs"] = len(summary["tabs"])
+
+		# The positions of the events, sorted by time
+		order = sorted(xrange(len(self._times)), key=self._times.__getitem__)
+		self._time_order = array.array("i", order)
+		self._sorted_times = array.array("d", [self._times[i] for i in order])
+
+		self.size = (sum([len(text) for text in self._json])
+			+ _STRING_OVERHEAD * len(self._json) + 36 * len(self._times))
+
+	def __len__(self):
+		return len(self._json)
+
+	def sessions(self):
+		"""Return a list with a summary of each session: its start and end
+		time, the number of events of each type, and the number of tabs."""
+		return self._summaries
+
+	def _candidates(self, start, end, event, tab, session):
+		"""Return the positions of the events from the most selective index
+		that applies, or None if there aren't any."""
+		candidates = []
+		if event is not None:
+			type_id = self._type_ids.get(event)
+			if type_id is None:
+				return None
+			candidates.append(self._by_type[type_id])
+		if tab is not None:
+			tab_id = self._tab_ids.get(tab)
+			if tab_id is None:
+				return None
+			candidates.append(self._by_tab[tab_id])
+		if session is not None:
+			if not 0 <= session < len(self._session_starts):
+				return None
+			first = self._session_starts[session]
+			if session + 1 < len(self._session_starts):
+				last = self._session_starts[session + 1]
+			else:
+				last = len(self._json)
+			candidates.append(xrange(first, last))
+		if start is not None or end is not None:
+			lo = 0 if start is None else bisect.bisect_left(self._sorted_times, start)
+			hi = len(self._sorted_times)
+			if end is not None:
+				hi = bisect.bisect_right(self._sorted_times, end)
+			if len(candidates) == 0 or hi - lo < min([len(c) for c in candidates]):
+				return sorted(self._time_order[lo:hi])
+		if len(candidates) == 0:
+			return xrange(len(self._json))
+		return min(candidates, key=len)
+
+	def query(self, start=None, end=None, event=None, tab=None, session=None, limit=None):
+		"""Return the JSON text of the events that match all the given
+		conditions (in the order they are in the log), up to limit of them."""
+		candidates = self._candidates(start, end, event, tab, session)
+		if candidates is None:
+			return []
+		type_id = self._type_ids.get(event)
+		tab_id = self._tab_ids.get(tab)
+		times, types, sessions, tabs = self._times, self._types, self._sessions, self._tabs
+		results = []
+		for position in candidates:
+			if limit is not None and len(results) >= limit:
+				break
+			if start is not None and times[position] < start:
+				continue
+			if end is not None and times[position] > end:
+				continue
+			if event is not None and types[position] != type_id:
+				continue
+			if tab is not None and tabs[position] != tab_id:
+				continue
+			if session is not None and sessions[position] != session:
+				continue
+			results.append(self._json[position])
+		return results
+
+class _Loading(object):
+	"""A log that one thread is loading, which other threads can wait for."""
+
+	def __init__(self):
+		self.done = threading.Event()
+		self.index = None
+		self.error = None
+
+class LogCache(object):
+	"""Loads LogIndexes on demand, and keeps the most recently used ones in
+	memory, up to a budget (in bytes). The least recently used log is
+	evicted when the budget is exceeded, but the last one loaded is always
+	kept. A log is loaded again if its file's size or mtime changes.
+
+	Logs are loaded without holding the lock, so a slow compile doesn't hold
+	up queries about other logs. If several threads ask for the same log,
+	it's only loaded once."""
+
+	def __init__(self, budget):
+		self.budget = budget
+		self._logs = collections.OrderedDict() # path -> (file stat, LogIndex)
+		self._loading = {} # (path, file stat) -> _Loading
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, path):
+		st = os.stat(path)
+		key = (st.st_size, st.st_mtime)
+		with self._lock:
+			entry = self._logs.pop(path, None)
+			if entry is not None and entry[0] == key:
+				self.hits += 1
+				self._logs[path] = entry # Now the most recently used
+				return entry[1]
+			loading = self._loading.get((path, key))
+			if loading is None:
+				self.misses += 1
+				loading = self._loading[(path, key)] = _Loading()
+				is_loader = True
+			else:
+				is_loader = False
+
+		if not is_loader:
+			loading.done.wait()
+			if loading.error is not None:
+				raise loading.error
+			return loading.index
+
+		try:
+			loading.index = LogIndex(_load_events(path))
+		except Exception, e:
+			loading.error = e
+			raise
+		finally:
+			with self._lock:
+				del self._loading[(path, key)]
+				if loading.index is not None:
+					self._logs[path] = (key, loading.index)
+					while self.total_size() > self.budget and len(self._logs) > 1:
+						self._logs.popitem(last=False)
+			loading.done.set()
+		return loading.index
+
+	def total_size(self):
+		return sum([index.size for key, index in self._logs.itervalues()])
+
+	def stats(self):
+		with self._lock:
+			return {"budget": self.budget, "size": self.total_size(), "hits": self.hits,
+				"misses": self.misses, "logs": [{"log": path, "events": len(index),
+				"size": index.size} for path, (key, index) in self._logs.iteritems()],
+				"loading": sorted([path for path, key in self._loading])}
+
+def _load_events(path):
+	"""Return the compiled events from a log file. Raw logs (which start with
+	a LOG_OPEN) are compiled first."""
+	events = tlogger.LogIterator(path)
+	try:
+		first = events.peek()
+	except StopIteration:
+		return []
+	if first["event"] == "LOG_OPEN":
+		events.close()
+		result = compile.compile(path, False)
+		if result is None:
+			raise Exception("%s could not be compiled" % path)
+		return result
+	return events
+
+class _QueryHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	def do_GET(self):
+		url = urlparse.urlparse(self.path)
+		params = dict([(k, v[-1]) for k, v in urlparse.parse_qs(url.query).items()])
+		try:
+			if url.path == "/events":
+				index = self.server.get_log(params)
+				results = index.query(_int_param(params, "start"), _int_param(params, "end"),
+					params.get("event"), params.get("tab"), _int_param(params, "session"),
+					_int_param(params, "limit", self.server.default_limit))
+				self._respond(200, "[%s]" % ",".join(results))
+			elif url.path == "/sessions":
+				index = self.server.get_log(params)
+				self._respond(200, _encode(index.sessions()))
+			elif url.path == "/stats":
+				self._respond(200, _encode(self.server.cache.stats()))
+			else:
+				self._respond(404, _encode({"error": "Unknown query: " + url.path}))
+		except _QueryError, e:
+			self._respond(400, _encode({"error": str(e)}))
+		except (IOError, OSError), e:
+			self._respond(404, _encode({"error": str(e)}))
+		except Exception, e:
+			self._respond(500, _encode({"error": str(e)}))
+
+	def _respond(self, status, body):
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		if self.server.verbose:
+			BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class _QueryError(Exception):
+	pass
+
+def _int_param(params, name, default=None):
+	value = params.get(name)
+	if value is None:
+		return default
+	try:
+		return int(value)
+	except ValueError:
+		raise _QueryError("%s must be an integer" % name)
+
+class QueryServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	"""The HTTP server. Each request is handled on its own thread."""
+
+	daemon_threads = True
+
+	def __init__(self, root, port, budget, default_limit=10000, verbose=False):
+		BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", port), _QueryHandler)
+		self.root = os.path.realpath(root)
+		self.cache = LogCache(budget)
+		self.default_limit = default_limit
+		self.verbose = verbose
+
+	def get_log(self, params):
+		"""Return the LogIndex for the log named in the query parameters. The
+		log must be under the root directory."""
+		name = params.get("log")
+		if not name:
+			raise _QueryError("No log given")
+		path = os.path.realpath(os.path.join(self.root, name))
+		if not path.startswith(os.path.join(self.root, "")):
+			raise _QueryError("The log must be under the server's root directory")
+		return self.cache.get(path)
+
+def make_server(root, port=0, budget=256 * 1024 * 1024, verbose=False):
+	"""Return a QueryServer for the logs under root, listening on localhost.
+	If port is 0, a free port is used (see server_address). Call its
+	serve_forever() method (e.g. on a thread) to start it."""
+	return QueryServer(root, port, budget, verbose=verbose)
+
+def main(root=".", port=8642, memory=256, verbose=False):
+	"""
+	Run a server on localhost that answers queries about the logs under a
+	directory, keeping the logs in memory.
+
+	root -- The directory with the logs
+	port -- The port to listen on
+	memory -- The approximate memory budget for the loaded logs, in MB
+	verbose -- Print each request
+	"""
+	server = make_server(root, port, memory * 1024 * 1024, verbose)
+	print "Serving %s on http://%s:%d/" % (server.root, server.server_address[0],
+		server.server_address[1])
+	sys.stdout.flush()
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	server.server_close()
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
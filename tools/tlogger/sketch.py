@@ -0,0 +1,436 @@
+#! /user/bin/env python
+
+"""
+Small, mergeable summaries (sketches) of the events in a compiled log, for
+aggregating over a lot of users without keeping every value.
+
+HyperLogLog estimates the number of distinct values (e.g. URLs or hosts)
+it has seen, to within about 1.6% with the default size, using 4 KB.
+QuantileSketch estimates the quantiles of a set of numbers (e.g. dwell
+times), in the style of Dunning's t-digest: it keeps a few hundred
+weighted centroids, which are smaller (so more accurate) near the ends of
+the distribution.
+
+Both can be merged with another sketch of the same kind, and written out
+as a compact string with to_string(). sketch_events() builds all the
+sketches for a log, which can be written out for each user and merged
+later:
+
+	sketches = sketch_events(compile.compile(path, False))
+	data = dumps(sketches)
+	...
+	total = loads(data)
+	merge_sketches(total, loads(other_data))
+	print total["urls"].count(), total["dwell"].quantile(0.5)
+
+To print the estimates for a log (and, with --exact, the exact values and
+the errors):
+
+	python -m tlogger.sketch --exact compiled.txt
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import array
+import hashlib
+import math
+import struct
+import zlib
+
+import tlogger
+import urls
+
+__all__ = ["HyperLogLog", "QuantileSketch", "sketch_events", "merge_sketches",
+	"dumps", "loads"]
+
+class HyperLogLog(object):
+	"""Estimates the number of distinct values added to it. It has 2**p
+	registers (one byte each), and the standard error of the estimate is
+	about 1.04 / sqrt(2**p)."""
+
+	_HEADER = "<4sB"
+	_MAGIC = "HLL1"
+
+	def __init__(self, p=12):
+		if p < 4 or p > 16:
+			raise ValueError("p must be from 4 to 16")
+		self.p = p
+		self._registers = bytearray(1 << p)
+
+	def add(self, value):
+		if isinstance(value, unicode):
+			value = value.encode("utf-8")
+		h = struct.unpack("<Q", hashlib.md5(value).digest()[:8])[0]
+		index = h >> (64 - self.p)
+		rest = (h << self.p) & 0xFFFFFFFFFFFFFFFF
+		if rest == 0:
+			rank = 64 - self.p + 1
+		else:
+			rank = 64 - rest.bit_length() + 1
+		if rank > self._registers[index]:
+			self._registers[index] = rank
+
+	def count(self):
+		"""Return the estimated number of distinct values."""
+		m = len(self._registers)
+		if m >= 128:
+			alpha = 0.7213 / (1 + 1.079 / m)
+		else:
+			alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+		total = 0.0
+		zeros = 0
+		for rank in self._registers:
+			total += 2.0 ** -rank
+			if rank == 0:
+				zeros += 1
+		estimate = alpha * m * m / total
+		# For small counts, linear counting is more accurate
+		if estimate <= 2.5 * m and zeros > 0:
+			estimate = m * math.log(float(m) / zeros)
+		return int(round(estimate))
+
+	def merge(self, other):
+		"""Add the values seen by another HyperLogLog of the same size."""
+		if other.p != self.p:
+			raise ValueError("Can't merge HyperLogLogs of different sizes")
+		registers = self._registers
+		for i, rank in enumerate(other._registers):
+			if rank > registers[i]:
+				registers[i] = rank
+
+	def to_string(self):
+		return (struct.pack(self._HEADER, self._MAGIC, self.p)
+			+ zlib.compress(str(self._registers)))
+
+	@classmethod
+	def from_string(cls, data):
+		size = struct.calcsize(cls._HEADER)
+		magic, p = struct.unpack(cls._HEADER, data[:size])
+		if magic != cls._MAGIC:
+			raise ValueError("Not a HyperLogLog")
+		sketch = cls(p)
+		sketch._registers = bytearray(zlib.decompress(data[size:]))
+		return sketch
+
+class QuantileSketch(object):
+	"""Estimates the quantiles of the numbers added to it. The numbers are
+	summarized by centroids (a mean and a weight); a centroid near quantile
+	q can have a weight of at most 4 * n * q * (1 - q) / compression, so
+	there are only a small multiple of compression of them, and the
+	estimates are most accurate near the ends of the distribution."""
+
+	_HEADER = "<4sdddI"
+	_MAGIC = "TDG1"
+
+	def __init__(self, compression=100):
+		self.compression = compression
+		self._means = []
+		self._weights = []
+		self._buffer = [] # (value, weight) pairs that haven't been merged yet
+		self._count = 0
+		self.min = None
+		self.max = None
+
+	def add(self, value, weight=1):
+		value = float(value)
+		self._buffer.append((value, weight))
+		self._count += weight
+		if self.min is None or value < self.min:
+			self.min = value
+		if self.max is None or value > self.max:
+			self.max = value
+		if len(self._buffer) >= 5 * self.compression:
+			self._compress()
+
+	def count(self):
+		"""Return the total weight of the values added."""
+		return self._count
+
+	def merge(self, other):
+		"""Add the values summarized by another QuantileSketch."""
+		other._compress()
+		if other._count == 0:
+			return
+		self._buffer.extend(zip(other._means, other._weights))
+		self._count += other._count
+		if self.min is None or other.min < self.min:
+			self.min = other.min
+		if self.max is None or other.max > self.max:
+			self.max = other.max
+		self._compress()
+
+	def _compress(self):
+		if len(self._buffer) == 0:
+			return
+		items = zip(self._means, self._weights) + self._buffer
+		items.sort()
+		self._buffer = []
+		total = float(self._count)
+		means, weights = [], []
+		before = 0 # The weight of the centroids before the current one
+		mean, weight = items[0]
+		for value, w in items[1:]:
+			q = (before + (weight + w) / 2.0) / total
+			if weight + w <= 4 * total * q * (1 - q) / self.compression:
+				weight += w
+				mean += (value - mean) * w / weight
+			else:
+				means.append(mean)
+				weights.append(weight)
+				before += weight
+				mean, weight = value, w
+		means.append(mean)
+		weights.append(weight)
+		self._means, self._weights = means, weights
+
+	def quantile(self, q):
+		"""Return the estimated value at quantile q (from 0 to 1), or None
+		if the sketch is empty."""
+		self._compress()
+		means, weights = self._means, self._weights
+		if len(means) == 0:
+			return None
+		if len(means) == 1:
+			return means[0]
+		target = q * self._count
+		# Each centroid's mean is taken to be at the middle of its weight, and
+		# the values in between are interpolated
+		center = weights[0] / 2.0
+		if target <= center:
+			return self.min + (means[0] - self.min) * target / center
+		for i in xrange(1, len(means)):
+			next_center = center + (weights[i - 1] + weights[i]) / 2.0
+			if target <= next_center:
+				fraction = (target - center) / (next_center - center)
+				return means[i - 1] + (means[i] - means[i - 1]) * fraction
+			center = next_center
+		last_weight = self._count - center
+		if last_weight <= 0:
+			return self.max
+		return means[-1] + (self.max - means[-1]) * min(1.0, (target - center) / last_weight)
+
+	def to_string(self):
+		self._compress()
+		n = len(self._means)
+		min_value = self.min if self.min is not None else float("nan")
+		max_value = self.max if self.max is not None else float("nan")
+		return (struct.pack(self._HEADER, self._MAGIC, self.compression,
+			min_value, max_value, n)
+			+ array.array("d", self._means).tostring()
+			+ array.array("d", self._weights).tostring())
+
+	@classmethod
+	def from_string(cls, data):
+		size = struct.calcsize(cls._HEADER)
+		magic, compression, min_value, max_value, n = struct.unpack(cls._HEADER, data[:size])
+		if magic != cls._MAGIC:
+			raise ValueError("Not a QuantileSketch")
+		sketch = cls(compression)
+		means = array.array("d")
+		means.fromstring(data[size:size + 8 * n])
+		weights = array.array("d")
+		weights.fromstring(data[size + 8 * n:size + 16 * n])
+		sketch._means = means.tolist()
+		sketch._weights = weights.tolist()
+		sketch._count = sum(sketch._weights)
+		if n > 0:
+			sketch.min, sketch.max = min_value, max_value
+		return sketch
+
+_KINDS = {"H": HyperLogLog, "Q": QuantileSketch}
+
+def _observe(events, decomposer, add):
+	"""Pass the events through, calling add(name, value) for each value that
+	goes in the sketch with that name."""
+	last_navs = {} # tabId -> the time of its last navigation
+	for event in events:
+		if event["event"] == "browser_start":
+			last_navs.clear()
+		elif event["event"] == "navigation":
+			url = event.get("url")
+			if url:
+				add("urls", url)
+				host = decomposer.host(url)
+				if host is not None:
+					add("hosts", host)
+			if event.get("secs_since_cause") is not None:
+				add("secs_since_cause", event["secs_since_cause"])
+			tab_id = event.get("tabId")
+			if tab_id in last_navs:
+				add("gaps", max(0, event["time"] - last_navs[tab_id]) / 1000.0)
+			last_navs[tab_id] = event["time"]
+		yield event
+
+def _observe_all(events, decomposer, use_focus, add):
+	import dwell
+
+	events = _observe(events, decomposer, add)
+	for view in dwell.page_views(events, use_focus=use_focus):
+		add("dwell", view["dwell_secs"])
+
+def sketch_events(events, decomposer=None, use_focus=False):
+	"""Build the sketches for a stream of compiled events. Returns a dict
+	with "urls" and "hosts" (HyperLogLogs of the distinct URLs and hosts
+	navigated to), and "secs_since_cause", "gaps" (the number of seconds
+	between navigations in the same tab) and "dwell" (the number of seconds
+	each page was visible; see dwell.page_views) as QuantileSketches."""
+	if decomposer is None:
+		decomposer = urls.URLDecomposer()
+	sketches = {
+		"urls": HyperLogLog(),
+		"hosts": HyperLogLog(),
+		"secs_since_cause": QuantileSketch(),
+		"gaps": QuantileSketch(),
+		"dwell": QuantileSketch()
+	}
+	_observe_all(events, decomposer, use_focus,
+		lambda name, value: sketches[name].add(value))
+	return sketches
+
+def merge_sketches(sketches, other):
+	"""Merge each sketch in the dict other into the one with the same name
+	in sketches (or add it, if there isn't one)."""
+	for name, sketch in other.iteritems():
+		if name in sketches:
+			sketches[name].merge(sketch)
+		else:
+			sketches[name] = sketch
+
+def dumps(sketches):
+	"""Return a dict of sketches as a string."""
+	parts = [struct.pack("<I", len(sketches))]
+	for name in sorted(sketches.keys()):
+		sketch = sketches[name]
+		kind = [k for k, cls in _KINDS.items() if isinstance(sketch, cls)][0]
+		data = sketch.to_string()
+		parts.append(struct.pack("<cH", kind, len(name)) + name)
+		parts.append(struct.pack("<I", len(data)) + data)
+	return "".join(parts)
+
+def loads(data):
+	"""Return the dict of sketches from the output of dumps()."""
+	sketches = {}
+	(count,) = struct.unpack("<I", data[:4])
+	pos = 4
+	for i in xrange(count):
+		kind, name_length = struct.unpack("<cH", data[pos:pos + 3])
+		pos += 3
+		name = data[pos:pos + name_length]
+		pos += name_length
+		(length,) = struct.unpack("<I", data[pos:pos + 4])
+		pos += 4
+		sketches[name] = _KINDS[kind].from_string(data[pos:pos + length])
+		pos += length
+	return sketches
+
+_QUANTILES = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+def _exact_values(events, decomposer, use_focus):
+	"""Return the exact values that the sketches estimate, for comparison."""
+	distinct = {"urls": set(), "hosts": set()}
+	values = {"secs_since_cause": [], "gaps": [], "dwell": []}
+
+	def add(name, value):
+		if name in distinct:
+			distinct[name].add(value)
+		else:
+			values[name].append(value)
+	_observe_all(events, decomposer, use_focus, add)
+	return distinct, values
+
+def _exact_quantile(values, q):
+	# Use the same interpolation as QuantileSketch, with every value a centroid
+	target = q * len(values)
+	if target <= 0.5:
+		return values[0]
+	if target >= len(values) - 0.5:
+		return values[-1]
+	i = int(math.floor(target - 0.5))
+	fraction = target - 0.5 - i
+	return values[i] + (values[i + 1] - values[i]) * fraction
+
+def main(input_filename, output_filename=None, exact=False, focus_filename=None, raw=False):
+	"""
+	Print the estimated number of distinct URLs and hosts, and quantiles of
+	secs_since_cause, the gaps between navigations, and dwell times, in a
+	log file.
+
+	output_filename -- Write the sketches to this file, to be merged later
+	exact -- Also print the exact values, and the relative error of each estimate
+	focus_filename -- The user's focus.dat, for the dwell times
+	raw -- The input is a raw log file, which is compiled first
+	"""
+	import compile
+	import focus
+
+	def read_events():
+		if raw:
+			events = compile.compile(input_filename, False)
+		else:
+			events = tlogger.LogIterator(input_filename)
+		if focus_filename:
+			events = focus.merge_focus(events, focus_filename)
+		return events
+
+	decomposer = urls.URLDecomposer()
+	use_focus = bool(focus_filename)
+	sketches = sketch_events(read_events(), decomposer, use_focus)
+	if output_filename:
+		f = open(output_filename, "wb")
+		try:
+			f.write(dumps(sketches))
+		finally:
+			f.close()
+
+	if exact:
+		distinct, values = _exact_values(read_events(), decomposer, use_focus)
+		for v in values.values():
+			v.sort()
+
+	def error(estimate, actual):
+		if actual == 0:
+			return 0.0
+		return 100.0 * (estimate - actual) / abs(actual)
+
+	for name in ["urls", "hosts"]:
+		estimate = sketches[name].count()
+		if exact:
+			actual = len(distinct[name])
+			print "%-16s distinct %10d  exact %10d  error %6.2f%%" % (name, estimate,
+				actual, error(estimate, actual))
+		else:
+			print "%-16s distinct %10d" % (name, estimate)
+	for name in ["secs_since_cause", "gaps", "dwell"]:
+		sketch = sketches[name]
+		print "%-16s count %d" % (name, sketch.count())
+		if sketch.count() == 0:
+			continue
+		for q in _QUANTILES:
+			estimate = sketch.quantile(q)
+			if exact:
+				actual = _exact_quantile(values[name], q)
+				print "  q%-5s %14.3f  exact %14.3f  error %6.2f%%" % (q, estimate,
+					actual, error(estimate, actual))
+			else:
+				print "  q%-5s %14.3f" % (q, estimate)
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
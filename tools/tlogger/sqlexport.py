@@ -0,0 +1,373 @@
+#! /user/bin/env python
+
+"""
+Export compiled tlogger logs to an SQLite database.
+
+The database has a normalized schema, with one table each for users,
+sessions (browser_start to browser_quit), windows, tabs, navigations, and
+other tab events (tab_select, tab_move, load, etc.). Logs from any number of
+users can be loaded into the same database:
+
+	python -m tlogger.sqlexport study.db user1/extstore.dat user2/extstore.dat
+
+or from Python:
+
+	exporter = SQLiteExporter("study.db")
+	for user, path in logs:
+		exporter.add_log(compile.compile(path, False), user)
+	exporter.close()
+
+Rows are inserted in batches with executemany, one transaction per log, and
+the indexes are only built by close(), after all the data has been loaded.
+
+The logs table records the path of each log that was loaded, so running
+the export again skips the logs that are already in the database. If a
+log fails to compile, the error is reported and the rest are still loaded.
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import os
+import sqlite3
+import sys
+
+# Get a JSON library. Prefer cjson if it's installed (it's about 10x faster),
+# but fall back to json (if Python >= 2.6) or simplejson
+try:
+	import cjson as json
+except ImportError:
+	try:
+		import json
+	except ImportError:
+		import simplejson as json
+
+import compile
+
+__all__ = ["SQLiteExporter", "export"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+	id INTEGER PRIMARY KEY,
+	name TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS logs (
+	id INTEGER PRIMARY KEY,
+	user_id INTEGER NOT NULL REFERENCES users(id),
+	path TEXT NOT NULL,
+	UNIQUE (user_id, path)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+	id INTEGER PRIMARY KEY,
+	user_id INTEGER NOT NULL REFERENCES users(id),
+	start_time INTEGER,
+	end_time INTEGER,
+	clean_quit INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS windows (
+	id INTEGER PRIMARY KEY,
+	session_id INTEGER NOT NULL REFERENCES sessions(id),
+	win TEXT NOT NULL,
+	open_time INTEGER,
+	close_time INTEGER,
+	cause TEXT
+);
+CREATE TABLE IF NOT EXISTS tabs (
+	id INTEGER PRIMARY KEY,
+	session_id INTEGER NOT NULL REFERENCES sessions(id),
+	window_id INTEGER REFERENCES windows(id),
+	tab TEXT NOT NULL,
+	open_time INTEGER,
+	close_time INTEGER,
+	cause TEXT
+);
+CREATE TABLE IF NOT EXISTS navigations (
+	id INTEGER PRIMARY KEY,
+	tab_id INTEGER REFERENCES tabs(id),
+	time INTEGER NOT NULL,
+	url TEXT,
+	from_url TEXT,
+	original_url TEXT,
+	cause TEXT,
+	location_changed INTEGER,
+	secs_since_cause REAL,
+	back_distance INTEGER,
+	forward_distance INTEGER,
+	match_index INTEGER
+);
+CREATE TABLE IF NOT EXISTS tab_events (
+	id INTEGER PRIMARY KEY,
+	session_id INTEGER NOT NULL REFERENCES sessions(id),
+	tab_id INTEGER REFERENCES tabs(id),
+	time INTEGER NOT NULL,
+	event TEXT NOT NULL,
+	tab_index INTEGER,
+	tab_count INTEGER,
+	url TEXT,
+	data TEXT
+);
+"""
+
+_INDEXES = [
+	"CREATE INDEX IF NOT EXISTS sessions_user ON sessions(user_id, start_time)",
+	"CREATE INDEX IF NOT EXISTS windows_session ON windows(session_id)",
+	"CREATE INDEX IF NOT EXISTS tabs_session ON tabs(session_id)",
+	"CREATE INDEX IF NOT EXISTS tabs_window ON tabs(window_id)",
+	"CREATE INDEX IF NOT EXISTS navigations_tab ON navigations(tab_id, time)",
+	"CREATE INDEX IF NOT EXISTS navigations_url ON navigations(url)",
+	"CREATE INDEX IF NOT EXISTS tab_events_tab ON tab_events(tab_id, time)",
+	"CREATE INDEX IF NOT EXISTS tab_events_session ON tab_events(session_id, time)",
+]
+
+_INSERT = {
+	"sessions": "INSERT INTO sessions VALUES (?, ?, ?, ?, ?)",
+	"windows": "INSERT INTO windows VALUES (?, ?, ?, ?, ?, ?)",
+	"tabs": "INSERT INTO tabs VALUES (?, ?, ?, ?, ?, ?, ?)",
+	"navigations": "INSERT INTO navigations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+	"tab_events": "INSERT INTO tab_events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+}
+
+# Keys that are stored in their own columns in tab_events
+_TAB_EVENT_KEYS = set(["time", "event", "win", "tabId", "tabIndex", "tab_count", "url"])
+
+def _json_encode(obj):
+	if json.__name__ == "cjson":
+		return json.encode(obj)
+	return json.dumps(obj)
+
+class SQLiteExporter(object):
+	"""Loads compiled events into an SQLite database. See the module
+	docstring for details."""
+
+	def __init__(self, db_filename, batch_size=10000):
+		self._conn = sqlite3.connect(db_filename)
+		self._batch_size = batch_size
+		self._conn.execute("PRAGMA journal_mode=WAL")
+		self._conn.execute("PRAGMA synchronous=NORMAL")
+		self._conn.execute("PRAGMA temp_store=MEMORY")
+		self._conn.executescript(_SCHEMA)
+
+		self._reset()
+
+	def _reset(self):
+		"""Drop any buffered rows, and start assigning ids after the last ones
+		in the database."""
+		# Ids are assigned here rather than by SQLite, so that rows can refer
+		# to each other before they've been inserted
+		self._next_id = {}
+		for table in _INSERT:
+			max_id = self._conn.execute("SELECT MAX(id) FROM %s" % table).fetchone()[0]
+			self._next_id[table] = (max_id or 0) + 1
+		self._rows = dict([(table, []) for table in _INSERT])
+
+	def _new_id(self, table):
+		row_id = self._next_id[table]
+		self._next_id[table] += 1
+		return row_id
+
+	def _insert(self, table, row):
+		rows = self._rows[table]
+		rows.append(row)
+		if len(rows) >= self._batch_size:
+			self._flush(table)
+
+	def _flush(self, table=None):
+		for name in ([table] if table else self._rows.keys()):
+			if len(self._rows[name]) > 0:
+				self._conn.executemany(_INSERT[name], self._rows[name])
+				self._rows[name] = []
+
+	def _user_id(self, user):
+		self._conn.execute("INSERT OR IGNORE INTO users (name) VALUES (?)", (user,))
+		return self._conn.execute(
+			"SELECT id FROM users WHERE name = ?", (user,)).fetchone()[0]
+
+	def has_log(self, user, path):
+		"""Return True if the log at path was already loaded for the user."""
+		return self._conn.execute("SELECT 1 FROM logs, users WHERE logs.user_id = users.id"
+			" AND users.name = ? AND logs.path = ?",
+			(user, os.path.abspath(path))).fetchone() is not None
+
+	def add_log(self, events, user, path=None):
+		"""Load a stream of compiled events (e.g. the result of
+		compile.compile) for the given user name. If path is given, the log
+		is recorded in the logs table (see has_log). Windows and tabs are
+		kept in memory only until they're closed, so memory use is bounded by
+		the number of open tabs rather than the length of the log."""
+
+		user_id = self._user_id(user)
+		session = None
+
+		def end_session(end_time, clean_quit):
+			# Write out any windows and tabs that were never closed
+			session_id, start_time, windows, tabs = session
+			for row in windows.values():
+				self._insert("windows", row)
+			for row in tabs.values():
+				self._insert("tabs", row)
+			self._insert("sessions", (session_id, user_id, start_time, end_time, clean_quit))
+
+		def get_window(event):
+			win = event.get("win")
+			if win is None:
+				return None
+			windows = session[2]
+			if win not in windows:
+				windows[win] = [self._new_id("windows"), session[0], win, None, None, None]
+			return windows[win]
+
+		def get_tab(event):
+			tab = event.get("tabId")
+			if tab is None:
+				return None
+			tabs = session[3]
+			if tab not in tabs:
+				window = get_window(event)
+				window_id = window[0] if window else None
+				tabs[tab] = [self._new_id("tabs"), session[0], window_id, tab, None, None, None]
+			return tabs[tab]
+
+		try:
+			for event in events:
+				name = event["event"]
+				time = event["time"]
+
+				if name == "browser_start" or session is None:
+					if session is not None:
+						end_session(None, False)
+					session = (self._new_id("sessions"), time, {}, {})
+					if name == "browser_start":
+						continue
+
+				if name == "browser_quit":
+					end_session(time, True)
+					session = None
+				elif name == "window_open" and "win" in event:
+					window = get_window(event)
+					window[3], window[5] = time, event.get("cause")
+				elif name == "window_close" and "win" in event:
+					window = get_window(event)
+					window[4] = time
+					self._insert("windows", window)
+					del session[2][event["win"]]
+				elif name == "navigation":
+					tab = get_tab(event)
+					self._insert("navigations", (self._new_id("navigations"),
+						tab[0] if tab else None, time, event.get("url"),
+						event.get("from_url"), event.get("original_url"),
+						event.get("cause"), event.get("location_changed"),
+						event.get("secs_since_cause"), event.get("back_distance"),
+						event.get("forward_distance"), event.get("match_index")))
+				else:
+					tab = get_tab(event)
+					if name == "tab_open" and tab:
+						tab[4], tab[6] = time, event.get("cause")
+					data = dict([(key, value) for key, value in event.iteritems()
+						if key not in _TAB_EVENT_KEYS])
+					self._insert("tab_events", (self._new_id("tab_events"), session[0],
+						tab[0] if tab else None, time, name, event.get("tabIndex"),
+						event.get("tab_count"), event.get("url"),
+						_json_encode(data) if data else None))
+					if name == "tab_close" and tab:
+						tab[5] = time
+						self._insert("tabs", tab)
+						del session[3][event["tabId"]]
+
+			if session is not None:
+				end_session(None, False)
+			self._flush()
+			if path is not None:
+				self._conn.execute("INSERT INTO logs (user_id, path) VALUES (?, ?)",
+					(user_id, os.path.abspath(path)))
+			self._conn.commit()
+		except:
+			# Don't let the rows from this log be written with the next one
+			self._conn.rollback()
+			self._reset()
+			raise
+
+	def create_indexes(self):
+		for statement in _INDEXES:
+			self._conn.execute(statement)
+		self._conn.execute("ANALYZE")
+		self._conn.commit()
+
+	def drop_indexes(self):
+		"""Drop all the indexes; this makes loading a large batch of logs into
+		an existing database much faster. They're recreated by close()."""
+		for statement in _INDEXES:
+			name = statement.split()[5]
+			self._conn.execute("DROP INDEX IF EXISTS %s" % name)
+		self._conn.commit()
+
+	def close(self):
+		"""Build the indexes, and close the database."""
+		self.create_indexes()
+		self._conn.close()
+
+def _user_name(path):
+	"""Guess the user name from the path of a log file. Logs are normally
+	named extstore.dat, so in that case, use the directory name."""
+	path = os.path.abspath(path)
+	name = os.path.basename(path).split(".")[0]
+	if name in ("extstore", "browsinglog"):
+		name = os.path.basename(os.path.dirname(path))
+	return name
+
+def export(db_filename, paths, users=None, debug=False):
+	"""Compile each of the raw log files, and load them into the database.
+	If users is not specified, the user names are guessed from the paths.
+	Logs that were already loaded are skipped. Returns a list of (path,
+	error message) pairs for the logs that failed."""
+	exporter = SQLiteExporter(db_filename)
+	exporter.drop_indexes()
+	compiler = compile.Compiler()
+	failed = []
+	try:
+		for i, path in enumerate(paths):
+			user = users[i] if users else _user_name(path)
+			if exporter.has_log(user, path):
+				sys.stderr.write("Skipping %s, which is already loaded\n" % path)
+				continue
+			try:
+				events = compiler.compile(path, debug)
+				if events is None: # After the debugger, with debug on
+					raise Exception("Compile failed")
+				exporter.add_log(events, user, path)
+			except Exception, ex:
+				error = "%s: %s" % (ex.__class__.__name__, ex)
+				sys.stderr.write("FAILED %s: %s\n" % (path, error))
+				failed.append((path, error))
+	finally:
+		exporter.close()
+	return failed
+
+def main(db_filename, *input_filenames):
+	"""
+	Compile one or more tlogger log files, and load them into an SQLite
+	database. The user name for each log is taken from its file name, or its
+	directory name if the file is named extstore.dat. Logs that are already
+	in the database are skipped.
+	"""
+	if export(db_filename, input_filenames):
+		sys.exit(1)
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
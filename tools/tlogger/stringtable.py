@@ -0,0 +1,353 @@
+#! /user/bin/env python
+
+"""
+Read the string table (strings.dat) written by the tlogger extension.
+
+When URL obfuscation is turned on, the extension replaces each part of a URL
+(host, path, query and anchor) with an id: the base-36 representation of the
+order in which the string was first seen. strings.dat contains one line for
+each string, of the form {"string": ..., "id": ...}.
+
+Since the ids are dense, the table is kept in compact arrays, which give
+constant-time lookups in both directions:
+
+	table = StringTable("/path/to/strings.dat")
+	print table["1a"], table.id_of("www.google.com")
+	print table.deobfuscate_url("http://0/2?3")
+
+Loading a large strings.dat is slow, so the table is cached next to it
+(in strings.dat.cache). Since strings.dat is only ever appended to, only
+the part of the file that's newer than the cache needs to be parsed.
+
+Compiled logs can be de-obfuscated from the command line (only do this with
+the user's consent!):
+
+	python -m tlogger.stringtable strings.dat compiled.txt -o readable.txt
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import array
+import bisect
+import os
+import re
+import struct
+import sys
+
+# Get a JSON library. Prefer cjson if it's installed (it's about 10x faster),
+# but fall back to json (if Python >= 2.6) or simplejson
+try:
+	import cjson as json
+except ImportError:
+	try:
+		import json
+	except ImportError:
+		import simplejson as json
+
+import tlogger
+
+__all__ = ["StringTable", "deobfuscate_events", "split_obfuscated_url"]
+
+# The cache file starts with the magic string, the version, the number of
+# bytes of strings.dat it covers, the number of ids, and the blob length
+_CACHE_MAGIC = "TLST"
+_CACHE_VERSION = 1
+_CACHE_HEADER = struct.Struct("<4sIqqq")
+
+# The URL fields in compiled events that may be obfuscated
+URL_KEYS = ("url", "from_url", "original_url")
+
+# The form of a URL obfuscated by obf_url() in the extension:
+#	proto://<obf(host)>[:port][/[obf(path)]][?obf(query)][#obf(anchor)]
+# Ids are assigned in order, so an id far beyond the ones seen so far can
+# only come from a corrupted line
+_MAX_ID_GAP = 10000
+
+_OBFUSCATED_URL_RE = re.compile(
+	r"^([^:/?#]+)://([0-9a-z]+)(?::(\d+))?(?:/([0-9a-z]*))?(?:\?([0-9a-z]+))?(?:#([0-9a-z]+))?$")
+
+def _json_decode(text):
+	if json.__name__ == "cjson":
+		return json.decode(text)
+	return json.loads(text)
+
+def split_obfuscated_url(url):
+	"""Split a URL obfuscated by the extension into its parts. Return a tuple
+	(protocol, host, port, path, query, anchor), where the host, path, query
+	and anchor are string ids, or None if they're not present. Returns None
+	if the URL isn't an obfuscated URL."""
+	if not url:
+		return None
+	match = _OBFUSCATED_URL_RE.match(url)
+	if match is None:
+		return None
+	protocol, host, port, path, query, anchor = match.groups()
+	return (protocol, host, port, path or None, query, anchor)
+
+class StringTable(object):
+	"""A read-only view of the extension's string table."""
+
+	def __init__(self, filename, use_cache=True):
+		"""filename - the path to strings.dat
+		use_cache - whether to read and update strings.dat.cache"""
+		self._filename = filename
+		self._cache_filename = filename + ".cache"
+		self._blob = ""
+		self._starts = array.array("l")
+		self._lengths = array.array("l")
+		self._parsed_size = 0
+		self._reverse = None
+		self._url_cache = {}
+
+		if use_cache:
+			self._read_cache()
+		old_size = self._parsed_size
+		self._parse(self._parsed_size)
+		if use_cache and self._parsed_size != old_size:
+			self._write_cache()
+
+	def __len__(self):
+		return len(self._starts)
+
+	def _index(self, string_id):
+		if isinstance(string_id, basestring):
+			return int(string_id, 36)
+		return string_id
+
+	def __getitem__(self, string_id):
+		"""Return the string with the given id (a base-36 string or an int)."""
+		i = self._index(string_id)
+		if i < 0 or i >= len(self._starts) or self._lengths[i] < 0:
+			raise KeyError(string_id)
+		start = self._starts[i]
+		return self._blob[start:start + self._lengths[i]].decode("utf-8")
+
+	def get(self, string_id, default=None):
+		try:
+			return self[string_id]
+		except (KeyError, ValueError):
+			return default
+
+	def id_of(self, string):
+		"""Return the (base-36) id of the given string, or None."""
+		if self._reverse is None:
+			self._build_reverse_map()
+		if isinstance(string, unicode):
+			string = string.encode("utf-8")
+		ids = self._reverse.get(hash(string))
+		if ids is None:
+			return None
+		if not isinstance(ids, list):
+			ids = [ids]
+		for i in ids:
+			start = self._starts[i]
+			if self._blob[start:start + self._lengths[i]] == string:
+				return _base36(i)
+		return None
+
+	def search(self, substring):
+		"""Return a list of (string, id) pairs for all the strings containing
+		the given substring. Like the extension, the substring is lowercased."""
+		target = substring.lower()
+		if isinstance(target, unicode):
+			target = target.encode("utf-8")
+		results = []
+		pos = self._blob.find(target)
+		while pos >= 0:
+			# Find the string containing this match
+			i = bisect.bisect_right(self._starts, pos) - 1
+			while self._lengths[i] < 0:
+				i -= 1
+			end = self._starts[i] + self._lengths[i]
+			if pos + len(target) <= end:
+				results.append((self[i], _base36(i)))
+				pos = self._blob.find(target, end)
+			else:
+				pos = self._blob.find(target, pos + 1)
+		return results
+
+	def deobfuscate_url(self, url):
+		"""Return the original form of a URL obfuscated by the extension. URLs
+		that aren't obfuscated are returned unchanged."""
+		try:
+			return self._url_cache[url]
+		except KeyError:
+			pass
+		result = url
+		parts = split_obfuscated_url(url)
+		if parts is not None:
+			protocol, host, port, path, query, anchor = parts
+			try:
+				result = protocol + "://" + self[host]
+				if port:
+					result += ":" + port
+				if path is not None:
+					result += "/" + self[path]
+				elif url[len(protocol) + 3:].find("/") >= 0:
+					result += "/"
+				if query:
+					result += "?" + self[query]
+				if anchor:
+					result += "#" + self[anchor]
+			except (KeyError, ValueError):
+				result = url # Not every id is known, so leave it alone
+		self._url_cache[url] = result
+		return result
+
+	def _build_reverse_map(self):
+		# Map the hash of each string to its id. To save memory, the strings
+		# themselves are not stored again; collisions are resolved in id_of.
+		reverse = {}
+		blob, starts, lengths = self._blob, self._starts, self._lengths
+		for i in xrange(len(starts)):
+			if lengths[i] < 0:
+				continue
+			h = hash(blob[starts[i]:starts[i] + lengths[i]])
+			existing = reverse.get(h)
+			if existing is None:
+				reverse[h] = i
+			elif isinstance(existing, list):
+				existing.append(i)
+			else:
+				reverse[h] = [existing, i]
+		self._reverse = reverse
+
+	def _parse(self, offset):
+		"""Parse strings.dat, starting at the given byte offset."""
+		f = open(self._filename, "rb")
+		try:
+			f.seek(offset)
+			chunks = [self._blob]
+			blob_size = len(self._blob)
+			starts, lengths = self._starts, self._lengths
+			for line in f:
+				if not line.endswith("\n"):
+					break # Partially written; leave it for next time
+				offset += len(line)
+				if len(line.strip()) == 0:
+					continue
+				try:
+					entry = _json_decode(line)
+					i = int(entry["id"], 36)
+					data = entry["string"].encode("utf-8")
+				except Exception:
+					continue # The extension also skips lines it can't parse
+				if i < 0 or i > len(starts) + _MAX_ID_GAP:
+					continue
+				if i >= len(starts):
+					missing = i + 1 - len(starts)
+					starts.extend([blob_size] * missing)
+					lengths.extend([-1] * missing)
+				starts[i] = blob_size
+				lengths[i] = len(data)
+				chunks.append(data)
+				blob_size += len(data)
+			self._blob = "".join(chunks)
+			self._parsed_size = offset
+		finally:
+			f.close()
+
+	def _read_cache(self):
+		try:
+			f = open(self._cache_filename, "rb")
+		except IOError:
+			return
+		try:
+			try:
+				magic, version, parsed_size, count, blob_size = _CACHE_HEADER.unpack(
+					f.read(_CACHE_HEADER.size))
+				# strings.dat is append-only; if it shrank, the cache is stale
+				if (magic != _CACHE_MAGIC or version != _CACHE_VERSION
+				or parsed_size > os.path.getsize(self._filename)):
+					return
+				starts, lengths = array.array("l"), array.array("l")
+				starts.fromfile(f, count)
+				lengths.fromfile(f, count)
+				blob = f.read(blob_size)
+				if len(blob) != blob_size:
+					return
+			except (struct.error, EOFError):
+				return
+			self._starts, self._lengths, self._blob = starts, lengths, blob
+			self._parsed_size = parsed_size
+		finally:
+			f.close()
+
+	def _write_cache(self):
+		temp_filename = self._cache_filename + ".tmp"
+		try:
+			f = open(temp_filename, "wb")
+			try:
+				f.write(_CACHE_HEADER.pack(_CACHE_MAGIC, _CACHE_VERSION,
+					self._parsed_size, len(self._starts), len(self._blob)))
+				self._starts.tofile(f)
+				self._lengths.tofile(f)
+				f.write(self._blob)
+			finally:
+				f.close()
+			if os.path.exists(self._cache_filename):
+				os.remove(self._cache_filename) # rename won't overwrite on Windows
+			os.rename(temp_filename, self._cache_filename)
+		except (IOError, OSError):
+			pass # The cache is just an optimization
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+def _base36(n):
+	if n == 0:
+		return "0"
+	digits = []
+	while n > 0:
+		n, d = divmod(n, 36)
+		digits.append(_DIGITS[d])
+	return "".join(reversed(digits))
+
+def deobfuscate_events(events, table, keys=URL_KEYS):
+	"""Iterate over copies of the compiled events, with the URLs in the given
+	keys de-obfuscated using the StringTable."""
+	for event in events:
+		event = event.copy()
+		for key in keys:
+			if key in event:
+				event[key] = table.deobfuscate_url(event[key])
+		yield event
+
+def main(strings_filename, input_filename, output_filename=None):
+	"""
+	De-obfuscate the URLs in a compiled log file, using the user's strings.dat.
+	Only do this for users who have consented to it!
+	"""
+	import compile
+
+	table = StringTable(strings_filename)
+	if output_filename:
+		output_file = open(output_filename, "w")
+	else:
+		output_file = sys.stdout
+	try:
+		events = tlogger.LogIterator(input_filename)
+		compile.write_to_file(deobfuscate_events(events, table), output_file)
+	finally:
+		if output_file is not sys.stdout:
+			output_file.close()
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
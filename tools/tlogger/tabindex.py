@@ -0,0 +1,248 @@
+#! /user/bin/env python
+
+"""
+An index of the lifetimes of the tabs in a compiled log, for answering
+questions like "which tabs were open at time t?" without replaying the log.
+
+Each tab is open from its tab_open event until its tab_close, the
+window_close of its window, or the end of the session (the browser_quit, or
+if the browser crashed, the last event in the session). The index keeps the
+open and close times in sorted arrays, with an implicit interval tree over
+them, so queries take about log time:
+
+	index = TabIndex(compile.compile(path, False))
+	print index.count_at(t)
+	for tab in index.open_at(t):
+		print tab["tabId"], tab["open"], tab["close"]
+
+To print the number of open tabs for each hour of a log:
+
+	python -m tlogger.tabindex compiled.txt
+	python -m tlogger.tabindex compiled.txt --at=1226282400000
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import bisect
+
+# NumPy is optional; if it's installed, counts_at() is vectorized
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+import tlogger
+
+__all__ = ["TabIndex"]
+
+class TabIndex(object):
+	"""An index of the time intervals during which each tab was open. The
+	intervals are half-open: a tab is open at its open time, but not at its
+	close time.
+
+	Each tab is returned as a dict with "tabId", "win", "session" (the index
+	of the session, counting from 0), "open", "close", and "closed_by" (the
+	event that closed it: tab_close, window_close, browser_quit, or
+	session_end if the session ended without a browser_quit).
+
+	"""
+	def __init__(self, events):
+		"""Build the index from a stream of compiled events."""
+		tabs = []
+		open_tabs = {} # tabId -> (open time, win)
+		session = -1
+		last_time = None
+
+		def close_tabs(time, closed_by, win=None):
+			for tab_id, (open_time, tab_win) in open_tabs.items():
+				if win is None or tab_win == win:
+					tabs.append((open_time, max(open_time, time), tab_id, tab_win,
+						session, closed_by))
+					del open_tabs[tab_id]
+
+		for event in events:
+			name = event["event"]
+			time = event["time"]
+			if name == "browser_start" or session < 0:
+				if last_time is not None:
+					close_tabs(last_time, "session_end")
+				session += 1
+			if name == "tab_open":
+				open_tabs[event["tabId"]] = (time, event.get("win"))
+			elif name == "tab_close":
+				tab = open_tabs.pop(event["tabId"], None)
+				if tab is not None:
+					tabs.append((tab[0], max(tab[0], time), event["tabId"], tab[1],
+						session, "tab_close"))
+			elif name == "window_close":
+				close_tabs(time, "window_close", event.get("win"))
+			elif name == "browser_quit":
+				close_tabs(time, "browser_quit")
+			last_time = time
+		if last_time is not None:
+			close_tabs(last_time, "session_end")
+
+		tabs.sort()
+		self._opens = [tab[0] for tab in tabs]
+		self._closes = [tab[1] for tab in tabs]
+		self._tabs = tabs
+		self._sorted_closes = sorted(self._closes)
+		self._max_close = [0] * len(tabs)
+		self._build_tree(0, len(tabs))
+
+	def _build_tree(self, lo, hi):
+		"""The tree is implicit in the array of tabs, sorted by open time: the
+		root of the range [lo, hi) is at the middle. _max_close holds the
+		latest close time of the tabs in the subtree rooted at each tab."""
+		if lo >= hi:
+			return None
+		mid = (lo + hi) // 2
+		max_close = self._closes[mid]
+		for child in (self._build_tree(lo, mid), self._build_tree(mid + 1, hi)):
+			if child is not None and child > max_close:
+				max_close = child
+		self._max_close[mid] = max_close
+		return max_close
+
+	def __len__(self):
+		return len(self._tabs)
+
+	def _tab(self, i):
+		open_time, close_time, tab_id, win, session, closed_by = self._tabs[i]
+		return {"tabId": tab_id, "win": win, "session": session,
+			"open": open_time, "close": close_time, "closed_by": closed_by}
+
+	def __getitem__(self, i):
+		"""Return the i-th tab, in order of open time."""
+		return self._tab(i)
+
+	def open_during(self, start, end):
+		"""Return the tabs that were open at any time from start to end
+		(inclusive), in order of open time."""
+		found = []
+		opens, closes, max_close = self._opens, self._closes, self._max_close
+		stack = [(0, len(opens))]
+		while len(stack) > 0:
+			lo, hi = stack.pop()
+			if lo >= hi:
+				continue
+			mid = (lo + hi) // 2
+			if max_close[mid] <= start:
+				continue # Every tab in this subtree was closed by the start
+			stack.append((lo, mid))
+			if opens[mid] <= end:
+				if closes[mid] > start:
+					found.append(mid)
+				stack.append((mid + 1, hi))
+		found.sort()
+		return [self._tab(i) for i in found]
+
+	def open_at(self, time):
+		"""Return the tabs that were open at the given time."""
+		return self.open_during(time, time)
+
+	def count_at(self, time):
+		"""Return the number of tabs that were open at the given time."""
+		return (bisect.bisect_right(self._opens, time)
+			- bisect.bisect_right(self._sorted_closes, time))
+
+	def counts_at(self, times):
+		"""Return the number of tabs that were open at each of the given
+		times. If NumPy is installed, this is vectorized, and returns an array."""
+		if numpy is not None:
+			times = numpy.asarray(times)
+			return (numpy.searchsorted(numpy.asarray(self._opens), times, "right")
+				- numpy.searchsorted(numpy.asarray(self._sorted_closes), times, "right"))
+		return [self.count_at(time) for time in times]
+
+	def concurrency_series(self, start, end, step):
+		"""Divide the time from start to end into buckets of the given length
+		(in millis), and return a list of (bucket start, number of open tabs
+		at the start, maximum number open at once during the bucket)."""
+		opens, closes = self._opens, self._sorted_closes
+		i = bisect.bisect_right(opens, start)
+		j = bisect.bisect_right(closes, start)
+		count = i - j
+		series = []
+		bucket = start
+		while bucket < end:
+			bucket_end = min(bucket + step, end)
+			# Apply the changes right at the start of the bucket first, so that
+			# the count at the start is the same as count_at(bucket)
+			while i < len(opens) and opens[i] <= bucket:
+				count += 1
+				i += 1
+			while j < len(closes) and closes[j] <= bucket:
+				count -= 1
+				j += 1
+			at_start = max_count = count
+			# Go through the opens and closes in the bucket in time order. All
+			# the changes at the same time are applied before taking the max.
+			while True:
+				next_open = opens[i] if i < len(opens) else None
+				next_close = closes[j] if j < len(closes) else None
+				times = [t for t in (next_open, next_close) if t is not None]
+				if len(times) == 0 or min(times) >= bucket_end:
+					break
+				t = min(times)
+				while j < len(closes) and closes[j] == t:
+					count -= 1
+					j += 1
+				while i < len(opens) and opens[i] == t:
+					count += 1
+					i += 1
+				max_count = max(max_count, count)
+			series.append((bucket, at_start, max_count))
+			bucket = bucket_end
+		return series
+
+	@property
+	def start_time(self):
+		"""The time the first tab was opened."""
+		return self._opens[0] if len(self._opens) > 0 else None
+
+	@property
+	def end_time(self):
+		"""The time the last tab was closed."""
+		return self._sorted_closes[-1] if len(self._sorted_closes) > 0 else None
+
+def main(input_filename, at=None, step=3600):
+	"""
+	Print the number of open tabs (at the start of each hour, and the most
+	open at once during the hour) in a compiled log file.
+
+	at -- Instead, print the tabs that were open at this time (in millis)
+	step -- The length of each period, in seconds
+	"""
+	index = TabIndex(tlogger.LogIterator(input_filename))
+	if at is not None:
+		for tab in index.open_at(int(at)):
+			print "%(open)d %(close)d %(win)s %(tabId)s %(closed_by)s" % tab
+		return
+	if len(index) == 0:
+		return
+	step_millis = step * 1000
+	start = index.start_time - index.start_time % step_millis
+	for bucket, count, max_count in index.concurrency_series(start, index.end_time, step_millis):
+		print "%d %d %d" % (bucket, count, max_count)
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
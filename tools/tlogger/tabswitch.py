@@ -0,0 +1,246 @@
+#! /user/bin/env python
+
+"""
+Count the transitions between tabs (i.e. the tab_select events) in a
+compiled log, by the positions of the two tabs, the distance between them,
+and their ages.
+
+tab_transitions() goes through the events once, keeping the order of the
+tabs in each window, and returns a TransitionCounts for each session (or
+one for the whole log). The counts are kept in flat arrays, so they're
+small, and the counts from many sessions or users can be added together:
+
+	total = TransitionCounts()
+	for counts in tab_transitions(compile.compile(path, False), per_session=True):
+		total.merge(counts)
+	print total.distance_counts()
+
+To print the transitions in a compiled log:
+
+	python -m tlogger.tabswitch compiled.txt
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import array
+import math
+
+# Get a JSON library. Prefer cjson if it's installed (much faster),
+# but fall back to json (if Python >= 2.6) or simplejson
+try:
+	import cjson as json
+except ImportError:
+	try:
+		import json
+	except ImportError:
+		import simplejson as json
+
+import tlogger
+
+__all__ = ["TransitionCounts", "tab_transitions", "age_bucket"]
+
+# Tab positions from MAX_INDEX on are counted together
+MAX_INDEX = 16
+
+# Tab ages are counted in log2 buckets of seconds: bucket 0 is less than a
+# second, bucket 1 is 1-2 seconds, bucket 2 is 2-4, and so on. The last
+# bucket is everything from about 3 days on.
+AGE_BUCKETS = 20
+
+def age_bucket(millis):
+	"""Return the bucket for a tab of the given age (in millis)."""
+	secs = millis / 1000.0
+	if secs < 1:
+		return 0
+	return min(int(math.log(secs, 2)) + 1, AGE_BUCKETS - 1)
+
+def _zeros(size):
+	return array.array("l", [0]) * size
+
+class TransitionCounts(object):
+	"""The number of transitions between tabs, in square matrices (stored as
+	flat arrays) indexed by the position and by the age bucket of the tab
+	that was switched from and the tab that was switched to."""
+
+	def __init__(self):
+		self.index_matrix = _zeros(MAX_INDEX * MAX_INDEX)
+		self.age_matrix = _zeros(AGE_BUCKETS * AGE_BUCKETS)
+		self.distances = {} # The relative distance (to - from) -> count
+		self.total = 0
+
+	def add(self, from_index, to_index, from_age=None, to_age=None):
+		"""Count a switch from the tab at from_index to the one at to_index.
+		The ages of the tabs, in millis, are optional."""
+		row = min(from_index, MAX_INDEX - 1)
+		col = min(to_index, MAX_INDEX - 1)
+		self.index_matrix[row * MAX_INDEX + col] += 1
+		distance = to_index - from_index
+		self.distances[distance] = self.distances.get(distance, 0) + 1
+		if from_age is not None and to_age is not None:
+			self.age_matrix[age_bucket(from_age) * AGE_BUCKETS + age_bucket(to_age)] += 1
+		self.total += 1
+
+	def merge(self, other):
+		"""Add the counts from another TransitionCounts to this one."""
+		for i in xrange(len(self.index_matrix)):
+			self.index_matrix[i] += other.index_matrix[i]
+		for i in xrange(len(self.age_matrix)):
+			self.age_matrix[i] += other.age_matrix[i]
+		for distance, count in other.distances.iteritems():
+			self.distances[distance] = self.distances.get(distance, 0) + count
+		self.total += other.total
+
+	def index_count(self, from_index, to_index):
+		return self.index_matrix[from_index * MAX_INDEX + to_index]
+
+	def age_count(self, from_bucket, to_bucket):
+		return self.age_matrix[from_bucket * AGE_BUCKETS + to_bucket]
+
+	def distance_counts(self):
+		"""Return a list of (distance, count), in order of distance."""
+		return sorted(self.distances.items())
+
+	def to_dict(self):
+		"""Return the counts as a dict that can be written out as JSON."""
+		return {
+			"total": self.total,
+			"index_matrix": self.index_matrix.tolist(),
+			"age_matrix": self.age_matrix.tolist(),
+			"distances": [[distance, count] for distance, count in self.distance_counts()]
+		}
+
+	@classmethod
+	def from_dict(cls, d):
+		"""Create a TransitionCounts from the output of to_dict()."""
+		counts = cls()
+		counts.total = d["total"]
+		counts.index_matrix = array.array("l", d["index_matrix"])
+		counts.age_matrix = array.array("l", d["age_matrix"])
+		counts.distances = dict([(distance, count) for distance, count in d["distances"]])
+		return counts
+
+def tab_transitions(events, per_session=False):
+	"""Count the transitions between tabs in a stream of compiled events.
+	Selecting the tab that's already selected isn't counted, and neither is
+	the first selection in a window.
+
+	If per_session is true, iterate over a TransitionCounts for each session;
+	otherwise, return one for all the events.
+
+	"""
+	sessions = _session_transitions(events)
+	if per_session:
+		return sessions
+	total = TransitionCounts()
+	for counts in sessions:
+		total.merge(counts)
+	return total
+
+def _session_transitions(events):
+	counts = None
+	windows = {} # win -> the list of tab ids, in order
+	selected = {} # win -> the selected tab id
+	open_times = {} # tabId -> the time it was opened
+
+	for event in events:
+		name = event["event"]
+		if name == "browser_start" or counts is None:
+			if counts is not None:
+				yield counts
+			counts = TransitionCounts()
+			windows.clear()
+			selected.clear()
+			open_times.clear()
+
+		win = event.get("win")
+		tab_id = event.get("tabId")
+		if name == "tab_open":
+			tabs = windows.setdefault(win, [])
+			tabs.insert(event.get("tabIndex", len(tabs)), tab_id)
+			open_times[tab_id] = event["time"]
+			# The first tab in a window is selected without a tab_select
+			if win not in selected:
+				selected[win] = tab_id
+		elif name == "tab_move":
+			tabs = windows.setdefault(win, [])
+			if tab_id in tabs:
+				tabs.remove(tab_id)
+			tabs.insert(event.get("tabIndex", len(tabs)), tab_id)
+		elif name == "tab_close":
+			if tab_id in windows.get(win, ()):
+				windows[win].remove(tab_id)
+			if selected.get(win) == tab_id:
+				del selected[win]
+			open_times.pop(tab_id, None)
+		elif name == "window_close":
+			for tab in windows.pop(win, ()):
+				open_times.pop(tab, None)
+			selected.pop(win, None)
+		elif name == "tab_select":
+			tabs = windows.get(win, [])
+			previous = selected.get(win)
+			selected[win] = tab_id
+			if previous is None or previous == tab_id or previous not in tabs:
+				continue
+			from_index = tabs.index(previous)
+			to_index = tabs.index(tab_id) if tab_id in tabs else event.get("tabIndex")
+			if to_index is None:
+				continue
+			time = event["time"]
+			from_age = to_age = None
+			if previous in open_times and tab_id in open_times:
+				from_age = time - open_times[previous]
+				to_age = time - open_times[tab_id]
+			counts.add(from_index, to_index, from_age, to_age)
+
+	if counts is not None:
+		yield counts
+
+def main(input_filename, per_session=False):
+	"""
+	Print the number of transitions between tabs in a compiled log file, by
+	the distance between the tabs and by their ages.
+
+	per_session -- Print the counts for each session, as JSON
+	"""
+	events = tlogger.LogIterator(input_filename)
+	if per_session:
+		for counts in tab_transitions(events, per_session=True):
+			if json.__name__ == "cjson":
+				print json.encode(counts.to_dict())
+			else:
+				print json.dumps(counts.to_dict())
+		return
+
+	counts = tab_transitions(events)
+	print "%d transitions" % counts.total
+	print "distance count"
+	for distance, n in counts.distance_counts():
+		print "%8d %d" % (distance, n)
+	print "from_age to_age count (age buckets are log2 seconds)"
+	for i in xrange(AGE_BUCKETS):
+		for j in xrange(AGE_BUCKETS):
+			n = counts.age_count(i, j)
+			if n > 0:
+				print "%8d %6d %d" % (i, j, n)
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)
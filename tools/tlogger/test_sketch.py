@@ -0,0 +1,187 @@
+#! /user/bin/env python
+
+"""
+Accuracy tests for tlogger.sketch, on synthetic data with a fixed seed. The
+estimates are checked against the exact results, after adding the values
+to one sketch, after merging several, and after a dumps/loads round trip.
+
+To run the tests:
+
+	python -m tlogger.test_sketch
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import bisect
+import math
+import random
+import unittest
+
+from tlogger.sketch import HyperLogLog, QuantileSketch, dumps, loads, merge_sketches
+
+_SEED = 1234
+
+# The tails are estimated more accurately than the middle, so the allowed
+# rank error (as a fraction of the count) depends on the quantile
+_RANK_ERRORS = [(0.001, 0.0005), (0.01, 0.001), (0.1, 0.002), (0.25, 0.003),
+	(0.5, 0.003), (0.75, 0.003), (0.9, 0.002), (0.99, 0.001), (0.999, 0.0005)]
+
+def _distinct_values(rng, count):
+	"""Return count distinct strings, in a random order."""
+	values = ["http://example.com/%d/%d" % (i, rng.randint(0, 1 << 30)) for i in xrange(count)]
+	rng.shuffle(values)
+	return values
+
+def _check_count(test, sketch, actual):
+	# The standard error is about 1.04 / sqrt(2**p); allow 3 of them
+	limit = 3 * 1.04 / math.sqrt(1 << sketch.p)
+	error = abs(sketch.count() - actual) / float(actual)
+	test.assertTrue(error <= limit, "%d estimated as %d (%.2f%% error)" % (
+		actual, sketch.count(), error * 100))
+
+def _check_quantiles(test, sketch, values):
+	values = sorted(values)
+	test.assertEqual(sketch.count(), len(values))
+	test.assertEqual(sketch.min, values[0])
+	test.assertEqual(sketch.max, values[-1])
+	for q, limit in _RANK_ERRORS:
+		estimate = sketch.quantile(q)
+		# The fraction of the values at or below the estimate
+		rank = bisect.bisect_right(values, estimate) / float(len(values))
+		test.assertTrue(abs(rank - q) <= limit,
+			"q%s estimated as %r, which is at q%.4f" % (q, estimate, rank))
+
+class HyperLogLogTest(unittest.TestCase):
+	def setUp(self):
+		self.rng = random.Random(_SEED)
+
+	def test_large_count(self):
+		sketch = HyperLogLog()
+		for value in _distinct_values(self.rng, 50000):
+			sketch.add(value)
+		_check_count(self, sketch, 50000)
+
+	def test_small_count(self):
+		# Small counts are estimated with linear counting
+		sketch = HyperLogLog()
+		for value in _distinct_values(self.rng, 500):
+			sketch.add(value)
+		_check_count(self, sketch, 500)
+
+	def test_duplicates(self):
+		sketch = HyperLogLog()
+		values = _distinct_values(self.rng, 10000)
+		for i in xrange(5):
+			for value in values:
+				sketch.add(value)
+		_check_count(self, sketch, 10000)
+
+	def test_merge(self):
+		# Three overlapping sets: the merge counts the union
+		values = _distinct_values(self.rng, 40000)
+		sketches = []
+		for start in (0, 10000, 20000):
+			sketch = HyperLogLog()
+			for value in values[start:start + 20000]:
+				sketch.add(value)
+			sketches.append(sketch)
+		total = HyperLogLog()
+		for sketch in sketches:
+			total.merge(sketch)
+		_check_count(self, total, 40000)
+
+	def test_round_trip(self):
+		sketch = HyperLogLog()
+		for value in _distinct_values(self.rng, 20000):
+			sketch.add(value)
+		copy = HyperLogLog.from_string(sketch.to_string())
+		self.assertEqual(copy.count(), sketch.count())
+		_check_count(self, copy, 20000)
+
+	def test_merge_different_sizes(self):
+		self.assertRaises(ValueError, HyperLogLog(10).merge, HyperLogLog(12))
+
+class QuantileSketchTest(unittest.TestCase):
+	def setUp(self):
+		self.rng = random.Random(_SEED)
+
+	def _values(self, count):
+		# Skewed, like dwell times and gaps between events
+		return [self.rng.lognormvariate(3, 1.5) for i in xrange(count)]
+
+	def test_quantiles(self):
+		values = self._values(50000)
+		sketch = QuantileSketch()
+		for value in values:
+			sketch.add(value)
+		_check_quantiles(self, sketch, values)
+
+	def test_sorted_input(self):
+		values = sorted(self._values(20000))
+		sketch = QuantileSketch()
+		for value in values:
+			sketch.add(value)
+		_check_quantiles(self, sketch, values)
+
+	def test_merge(self):
+		# Sketches of parts with different distributions
+		parts = [self._values(10000), [v * 10 for v in self._values(20000)],
+			self._values(5000)]
+		total = QuantileSketch()
+		for part in parts:
+			sketch = QuantileSketch()
+			for value in part:
+				sketch.add(value)
+			total.merge(sketch)
+		_check_quantiles(self, total, sum(parts, []))
+
+	def test_round_trip(self):
+		values = self._values(20000)
+		sketch = QuantileSketch()
+		for value in values:
+			sketch.add(value)
+		copy = QuantileSketch.from_string(sketch.to_string())
+		for q, limit in _RANK_ERRORS:
+			self.assertEqual(copy.quantile(q), sketch.quantile(q))
+		_check_quantiles(self, copy, values)
+
+class BundleTest(unittest.TestCase):
+	def test_dumps_loads_merge(self):
+		# As for sketch_events: a bundle of sketches for each user, written
+		# out, read back, and merged
+		rng = random.Random(_SEED)
+		urls = _distinct_values(rng, 30000)
+		all_gaps = []
+		total = {}
+		for user in xrange(3):
+			sketches = {"urls": HyperLogLog(), "gaps": QuantileSketch()}
+			for url in urls[user * 10000:user * 10000 + 15000]:
+				sketches["urls"].add(url)
+			gaps = [rng.expovariate(0.01) for i in xrange(10000)]
+			for gap in gaps:
+				sketches["gaps"].add(gap)
+			all_gaps.extend(gaps)
+			merge_sketches(total, loads(dumps(sketches)))
+
+		_check_count(self, total["urls"], 30000)
+		_check_quantiles(self, total["gaps"], all_gaps)
+
+if __name__ == "__main__":
+	unittest.main()
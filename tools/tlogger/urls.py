@@ -0,0 +1,199 @@
+#! /user/bin/env python
+
+"""
+Split the URLs in compiled logs into host, path, and query, for site-level
+analysis.
+
+When URL obfuscation is on, the extension obfuscates each part of a URL
+separately (see stringtable.py), so URLs on the same site share the same
+obfuscated host. URLDecomposer maps each distinct URL to a tuple of integer
+ids (host_id, path_id, query_id), which works the same way for obfuscated
+and plain URLs. Each distinct URL is only parsed once, so it's cheap to use
+on every event in a large corpus:
+
+	decomposer = URLDecomposer()
+	host_id, path_id, query_id = decomposer.decompose(event["url"])
+	print decomposer.string(host_id)
+
+To count the navigations to each host:
+
+	python -m tlogger.urls compiled.txt
+	python -m tlogger.urls --count=50 compiled.txt
+
+"""
+# Copyright (c) 2009 Patrick Dubroy (http://dubroy.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+__author__ = "Patrick Dubroy (http://dubroy.com)"
+__license__ = "GNU GPL v2"
+
+import array
+import re
+
+# NumPy is optional; if it's installed, host_counts() is vectorized
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+import tlogger
+
+__all__ = ["URLDecomposer", "host_counts"]
+
+# Roughly the same parts as parseUri() in the extension: protocol, host,
+# port, path, query, and anchor. Any user info before the host is dropped.
+_URL_RE = re.compile(
+	r"^([a-zA-Z][a-zA-Z0-9+.-]*)://(?:[^/?#@]*@)?([^/?#:]*)(?::(\d*))?([^?#]*)(?:\?([^#]*))?(?:#(.*))?$")
+
+# The prefix of a wyciwyg:// URL, e.g. "wyciwyg://0/" in
+# "wyciwyg://0/http://example.com/?q=1"
+_WYCIWYG_RE = re.compile(r"^wyciwyg://[^/]*/")
+
+NO_ID = -1 # Used by decompose_many for values that aren't URLs
+
+class URLDecomposer(object):
+	"""Maps URLs to (host_id, path_id, query_id) tuples. Host, path and query
+	strings share a single set of ids, which can be turned back into strings
+	with string(). The leading slash is not part of the path (as in
+	obf_url), and a missing path or query is the same as an empty one.
+
+	Results are cached for every distinct URL, so memory use grows with the
+	number of distinct URLs, not the number of events.
+
+	"""
+	def __init__(self):
+		self._cache = {}
+		self._ids = {}
+		self._strings = []
+
+	def _intern(self, s):
+		try:
+			return self._ids[s]
+		except KeyError:
+			string_id = self._ids[s] = len(self._strings)
+			self._strings.append(s)
+			return string_id
+
+	def string(self, string_id):
+		"""Return the host, path or query string with the given id."""
+		return self._strings[string_id]
+
+	def id_of(self, s):
+		"""Return the id of the given host, path or query string, or None if
+		it hasn't been seen."""
+		return self._ids.get(s)
+
+	def decompose(self, url):
+		"""Return the (host_id, path_id, query_id) tuple for the URL, or None
+		if it's not a hierarchical URL (e.g. about:blank or javascript:)."""
+		try:
+			return self._cache[url]
+		except KeyError:
+			pass
+		result = None
+		if isinstance(url, basestring):
+			# Like obf_url, use the original URL of wyciwyg:// URLs. The prefix
+			# is removed first, so the query of the original URL is kept.
+			wyciwyg = _WYCIWYG_RE.match(url)
+			if wyciwyg:
+				match = _URL_RE.match(url[wyciwyg.end():])
+			else:
+				match = _URL_RE.match(url)
+			if match:
+				protocol, host, port, path, query, anchor = match.groups()
+				result = (self._intern(host.lower()), self._intern(path[1:]),
+					self._intern(query or ""))
+		self._cache[url] = result
+		return result
+
+	def host(self, url):
+		"""Return the host of the URL, or None."""
+		parts = self.decompose(url)
+		if parts is None:
+			return None
+		return self._strings[parts[0]]
+
+	def decompose_many(self, urls):
+		"""Decompose a sequence of URLs, and return three parallel arrays of
+		host, path and query ids. URLs that can't be decomposed get NO_ID."""
+		hosts = array.array("l")
+		paths = array.array("l")
+		queries = array.array("l")
+		decompose = self.decompose
+		no_ids = (NO_ID, NO_ID, NO_ID)
+		for url in urls:
+			host_id, path_id, query_id = decompose(url) or no_ids
+			hosts.append(host_id)
+			paths.append(path_id)
+			queries.append(query_id)
+		return (hosts, paths, queries)
+
+def host_counts(events, decomposer=None, key="url"):
+	"""Return a dict of the number of navigation events to each host. Events
+	whose URL has no host (e.g. about:blank) are not counted."""
+	if decomposer is None:
+		decomposer = URLDecomposer()
+
+	# Most URLs occur many times, so count the distinct URLs first, then
+	# only decompose each of them once
+	url_counts = {}
+	get = url_counts.get
+	for event in events:
+		if event["event"] == "navigation":
+			url = event.get(key)
+			url_counts[url] = get(url, 0) + 1
+
+	urls = url_counts.keys()
+	host_ids = decomposer.decompose_many(urls)[0]
+	if numpy is not None:
+		host_ids = numpy.frombuffer(host_ids, dtype=numpy.dtype("l"))
+		url_weights = numpy.array(url_counts.values(), dtype=float)
+		has_host = host_ids != NO_ID
+		totals = numpy.bincount(host_ids[has_host], weights=url_weights[has_host])
+		return dict([(decomposer.string(host_id), int(totals[host_id]))
+			for host_id in numpy.flatnonzero(totals)])
+
+	counts = {}
+	for host_id, count in zip(host_ids, url_counts.values()):
+		if host_id != NO_ID:
+			counts[host_id] = counts.get(host_id, 0) + count
+	return dict([(decomposer.string(host_id), count)
+		for host_id, count in counts.iteritems()])
+
+def main(input_filename, count=20, strings_filename=None):
+	"""
+	Print the hosts with the most navigations in a compiled log file.
+
+	count -- The number of hosts to print (0 for all of them)
+	strings_filename -- The user's strings.dat, to show de-obfuscated host names
+	"""
+	counts = host_counts(tlogger.LogIterator(input_filename))
+	hosts = sorted(counts.iteritems(), key=lambda item: (-item[1], item[0]))
+	if count > 0:
+		hosts = hosts[:count]
+
+	table = None
+	if strings_filename:
+		import stringtable
+		table = stringtable.StringTable(strings_filename)
+	for host, n in hosts:
+		if table is not None:
+			host = table.get(host, host)
+		print "%8d %s" % (n, host.encode("utf-8"))
+
+if __name__ == "__main__":
+	import simpleopt
+	simpleopt.parse_args(main)